@@ -3,21 +3,229 @@
 Простая проверка логин/пароль с сессиями
 """
 
+import base64
+import hashlib
+import hmac
+import json
+import math
 import os
-from typing import Optional
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
 import secrets
 from dotenv import load_dotenv
 
+from state_store import StateStore, get_state_store
+from undo_history import get_undo_history
+
 load_dotenv()
 
 # Учетные данные
 VALID_USERNAME = os.getenv("AUTH_USERNAME")
 VALID_PASSWORD = os.getenv("AUTH_PASSWORD")
 
-# Простое хранилище активных сессий (в памяти)
-# В production лучше использовать Redis или БД
-active_sessions = {}
+# Сессии хранятся в общем хранилище состояния (STATE_BACKEND) с TTL -
+# их видят все процессы backend, и они переживают перезапуск
+SESSION_TTL = timedelta(hours=8)  # Сессия на 8 часов
+
+# Формат токена:
+# session - случайный токен, сессия ищется в хранилище при каждом запросе
+# signed - подписанный HMAC токен с именем пользователя и сроком действия,
+#          проверяется без обращения к хранилищу (нужен AUTH_SECRET)
+TOKEN_FORMAT = os.getenv("TOKEN_FORMAT", "session")
+AUTH_SECRET = os.getenv("AUTH_SECRET")
+if TOKEN_FORMAT == "signed" and not AUTH_SECRET:
+    print("[AUTH] WARNING: AUTH_SECRET is not set, using a random secret - "
+          "tokens will not survive restart and will not work across workers")
+    AUTH_SECRET = secrets.token_urlsafe(32)
+
+# Подписанный токен: v1.<payload base64url>.<HMAC-SHA256 base64url>
+SIGNED_TOKEN_VERSION = "v1"
+
+# Подписанные ссылки на файлы писем: действуют FILE_URL_TTL секунд, срок
+# округляется вверх до FILE_URL_BUCKET, чтобы ссылка (и кэш браузера)
+# не менялась при каждом построении состояния
+FILE_URL_TTL = float(os.getenv("FILE_URL_TTL", str(7 * 24 * 3600)))
+FILE_URL_BUCKET = float(os.getenv("FILE_URL_BUCKET", str(24 * 3600)))
+# Ключ секрета ссылок в хранилище состояния (если AUTH_SECRET не задан)
+FILE_URL_SECRET_KEY = "file_url_secret"
+
+def _session_key(token: str) -> str:
+    return f"session:{token}"
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class RevocationSet:
+    """
+    Отозванные подписанные токены (logout)
+
+    - revoke() - отозвать токен до истечения его срока
+    - is_revoked() - проверка по локальной копии, без обращения к хранилищу
+
+    Записи хранятся в общем хранилище (упорядоченная коллекция name),
+    чтобы logout действовал во всех процессах; локальная копия сверяется
+    с версией коллекции не чаще раза в sync_interval секунд.
+    Токены с истёкшим сроком всё равно не пройдут проверку, поэтому их
+    записи удаляются при каждом отзыве - набор остаётся маленьким.
+    """
+
+    def __init__(self, store: StateStore, name: str = "revoked_tokens", sync_interval: float = 1.0):
+        self.store = store
+        self.name = name
+        self.sync_interval = sync_interval
+
+        self._revoked: Dict[str, float] = {}  # jti -> срок действия токена
+        self._version: Optional[int] = None
+        self._next_sync = 0.0
+
+        self.swept = 0
+
+    def _sync(self, force: bool = False):
+        now = time.time()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        version = self.store.ordered_version(self.name)
+        if version == self._version:
+            return
+        self._revoked = {
+            entry["jti"]: entry["exp"] for entry in self.store.ordered_items(self.name)
+        }
+        self._version = version
+
+    def revoke(self, jti: str, expires_at: float):
+        """
+        Отозвать токен
+
+        Args:
+            jti: ID токена
+            expires_at: Срок действия токена (unix time) - после него запись не нужна
+        """
+        now = time.time()
+        for entry in self.store.ordered_items(self.name):
+            if entry["exp"] <= now:
+                if self.store.ordered_remove(self.name, entry["jti"]):
+                    self.swept += 1
+        self.store.ordered_add(self.name, jti, {"jti": jti, "exp": expires_at})
+        self._sync(force=True)
+
+    def is_revoked(self, jti: str) -> bool:
+        """Отозван ли токен"""
+        self._sync()
+        return jti in self._revoked
+
+    def stats(self) -> Dict:
+        """Статистика отзыва токенов"""
+        return {
+            "revoked": len(self._revoked),
+            "swept": self.swept,
+        }
+
+
+# Singleton instance
+_revocations = None
+
+def get_revocations() -> RevocationSet:
+    """Получить единственный экземпляр RevocationSet"""
+    global _revocations
+    if _revocations is None:
+        _revocations = RevocationSet(
+            get_state_store(),
+            sync_interval=float(os.getenv("TOKEN_REVOCATION_SYNC", "1"))
+        )
+    return _revocations
+
+def _sign(body: str) -> str:
+    message = f"{SIGNED_TOKEN_VERSION}.{body}".encode("ascii")
+    return _b64encode(hmac.new(AUTH_SECRET.encode("utf-8"), message, hashlib.sha256).digest())
+
+def create_signed_token(username: str) -> str:
+    """Создать подписанный токен (сессия нигде не хранится)"""
+    payload = {
+        "sub": username,
+        "exp": int(time.time() + SESSION_TTL.total_seconds()),
+        "jti": secrets.token_urlsafe(12)
+    }
+    body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    return f"{SIGNED_TOKEN_VERSION}.{body}.{_sign(body)}"
+
+def decode_signed_token(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Проверить подписанный токен
+
+    Args:
+        token: Токен v1.<payload>.<подпись>
+
+    Returns:
+        Optional[Dict]: Данные токена (sub, exp, jti) или None, если подпись
+            неверна, срок истёк или токен отозван
+    """
+    if not AUTH_SECRET:
+        return None
+    parts = token.split(".")
+    if len(parts) != 3 or parts[0] != SIGNED_TOKEN_VERSION:
+        return None
+    _, body, signature = parts
+    # Сравнение за постоянное время - подпись нельзя подобрать по времени ответа
+    if not hmac.compare_digest(_sign(body), signature):
+        return None
+    try:
+        payload = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    if payload.get("exp", 0) <= time.time():
+        return None
+    if get_revocations().is_revoked(payload.get("jti")):
+        return None
+    return payload
+
+_file_url_secret: Optional[bytes] = None
+
+def _get_file_url_secret() -> bytes:
+    # AUTH_SECRET из настроек или общий для всех процессов случайный секрет
+    # из хранилища состояния - ссылки переживают перезапуск и работают в любом процессе
+    global _file_url_secret
+    if _file_url_secret is None:
+        secret = os.getenv("AUTH_SECRET") or get_state_store().setdefault(
+            FILE_URL_SECRET_KEY, secrets.token_urlsafe(32)
+        )
+        _file_url_secret = secret.encode("utf-8")
+    return _file_url_secret
+
+def _sign_file(incoming_no: int, filename: str, version: str, expires: int) -> str:
+    message = f"{incoming_no}/{filename}\n{version}\n{expires}".encode("utf-8")
+    return _b64encode(hmac.new(_get_file_url_secret(), message, hashlib.sha256).digest())
+
+def sign_file_url(incoming_no: int, filename: str, version: str) -> str:
+    """
+    Параметры подписанной ссылки на файл письма
+
+    Args:
+        incoming_no: Входящий номер письма
+        filename: Имя файла
+        version: Хэш содержимого файла
+
+    Returns:
+        str: Query string v=...&exp=...&sig=...
+    """
+    expires = int(math.ceil((time.time() + FILE_URL_TTL) / FILE_URL_BUCKET) * FILE_URL_BUCKET)
+    return urlencode({
+        "v": version,
+        "exp": expires,
+        "sig": _sign_file(incoming_no, filename, version, expires)
+    })
+
+def verify_file_url(incoming_no: int, filename: str, version: str, expires: int, signature: str) -> bool:
+    """Проверить подписанную ссылку на файл (без обращения к сессиям)"""
+    if expires <= time.time():
+        return False
+    return hmac.compare_digest(_sign_file(incoming_no, filename, version, expires), signature)
 
 def generate_token() -> str:
     """Генерация случайного токена сессии"""
@@ -25,12 +233,17 @@ def generate_token() -> str:
 
 def create_session(username: str) -> str:
     """Создать новую сессию"""
+    if TOKEN_FORMAT == "signed":
+        token = create_signed_token(username)
+        print(f"[AUTH] Signed token issued for {username}")
+        return token
+
     token = generate_token()
-    active_sessions[token] = {
+    get_state_store().set(_session_key(token), {
         "username": username,
-        "created_at": datetime.now(),
-        "expires_at": datetime.now() + timedelta(hours=8)  # Сессия на 8 часов
-    }
+        "created_at": datetime.now().isoformat(),
+        "expires_at": (datetime.now() + SESSION_TTL).isoformat()
+    }, ttl=SESSION_TTL.total_seconds())
     print(f"[AUTH] Session created for {username}: {token[:10]}...")
     return token
 
@@ -42,23 +255,57 @@ def verify_token(token: Optional[str]) -> Optional[str]:
     """Проверка токена сессии. Возвращает username или None"""
     if not token:
         return None
-    
-    session = active_sessions.get(token)
+
+    # Случайные токены сессий не содержат точек - в подписанных их две
+    if "." in token:
+        payload = decode_signed_token(token)
+        return payload["sub"] if payload else None
+
+    # Истёкшие сессии хранилище удаляет само (TTL)
+    session = get_state_store().get(_session_key(token))
     if not session:
         return None
-    
-    # Проверяем срок действия
-    if datetime.now() > session["expires_at"]:
-        # Сессия истекла
-        del active_sessions[token]
-        print(f"[AUTH] Session expired: {token[:10]}...")
-        return None
-    
+
     return session["username"]
 
+def session_id(token: str) -> str:
+    """
+    Идентификатор сессии оператора
+    Под одной учётной записью работают несколько операторов, поэтому аренды
+    карточек и история Undo привязаны к сессии, а не к имени пользователя.
+    Сам токен в хранилище не попадает: для подписанного токена это его jti,
+    для случайного - начало SHA-256 токена.
+
+    Args:
+        token: Проверенный токен (см. verify_token)
+
+    Returns:
+        str: Идентификатор сессии
+    """
+    if "." in token:
+        payload = decode_signed_token(token)
+        if payload:
+            return payload["jti"]
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
 def delete_session(token: str):
-    """Удалить сессию (logout)"""
-    if token in active_sessions:
-        username = active_sessions[token]["username"]
-        del active_sessions[token]
-        print(f"[AUTH] Session deleted for {username}")
\ No newline at end of file
+    """Удалить сессию (logout) вместе с её историей Undo"""
+    if "." in token:
+        payload = decode_signed_token(token)
+        if payload:
+            get_revocations().revoke(payload["jti"], payload["exp"])
+            get_undo_history().clear(payload["jti"])
+            print(f"[AUTH] Signed token revoked for {payload['sub']}")
+        return
+
+    session = get_state_store().pop(_session_key(token))
+    if session:
+        get_undo_history().clear(session_id(token))
+        print(f"[AUTH] Session deleted for {session['username']}")
+
+def stats() -> Dict:
+    """Статистика авторизации"""
+    return {
+        "token_format": TOKEN_FORMAT,
+        "revocations": get_revocations().stats() if AUTH_SECRET else None,
+    }
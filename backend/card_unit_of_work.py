@@ -0,0 +1,161 @@
+"""
+Unit of work для одной карточки
+Загружает карточку из Kaiten один раз за запрос и дальше ведёт её состояние
+в памяти по мере успешных изменений
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from kaiten_client import KaitenClient
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Перечитывать участников после перемещения карточки (шаг 7 назначения)
+VERIFY_MEMBERS = os.getenv("KAITEN_VERIFY_MEMBERS", "1") == "1"
+
+
+class CardUnitOfWork:
+    """
+    Работа с одной карточкой в рамках одного HTTP-запроса
+
+    - load() - загрузить карточку (запрос к Kaiten только при первом вызове)
+    - reconcile_members() - привести участников к нужному составу
+    - move() - переместить карточку
+    - verify_members() - сверить участников со свежими данными
+
+    После успешных изменений карточка в памяти обновляется сама,
+    поэтому повторный get_card не нужен. Если изменение прошло частично,
+    состояние помечается устаревшим и будет перечитано при следующем load().
+    """
+
+    def __init__(self, client: KaitenClient, card_id: int):
+        self.client = client
+        self.card_id = card_id
+        self.card: Optional[Dict] = None
+
+        self._stale = True
+        # Участники получены от Kaiten после последнего изменения карточки
+        self._members_confirmed = False
+
+    async def load(self, force: bool = False) -> Optional[Dict]:
+        """
+        Получить карточку
+
+        Args:
+            force: Перечитать из Kaiten, даже если карточка уже загружена
+
+        Returns:
+            Dict: Данные карточки или None
+        """
+        if force or self._stale:
+            card = await self.client.get_card(self.card_id)
+            if card is not None:
+                self.card = card
+                self._stale = False
+                self._members_confirmed = True
+        return self.card
+
+    @property
+    def members(self) -> List[Dict]:
+        """Текущие участники карточки (по данным в памяти)"""
+        if self.card is None:
+            return []
+        return self.card.get('members', [])
+
+    async def reconcile_members(self, desired: Dict[int, int]) -> bool:
+        """
+        Привести участников к нужному составу (только разница)
+
+        Args:
+            desired: user_id -> type (2 = ответственный, 1 = участник)
+
+        Returns:
+            bool: True если все изменения прошли успешно
+        """
+        if self.card is None:
+            # Текущий состав неизвестен - очищаем карточку полностью
+            if not await self.client.remove_all_members(self.card_id):
+                return False
+            current_members = []
+        else:
+            current_members = self.members
+
+        success = await self.client.reconcile_members(self.card_id, current_members, desired)
+
+        if success and self.card is not None:
+            previous = {member.get('user_id'): member for member in current_members}
+            self.card['members'] = [
+                {**previous.get(user_id, {}), "user_id": user_id, "type": role_type}
+                for user_id, role_type in desired.items()
+            ]
+            self._members_confirmed = False
+        elif not success:
+            self._stale = True
+
+        return success
+
+    async def add_comment(self, text: str) -> bool:
+        """Добавить комментарий к карточке"""
+        return await self.client.add_comment(self.card_id, text)
+
+    async def move(self, column_id: int) -> bool:
+        """
+        Переместить карточку в другую колонку
+
+        Kaiten возвращает обновлённую карточку - если в ответе есть участники,
+        они считаются проверенными и verify_members() не перечитывает карточку.
+
+        Args:
+            column_id: ID целевой колонки
+
+        Returns:
+            bool: True если успешно
+        """
+        updated = await self.client.update_card(self.card_id, {"column_id": column_id})
+        if updated is None:
+            self._stale = True
+            return False
+
+        print(f"[INFO] Card {self.card_id} moved to column {column_id}")
+
+        if self.card is None:
+            # Карточку не загружали (Undo по разнице) - берём её из ответа
+            if updated:
+                self.card = updated
+                self._stale = False
+                self._members_confirmed = 'members' in updated
+            return True
+
+        if 'members' in updated:
+            self.card.update(updated)
+            self._members_confirmed = True
+        else:
+            self.card['column_id'] = column_id
+            self._members_confirmed = False
+        return True
+
+    async def verify_members(self, desired: Dict[int, int]) -> bool:
+        """
+        Сверить участников с нужным составом и исправить расхождения
+        Перечитывает карточку только если участники не подтверждены Kaiten
+
+        Args:
+            desired: user_id -> type
+
+        Returns:
+            bool: True если состав совпадает (или исправлен)
+        """
+        if not VERIFY_MEMBERS:
+            return True
+
+        if not self._members_confirmed:
+            await self.load(force=True)
+        if self.card is None:
+            return False
+
+        print(f"  Total members: {len(self.members)}, expected: {desired}")
+        return await self.reconcile_members(desired)
@@ -0,0 +1,315 @@
+"""
+Сжатие ответов
+gzip/brotli для JSON API и заранее сжатые копии текстовых вложений
+"""
+
+import asyncio
+import gzip
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from disk_cache import DiskLRU
+
+# brotli необязателен: без него используется только gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Ответы меньше порога не сжимаем - выигрыш меньше накладных расходов
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+AVAILABLE_ENCODINGS: List[str] = (["br"] if brotli is not None else []) + ["gzip"]
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+SUFFIXES = {"br": "br", "gzip": "gz"}
+
+# Счётчики сжатия JSON-ответов
+_stats = {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def is_compressible(media_type: str) -> bool:
+    """Имеет ли смысл сжимать содержимое такого типа"""
+    return media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Выбрать кодировку по Accept-Encoding
+
+    Args:
+        accept_encoding: Значение заголовка Accept-Encoding
+
+    Returns:
+        Optional[str]: "br", "gzip" или None (без сжатия)
+    """
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    best = None
+    best_quality = 0.0
+    # При равном q предпочитаем brotli - он сжимает текст сильнее
+    for encoding in AVAILABLE_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """
+    Сжать данные
+
+    Args:
+        data: Исходные данные
+        encoding: "br" или "gzip"
+        level: Уровень сжатия (None - быстрый уровень для ответов на лету)
+
+    Returns:
+        bytes: Сжатые данные
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if level is None else level)
+    return gzip.compress(data, compresslevel=6 if level is None else level)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware: сжатие JSON-ответов API (brotli или gzip)
+
+    Сжимаются только application/json ответы от COMPRESS_MIN_SIZE байт
+    без своего Content-Encoding. Файлы, частичные ответы (Range) и
+    поток состояния (text/event-stream) проходят без изменений.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+        chunks: List[bytes] = []
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    not headers.get("content-type", "").startswith("application/json")
+                    or "content-encoding" in headers
+                    or message["status"] in (204, 206, 304)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            # JSON-ответы небольшие - собираем тело целиком и сжимаем один раз
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            if len(body) >= self.minimum_size:
+                compressed = compress(body, encoding)
+                _stats["responses"] += 1
+                _stats["bytes_in"] += len(body)
+                _stats["bytes_out"] += len(compressed)
+                body = compressed
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class PrecompressedCache:
+    """
+    Сжатые копии текстовых вложений на диске
+
+    - get() - путь к сжатой копии файла (создаётся при первом запросе)
+    - stats() - попадания/промахи, размер кэша
+
+    Имя копии зависит от пути, размера и mtime исходного файла, поэтому
+    изменённый файл сжимается заново, а старая копия со временем
+    вытесняется из кэша. Сжатие идёт в пуле потоков с максимальным
+    уровнем - оно выполняется один раз на версию файла.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, minimum_size: int):
+        self.minimum_size = minimum_size
+
+        self._disk = DiskLRU(cache_dir, max_bytes, "*/*.*")
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._incompressible: Set[str] = set()  # Копии, которые не меньше оригинала
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, source: Path, encoding: str) -> Optional[Path]:
+        """
+        Получить сжатую копию файла
+
+        Args:
+            source: Путь к исходному файлу
+            encoding: "br" или "gzip"
+
+        Returns:
+            Optional[Path]: Путь к копии или None (файл маленький или не сжимается)
+        """
+        try:
+            file_stat = source.stat()
+        except OSError:
+            return None
+        if file_stat.st_size < self.minimum_size:
+            return None
+
+        key = hashlib.sha1(
+            f"{source.resolve()}|{file_stat.st_size}|{file_stat.st_mtime_ns}".encode("utf-8")
+        ).hexdigest()
+        name = f"{key[:2]}/{key}.{SUFFIXES[encoding]}"
+        if name in self._incompressible:
+            return None
+
+        cached = self._disk.lookup(name)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        future = self._inflight.get(name)
+        if future is None:
+            future = asyncio.ensure_future(self._compress(source, encoding, name, file_stat.st_size))
+            self._inflight[name] = future
+        return await asyncio.shield(future)
+
+    async def _compress(self, source: Path, encoding: str, name: str, size: int) -> Optional[Path]:
+        loop = asyncio.get_event_loop()
+        target = self._disk.path(name)
+        try:
+            compressed_size = await loop.run_in_executor(None, self._write_variant, source, encoding, target)
+        except OSError as e:
+            print(f"[COMPRESS] Failed to compress {source}: {e}")
+            return None
+        finally:
+            self._inflight.pop(name, None)
+
+        if compressed_size is None:
+            self._incompressible.add(name)
+            return None
+
+        self._disk.add(name)
+        print(f"[COMPRESS] {source.name}: {size} -> {compressed_size} bytes ({encoding})")
+        return target
+
+    @staticmethod
+    def _write_variant(source: Path, encoding: str, target: Path) -> Optional[int]:
+        data = source.read_bytes()
+        compressed = compress(data, encoding, level=11 if encoding == "br" else 9)
+        if len(compressed) >= len(data):
+            return None
+        target.parent.mkdir(exist_ok=True)
+        tmp_path = target.with_suffix(target.suffix + ".tmp")
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, target)
+        return len(compressed)
+
+    def stats(self) -> Dict:
+        """Статистика кэша сжатых копий"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            **self._disk.stats(),
+        }
+
+
+async def negotiate_precompressed(request, source: Path, media_type: str) -> Optional[Tuple[str, Path]]:
+    """
+    Выбрать сжатую копию вложения для ответа
+
+    Сжатая копия не отдаётся на Range-запросы: диапазоны считаются
+    по исходному файлу.
+
+    Args:
+        request: Запрос
+        source: Путь к файлу
+        media_type: MIME-тип файла
+
+    Returns:
+        Optional[Tuple[str, Path]]: (кодировка, путь к копии) или None
+    """
+    if not is_compressible(media_type) or "range" in request.headers:
+        return None
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return None
+    path = await get_precompressed_cache().get(source, encoding)
+    return (encoding, path) if path is not None else None
+
+
+def compression_stats() -> Dict:
+    """Статистика сжатия"""
+    return {
+        "encodings": AVAILABLE_ENCODINGS,
+        "json_responses": dict(_stats),
+        "precompressed": get_precompressed_cache().stats(),
+    }
+
+
+# Singleton instance
+_precompressed_cache = None
+
+def get_precompressed_cache() -> PrecompressedCache:
+    """Получить единственный экземпляр PrecompressedCache"""
+    global _precompressed_cache
+    if _precompressed_cache is None:
+        _precompressed_cache = PrecompressedCache(
+            Path(os.getenv("PRECOMPRESS_CACHE_DIR", "../precompressed_cache")),
+            max_bytes=int(os.getenv("PRECOMPRESS_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            minimum_size=COMPRESS_MIN_SIZE
+        )
+    return _precompressed_cache
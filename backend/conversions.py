@@ -0,0 +1,173 @@
+"""
+Конвертация Office-документов в PDF
+Локально через LibreOffice (soffice --headless), с дисковым кэшем по хэшу содержимого
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from disk_cache import DiskLRU
+from files_cache import content_hash
+
+# Загружаем переменные окружения
+load_dotenv()
+
+OFFICE_EXTS = {"doc", "docx", "xls", "xlsx", "ppt", "pptx", "odt", "ods", "odp", "rtf"}
+
+
+def find_converter() -> Optional[str]:
+    """Путь к soffice (CONVERTER_BIN или soffice/libreoffice из PATH)"""
+    configured = os.getenv("CONVERTER_BIN")
+    if configured:
+        return shutil.which(configured)
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+class DocumentConverter:
+    """
+    Office-документы в PDF для просмотра в браузере
+
+    - supports() - можно ли сконвертировать файл с таким расширением
+    - get() - путь к готовому PDF (конвертирует при первом запросе)
+    - stats() - попадания/промахи, размер кэша
+
+    Одновременно работает не больше workers процессов soffice, у каждого
+    свой профиль (UserInstallation) - иначе экземпляры LibreOffice мешают
+    друг другу. Результат хранится под sha256 исходного файла, одинаковые
+    вложения конвертируются один раз. Одновременные запросы одного
+    документа ждут одну конвертацию.
+    """
+
+    def __init__(self, binary: Optional[str], cache_dir: Path, max_bytes: int, workers: int, timeout: float):
+        self.binary = binary
+        self.workers = workers
+        self.timeout = timeout
+
+        self._disk = DiskLRU(cache_dir, max_bytes, "*/*.pdf")
+        self._work_dir = cache_dir / ".work"
+        self._slots: Optional[asyncio.Queue] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def supports(self, ext: str) -> bool:
+        """Можно ли сконвертировать файл с таким расширением"""
+        return self.binary is not None and ext in OFFICE_EXTS
+
+    async def get(self, source: Path, ext: str) -> Optional[Path]:
+        """
+        Получить PDF-версию документа
+
+        Args:
+            source: Путь к исходному файлу
+            ext: Расширение файла
+
+        Returns:
+            Optional[Path]: Путь к PDF или None, если сконвертировать не удалось
+        """
+        if not self.supports(ext):
+            return None
+
+        loop = asyncio.get_event_loop()
+        try:
+            digest = await loop.run_in_executor(None, content_hash, source)
+        except OSError as e:
+            print(f"[CONVERT] Failed to hash {source}: {e}")
+            return None
+
+        name = f"{digest[:2]}/{digest}.pdf"
+        cached = self._disk.lookup(name)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        future = self._inflight.get(name)
+        if future is None:
+            future = asyncio.ensure_future(self._convert(source, name))
+            self._inflight[name] = future
+        return await asyncio.shield(future)
+
+    async def _convert(self, source: Path, name: str) -> Optional[Path]:
+        if self._slots is None:
+            # Очередь создаётся внутри работающего event loop
+            self._slots = asyncio.Queue()
+            for slot in range(self.workers):
+                self._slots.put_nowait(slot)
+
+        slot = await self._slots.get()
+        work_dir = None
+        try:
+            profile = (self._work_dir / f"profile-{slot}").resolve()
+            self._work_dir.mkdir(parents=True, exist_ok=True)
+            work_dir = Path(tempfile.mkdtemp(dir=self._work_dir))
+
+            process = await asyncio.create_subprocess_exec(
+                self.binary, "--headless", "--norestore", "--nologo",
+                f"-env:UserInstallation={profile.as_uri()}",
+                "--convert-to", "pdf", "--outdir", str(work_dir), str(source),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise RuntimeError(f"timed out after {self.timeout}s")
+
+            output = work_dir / f"{source.stem}.pdf"
+            if process.returncode != 0 or not output.exists():
+                raise RuntimeError(f"exit code {process.returncode}: {stderr.decode(errors='replace').strip()}")
+
+            target = self._disk.path(name)
+            target.parent.mkdir(exist_ok=True)
+            os.replace(output, target)
+            size = self._disk.add(name)
+        except Exception as e:
+            self.errors += 1
+            print(f"[CONVERT] Failed to convert {source}: {e}")
+            return None
+        finally:
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            self._slots.put_nowait(slot)
+            self._inflight.pop(name, None)
+
+        print(f"[CONVERT] Converted {source.name} to PDF ({size} bytes)")
+        return target
+
+    def stats(self) -> Dict:
+        """Статистика конвертаций"""
+        return {
+            "converter": self.binary,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            **self._disk.stats(),
+        }
+
+
+# Singleton instance
+_converter = None
+
+def get_converter() -> DocumentConverter:
+    """Получить единственный экземпляр DocumentConverter"""
+    global _converter
+    if _converter is None:
+        _converter = DocumentConverter(
+            find_converter(),
+            Path(os.getenv("CONVERT_CACHE_DIR", "../converted_cache")),
+            max_bytes=int(os.getenv("CONVERT_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+            workers=int(os.getenv("CONVERT_WORKERS", "2")),
+            timeout=float(os.getenv("CONVERT_TIMEOUT", "120"))
+        )
+    return _converter
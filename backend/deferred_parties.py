@@ -0,0 +1,153 @@
+"""
+Пропущенные карточки (Skip) с партиями
+Очередь отложенных карточек в порядке пропуска с доступом за O(1)
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from queue_index import QueueIndex
+from state_store import StateStore
+
+# on_change(added_ids, removed_ids) - отложенные карточки изменились
+# (в том числе другим процессом backend)
+ChangeCallback = Callable[[List[int], List[int]], None]
+
+
+class DeferredParties:
+    """
+    Отложенные карточки в порядке пропуска
+
+    - add() - отложить карточку (запись с card_id, incoming_no, party_end)
+    - discard() - убрать карточку (после назначения)
+    - get() - запись отложенной карточки по ID
+    - first() - самая давняя отложенная карточка
+    - party_end - граница текущей партии (party_end первой записи)
+    - candidates() - карточки в порядке выдачи операторам
+
+    Записи хранятся в общем хранилище состояния (упорядоченная коллекция
+    name), а здесь - их локальная копия. Копия перечитывается, только
+    когда меняется версия коллекции, так что чтения остаются O(1), а
+    изменения других процессов подхватываются при следующем обращении.
+    version используется в версии состояния вместо перебора записей.
+    """
+
+    def __init__(self, store: StateStore, name: str = "deferred", on_change: Optional[ChangeCallback] = None):
+        self.store = store
+        self.name = name
+        self.on_change = on_change
+
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._version: Optional[int] = None
+
+    def sync(self):
+        """Перечитать записи, если их изменили (здесь или в другом процессе)"""
+        version = self.store.ordered_version(self.name)
+        if version == self._version:
+            return
+        entries = OrderedDict(
+            (entry["card_id"], entry) for entry in self.store.ordered_items(self.name)
+        )
+        added = [card_id for card_id in entries if card_id not in self._entries]
+        removed = [card_id for card_id in self._entries if card_id not in entries]
+        self._entries = entries
+        self._version = version
+        if self.on_change is not None and (added or removed):
+            self.on_change(added, removed)
+
+    @property
+    def version(self) -> int:
+        """Версия записей (меняется при каждом изменении)"""
+        self.sync()
+        return self._version
+
+    def __len__(self) -> int:
+        self.sync()
+        return len(self._entries)
+
+    def __contains__(self, card_id: int) -> bool:
+        self.sync()
+        return card_id in self._entries
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self.sync()
+        return iter(list(self._entries.values()))
+
+    def add(self, entry: Dict[str, Any]) -> bool:
+        """
+        Отложить карточку
+        Повторный пропуск уже отложенной карточки не меняет её место в очереди
+
+        Args:
+            entry: {"card_id", "incoming_no", "party_end", "deferred_at"} (JSON)
+
+        Returns:
+            bool: True если карточка добавлена
+        """
+        added = self.store.ordered_add(self.name, entry["card_id"], entry)
+        self.sync()
+        return added
+
+    def discard(self, card_id: int) -> bool:
+        """
+        Убрать карточку из отложенных
+
+        Args:
+            card_id: ID карточки
+
+        Returns:
+            bool: True если карточка была отложена
+        """
+        removed = self.store.ordered_remove(self.name, card_id)
+        self.sync()
+        return removed
+
+    def get(self, card_id: int) -> Optional[Dict[str, Any]]:
+        """Запись отложенной карточки или None"""
+        self.sync()
+        return self._entries.get(card_id)
+
+    def first(self) -> Optional[Dict[str, Any]]:
+        """Самая давняя отложенная карточка или None"""
+        self.sync()
+        if not self._entries:
+            return None
+        return next(iter(self._entries.values()))
+
+    @property
+    def party_end(self) -> Optional[int]:
+        """Максимальный incoming_no партии, в которой пропустили первую карточку"""
+        entry = self.first()
+        return entry["party_end"] if entry else None
+
+    def candidates(self, queue_cards: QueueIndex) -> Iterator[Tuple[int, int, Optional[Dict]]]:
+        """
+        Карточки в порядке выдачи операторам
+
+        1. Видимые карточки очереди с incoming_no <= party_end
+           (без пропущенных - все видимые карточки)
+        2. Отложенные карточки в порядке пропуска
+        3. Остальные видимые карточки (новая партия) - если всё предыдущее
+           уже арендовано другими операторами
+
+        Первая карточка - та же, что выбирал прежний линейный проход по
+        очереди. Отложенные карточки должны быть скрыты в индексе.
+
+        Args:
+            queue_cards: Индекс очереди
+
+        Yields:
+            Tuple[int, int, Optional[Dict]]: card_id, incoming_no и карточка из
+                индекса (None для отложенных - их данные загружаются из Kaiten)
+        """
+        party_end = self.party_end
+        # Границы ищутся в индексе, карточки новой партии до шага 3 не
+        # просматриваются: первая карточка - O(log n) при любой длине очереди
+        for card in queue_cards.iter_visible(up_to=party_end):
+            yield card["id"], card["_incoming_no"], card
+        if party_end is None:
+            return
+        for entry in self:
+            yield entry["card_id"], entry["incoming_no"], None
+        for card in queue_cards.iter_visible(after=party_end):
+            yield card["id"], card["_incoming_no"], card
@@ -0,0 +1,97 @@
+"""
+Дисковый LRU-кэш
+Учёт файлов в папке кэша и удаление давно не использованных при превышении размера
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class DiskLRU:
+    """
+    Файлы кэша в порядке последнего использования
+
+    - path() - путь к записи по имени (относительно папки кэша)
+    - lookup() - путь к записи, если она есть (и отметить использование)
+    - add() - учесть новый файл и удалить лишнее
+    - stats() - число файлов и их размер
+
+    Порядок использования хранится в памяти, после перезапуска
+    восстанавливается по mtime файлов. Файлы не трогаются при чтении,
+    поэтому их ETag (по размеру и mtime) не меняется.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, pattern: str):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # имя -> размер, от давних к свежим
+        self._total_bytes = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.cache_dir.glob(pattern):
+            try:
+                file_stat = path.stat()
+            except OSError:
+                continue
+            found.append((file_stat.st_mtime, path.relative_to(self.cache_dir).as_posix(), file_stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def path(self, name: str) -> Path:
+        """Путь к записи (файла может ещё не быть)"""
+        return self.cache_dir / name
+
+    def lookup(self, name: str) -> Optional[Path]:
+        """
+        Найти запись
+
+        Args:
+            name: Имя записи
+
+        Returns:
+            Optional[Path]: Путь к файлу или None
+        """
+        if name not in self._entries:
+            return None
+        path = self.cache_dir / name
+        if not path.exists():
+            # Файл удалили снаружи
+            self._total_bytes -= self._entries.pop(name)
+            return None
+        self._entries.move_to_end(name)
+        return path
+
+    def add(self, name: str) -> int:
+        """
+        Учесть только что записанный файл
+
+        Args:
+            name: Имя записи
+
+        Returns:
+            int: Размер файла
+        """
+        size = (self.cache_dir / name).stat().st_size
+        self._total_bytes += size - self._entries.pop(name, 0)
+        self._entries[name] = size
+
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            evicted, evicted_size = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+            try:
+                (self.cache_dir / evicted).unlink()
+            except OSError:
+                pass
+        return size
+
+    def stats(self) -> Dict:
+        """Размер кэша"""
+        return {
+            "cached_files": len(self._entries),
+            "cached_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
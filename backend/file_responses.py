@@ -0,0 +1,281 @@
+"""
+Отдача файлов писем
+Условные запросы (ETag, Last-Modified -> 304) и диапазоны байт (Range -> 206)
+для /files и /public-files
+"""
+
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+# Больше диапазонов в одном запросе не обрабатываем - отдаём файл целиком
+MAX_RANGES = 32
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """
+    Сильный ETag файла по размеру и времени изменения
+
+    Args:
+        stat_result: Результат os.stat()
+
+    Returns:
+        str: ETag в кавычках
+    """
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def _parse_http_date(value: str) -> Optional[int]:
+    try:
+        return int(parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    Проверить If-None-Match / If-Modified-Since
+
+    Args:
+        request: Запрос
+        etag: ETag файла
+        mtime: Время изменения файла
+
+    Returns:
+        bool: True если у клиента актуальная копия (ответ 304)
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match важнее If-Modified-Since
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+
+    return False
+
+
+def _if_range_matches(request: Request, etag: str, mtime: float) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Для If-Range нужно сильное совпадение
+        return if_range == etag
+    return _parse_http_date(if_range) == int(mtime)
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Разобрать заголовок Range
+
+    Args:
+        value: Значение заголовка, например "bytes=0-99,200-"
+        size: Размер файла
+
+    Returns:
+        Optional[List[Tuple[int, int]]]: Диапазоны (start, end включительно),
+            отсортированные и объединённые; [] если ни один диапазон
+            не попадает в файл (416); None если заголовок не разобран
+            (заголовок игнорируется, файл отдаётся целиком)
+    """
+    unit, _, specs = value.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    parts = specs.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        start_text, dash, end_text = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+                if end_text and start > end:
+                    return None
+            else:
+                # "-N" - последние N байт
+                suffix = int(end_text)
+                if suffix == 0:
+                    continue
+                start = max(0, size - suffix)
+                end = size - 1
+        except ValueError:
+            return None
+
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    # Пересекающиеся и соседние диапазоны объединяем
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+async def _iter_file_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, mode="rb") as file:
+        await file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _iter_multipart(path: Path, parts: List[Tuple[bytes, int, int]], closing: bytes) -> AsyncIterator[bytes]:
+    for part_header, start, end in parts:
+        yield part_header
+        async for chunk in _iter_file_range(path, start, end):
+            yield chunk
+        yield b"\r\n"
+    yield closing
+
+
+def build_file_response(
+    request: Request,
+    file_path: Path,
+    media_type: str,
+    headers: Dict[str, str],
+    cache_control: str,
+    encoded: Optional[Tuple[str, Path]] = None,
+    vary_encoding: bool = False
+) -> Response:
+    """
+    Ответ с файлом с учётом условных запросов и Range
+
+    - If-None-Match / If-Modified-Since совпали - 304 без тела
+    - Range с одним диапазоном - 206 с Content-Range
+    - Range с несколькими диапазонами - 206 multipart/byteranges
+    - Range вне файла - 416
+    - If-Range не совпал с текущей версией - файл целиком (200)
+    - encoded - тело из сжатой копии с Content-Encoding и своим ETag
+      (диапазоны для неё не поддерживаются)
+
+    Args:
+        request: Запрос
+        file_path: Путь к файлу
+        media_type: MIME-тип
+        headers: Дополнительные заголовки (Content-Disposition)
+        cache_control: Значение Cache-Control
+        encoded: (кодировка, путь к сжатой копии) или None
+        vary_encoding: Ответ зависит от Accept-Encoding (сжимаемый тип файла)
+
+    Returns:
+        Response: Ответ
+    """
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"File not found: {file_path.name}")
+
+    size = stat_result.st_size
+    etag = file_etag(stat_result)
+    if encoded is not None:
+        # У каждого представления свой ETag, иначе кэш перепутает сжатое и исходное
+        etag = f'{etag[:-1]}-{encoded[0]}"'
+    validators = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+    if vary_encoding:
+        validators["Vary"] = "Accept-Encoding"
+
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=validators)
+
+    if encoded is not None:
+        encoding, encoded_path = encoded
+        return FileResponse(
+            path=str(encoded_path),
+            media_type=media_type,
+            headers={**headers, **validators, "Content-Encoding": encoding}
+        )
+
+    response_headers = {**headers, **validators, "Accept-Ranges": "bytes"}
+
+    range_header = request.headers.get("range")
+    ranges = None
+    if range_header is not None and _if_range_matches(request, etag, stat_result.st_mtime):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges is None:
+        return FileResponse(
+            path=str(file_path),
+            media_type=media_type,
+            headers=response_headers,
+            stat_result=stat_result
+        )
+
+    if not ranges:
+        return Response(
+            status_code=416,
+            headers={**validators, "Content-Range": f"bytes */{size}"}
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response_headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _iter_file_range(file_path, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers=response_headers
+        )
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    content_length = 0
+    for start, end in ranges:
+        part_header = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((part_header, start, end))
+        content_length += len(part_header) + (end - start + 1) + 2
+    closing = f"--{boundary}--\r\n".encode("latin-1")
+    content_length += len(closing)
+
+    response_headers["Content-Length"] = str(content_length)
+    return StreamingResponse(
+        _iter_multipart(file_path, parts, closing),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=response_headers
+    )
@@ -0,0 +1,269 @@
+"""
+Кэш списков файлов писем
+Содержимое папок FILES_ROOT/<incoming_no> в памяти с проверкой по mtime папки
+и (опционально) сбросом по событиям файловой системы, а также хэши содержимого файлов
+"""
+
+import hashlib
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Наблюдение за папками необязательно: без watchfiles работает проверка по mtime
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Папка, изменённая совсем недавно, может измениться ещё раз в пределах
+# точности mtime (на сетевых дисках - до секунд). Такой список не кэшируем
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+class FilesCache:
+    """
+    LRU-кэш списков файлов по входящему номеру
+
+    - list_files() - файлы папки письма (имя, расширение и хэш содержимого), по имени
+      (блокирующий: читает файлы для хэша, вызывать в пуле потоков)
+    - peek() - то же только из памяти, без обращения к диску
+    - invalidate() - сбросить запись (или весь кэш)
+    - stats() - попадания/промахи и размер
+
+    Без наблюдателя каждый вызов делает один stat() папки и перечитывает её,
+    только если изменился mtime. С наблюдателем (FILES_CACHE_WATCH=1 и пакет
+    watchfiles) запись сбрасывается по событию, и stat() не нужен.
+    """
+
+    def __init__(self, files_root: Path, max_size: int, watch: bool = False):
+        self.files_root = files_root
+        self.max_size = max_size
+
+        self._entries: "OrderedDict[str, Tuple[Optional[int], List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()  # Наблюдатель сбрасывает записи из своего потока
+        self._watching = False
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._invalidations = 0  # Сбросы, пришедшие во время чтения папки
+
+        self.hits = 0
+        self.misses = 0
+
+        if watch:
+            self._start_watcher()
+
+    def _start_watcher(self):
+        if watchfiles is None:
+            print(f"[FILES] watchfiles is not installed, using mtime checks")
+            return
+        if not self.files_root.is_dir():
+            print(f"[FILES] {self.files_root} not found, using mtime checks")
+            return
+        self._watching = True
+        self._watcher = threading.Thread(target=self._watch, name="files-cache-watcher", daemon=True)
+        self._watcher.start()
+        print(f"[FILES] Watching {self.files_root}")
+
+    def _watch(self):
+        root = self.files_root.resolve()
+        try:
+            for changes in watchfiles.watch(root, stop_event=self._stop, debounce=50, step=50):
+                for _, changed_path in changes:
+                    try:
+                        relative = Path(changed_path).relative_to(root)
+                    except ValueError:
+                        continue
+                    if relative.parts:
+                        self.invalidate(relative.parts[0])
+        except Exception as e:
+            print(f"[FILES] Watcher stopped, falling back to mtime checks: {e}")
+        finally:
+            # Без наблюдателя записи снова проверяются по mtime
+            self._watching = False
+
+    def list_files(self, incoming_no: int) -> List[Dict]:
+        """
+        Получить файлы папки письма
+
+        Args:
+            incoming_no: Входящий номер письма
+
+        Returns:
+            List[Dict]: [{"name": str, "ext": str, "hash": str}], отсортировано
+                по имени (пустой список, если папки нет)
+        """
+        key = str(incoming_no)
+        card_folder = self.files_root / key
+
+        if self._watching:
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None and cached[0] is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached[1]
+
+        try:
+            folder_stat = os.stat(card_folder)
+        except OSError:
+            folder_stat = None
+        if folder_stat is None or not stat.S_ISDIR(folder_stat.st_mode):
+            print(f"[WARN] Folder not found: {card_folder}")
+            return []
+
+        mtime = folder_stat.st_mtime_ns
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            invalidations = self._invalidations
+
+        files = self._scan(card_folder)
+
+        with self._lock:
+            # mtime слишком свежий или папку меняли во время чтения -
+            # следующий вызов перечитает её
+            if time.time_ns() - mtime < MTIME_GRANULARITY_NS or invalidations != self._invalidations:
+                mtime = None
+            self._entries[key] = (mtime, files)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return files
+
+    def peek(self, incoming_no: int) -> Optional[List[Dict]]:
+        """
+        Список файлов из кэша без обращения к диску (может быть устаревшим)
+
+        Args:
+            incoming_no: Входящий номер письма
+
+        Returns:
+            List[Dict]: Файлы или None, если папки нет в кэше
+        """
+        with self._lock:
+            cached = self._entries.get(str(incoming_no))
+        return cached[1] if cached is not None else None
+
+    @staticmethod
+    def _scan(card_folder: Path) -> List[Dict]:
+        files = []
+        try:
+            # scandir отдаёт тип записи без отдельного stat() на каждый файл
+            with os.scandir(card_folder) as entries:
+                for entry in entries:
+                    # Игнорируем служебные файлы
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    ext = os.path.splitext(entry.name)[1].lstrip('.').lower()
+                    try:
+                        # Хэш входит в подписанную ссылку на файл (см. auth.sign_file_url)
+                        digest = content_hash(Path(entry.path))
+                    except OSError:
+                        continue  # Файл удалили во время чтения папки
+                    files.append({"name": entry.name, "ext": ext if ext else "unknown", "hash": digest})
+        except OSError as e:
+            print(f"[ERROR] Failed to list files in {card_folder}: {e}")
+            return []
+
+        # Сортируем файлы по имени для стабильности
+        files.sort(key=lambda f: f["name"])
+        print(f"[INFO] Found {len(files)} files in {card_folder}")
+        return files
+
+    def invalidate(self, incoming_no=None):
+        """
+        Сбросить кэш
+
+        Args:
+            incoming_no: Входящий номер (None - сбросить всё)
+        """
+        with self._lock:
+            self._invalidations += 1
+            if incoming_no is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(incoming_no), None)
+
+    def close(self):
+        """Остановить наблюдатель"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=1)
+            self._watcher = None
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_folders": len(self._entries),
+            "max_size": self.max_size,
+            "watching": self._watching,
+        }
+
+
+# Хэши содержимого файлов: (путь, размер, mtime) -> sha256
+_content_hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_content_hashes_lock = threading.Lock()
+CONTENT_HASHES_SIZE = 4096
+
+
+def content_hash(path: Path) -> str:
+    """
+    SHA-256 содержимого файла
+    Файл читается только при изменении размера или mtime.
+    Блокирующая функция - вызывать в пуле потоков.
+
+    Args:
+        path: Путь к файлу
+
+    Returns:
+        str: Хэш в hex
+    """
+    file_stat = os.stat(path)
+    key = (str(path), file_stat.st_size, file_stat.st_mtime_ns)
+    with _content_hashes_lock:
+        cached = _content_hashes.get(key)
+        if cached is not None:
+            _content_hashes.move_to_end(key)
+            return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _content_hashes_lock:
+        _content_hashes[key] = value
+        while len(_content_hashes) > CONTENT_HASHES_SIZE:
+            _content_hashes.popitem(last=False)
+    return value
+
+# Singleton instance
+_files_cache = None
+
+def get_files_cache() -> FilesCache:
+    """Получить единственный экземпляр FilesCache"""
+    global _files_cache
+    if _files_cache is None:
+        _files_cache = FilesCache(
+            Path(os.getenv("FILES_ROOT", "../samples")),
+            max_size=int(os.getenv("FILES_CACHE_SIZE", "1024")),
+            watch=os.getenv("FILES_CACHE_WATCH", "0") == "1"
+        )
+    return _files_cache
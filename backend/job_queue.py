@@ -0,0 +1,512 @@
+"""
+Очередь отложенных изменений в Kaiten
+Задания хранятся в SQLite и выполняются фоновым обработчиком с повторами
+"""
+
+import asyncio
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Статусы заданий
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+DISMISSED = "dismissed"  # Ошибка показана оператору и скрыта им
+
+FINISHED = (DONE, FAILED, CANCELLED, DISMISSED)
+
+# handler(kind, payload, result) - result сохраняется после каждой попытки,
+# даже неудачной (например, снимок для Undo)
+JobHandler = Callable[[str, Dict[str, Any], Dict[str, Any]], Awaitable[None]]
+# on_finished(job) - задание выполнено или окончательно не удалось
+FinishedCallback = Callable[[Dict[str, Any]], None]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    card_id INTEGER,
+    payload TEXT NOT NULL,
+    result TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_by TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    worker TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after);
+CREATE TABLE IF NOT EXISTS jobs_changes (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO jobs_changes (id, value) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS jobs_inserted AFTER INSERT ON jobs
+BEGIN UPDATE jobs_changes SET value = value + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS jobs_updated AFTER UPDATE ON jobs
+BEGIN UPDATE jobs_changes SET value = value + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS jobs_deleted AFTER DELETE ON jobs
+BEGIN UPDATE jobs_changes SET value = value + 1 WHERE id = 1; END;
+"""
+
+# Как часто обработчик проверяет задания, поставленные другими процессами
+POLL_INTERVAL = 2.0
+
+
+def _process_alive(pid: int) -> bool:
+    """Работает ли процесс с таким PID на этой машине"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Процесс есть, но принадлежит другому пользователю
+    return True
+
+
+class JobQueue:
+    """
+    Надёжная очередь заданий (SQLite, один фоновый обработчик)
+
+    - enqueue() - сохранить задание и разбудить обработчик
+    - get()/list() - задания и их статусы
+    - snapshot() - версия и незавершённые задания (при изменении версии)
+    - failures() - задания, завершившиеся ошибкой (для уведомлений в AppState)
+    - cancel() - отменить ещё не начатое задание
+    - wait() - дождаться завершения задания
+    - retry()/dismiss() - повторить или скрыть неудачное задание
+    - start()/close() - запустить и остановить обработчик
+    - stats() - счётчики
+
+    Задание сначала записывается на диск, и только потом запрос получает
+    ответ - после перезапуска незавершённые задания выполняются снова
+    (прерванные на середине тоже: обработчик должен быть идемпотентным).
+    Задания выполняются по одному в порядке постановки; неудачная попытка
+    повторяется с экспоненциальной задержкой до max_attempts раз.
+
+    Базу могут разделять несколько процессов backend: задание забирает
+    тот обработчик, который первым сменил его статус на running (worker
+    <hostname>:<pid> записывается в задание). При запуске обработчик
+    возвращает в pending задания процессов этой машины, которых больше нет
+    (после перезапуска PID другой, поэтому сверяется имя машины и жив ли
+    процесс). Задание, зависшее в running дольше stale_after (например,
+    процесс на другой машине упал), тоже снова становится pending.
+
+    Методы работают с SQLite синхронно (база может ждать блокировку
+    другого процесса), поэтому из async-кода их вызывают в пуле потоков;
+    сам обработчик обращается к базе тоже из пула. Пробуждение обработчика
+    и завершение wait() потокобезопасны.
+    """
+
+    def __init__(self, db_path: Path, max_attempts: int, retry_delay: float, keep_finished: int, stale_after: float = 600.0):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep_finished = keep_finished
+        self.stale_after = stale_after
+        self.hostname = socket.gethostname()
+        self.worker = f"{self.hostname}:{os.getpid()}"
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "worker" not in columns:
+            # База создана до появления колонки worker
+            self._db.execute("ALTER TABLE jobs ADD COLUMN worker TEXT")
+        self._lock = threading.Lock()
+
+        self._handler: Optional[JobHandler] = None
+        self._on_finished: Optional[FinishedCallback] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None  # Создаётся внутри event loop
+        self._task: Optional[asyncio.Task] = None
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+
+        self.processed = 0
+        self.retries = 0
+        self.failed = 0
+        self.restarted = 0
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    @staticmethod
+    async def _call(func: Callable, *args, **kwargs) -> Any:
+        # Обращение к базе из обработчика - в пуле потоков, не в event loop
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    @property
+    def version(self) -> str:
+        """
+        Версия заданий: счётчик изменений в самой базе (его увеличивают
+        триггеры), поэтому он общий для всех процессов backend
+        """
+        return str(self._execute("SELECT value FROM jobs_changes WHERE id = 1").fetchone()[0])
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"])
+        return job
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], card_id: Optional[int] = None, created_by: Optional[str] = None) -> int:
+        """
+        Поставить задание в очередь
+
+        Args:
+            kind: Тип задания (по нему обработчик выбирает действие)
+            payload: Данные задания (JSON)
+            card_id: Карточка, к которой относится задание
+            created_by: Пользователь, поставивший задание
+
+        Returns:
+            int: ID задания
+        """
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO jobs (kind, card_id, payload, status, created_by, created_at, updated_at, run_after) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, card_id, json.dumps(payload), PENDING, created_by, now, now, now)
+        )
+        print(f"[JOBS] Enqueued job {cursor.lastrowid}: {kind} card={card_id}")
+        self._wake()
+        return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Задание по ID (None, если его нет)"""
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Последние задания
+
+        Args:
+            status: Только задания с этим статусом (None - все)
+            limit: Сколько заданий вернуть
+
+        Returns:
+            List[Dict]: Задания от новых к старым
+        """
+        if status is None:
+            rows = self._execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = self._execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def snapshot(self, known_version: Optional[str] = None) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
+        """
+        Версия заданий и незавершённые задания - одним обращением из пула потоков
+
+        Args:
+            known_version: Версия, которая уже известна вызывающему
+
+        Returns:
+            Tuple[str, Optional[List[Dict]]]: Версия и active() (None, если
+                версия совпала с known_version)
+        """
+        version = self.version
+        if version == known_version:
+            return version, None
+        return version, self.active()
+
+    def failures(self) -> List[Dict[str, Any]]:
+        """Неудачные задания, которые оператор ещё не скрыл"""
+        return self.list(FAILED)
+
+    def active(self) -> List[Dict[str, Any]]:
+        """Незавершённые задания в порядке постановки"""
+        rows = self._execute(
+            "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY id", (PENDING, RUNNING)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def has_active(self, card_id: int) -> bool:
+        """Есть ли по карточке незавершённое задание"""
+        row = self._execute(
+            "SELECT 1 FROM jobs WHERE card_id = ? AND status IN (?, ?) LIMIT 1", (card_id, PENDING, RUNNING)
+        ).fetchone()
+        return row is not None
+
+    def _set_status(self, job_id: int, status: str, from_statuses: tuple, **fields) -> bool:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        sql = f"UPDATE jobs SET status = ?, updated_at = ?{', ' + assignments if assignments else ''} WHERE id = ?"
+        params = (status, time.time(), *fields.values(), job_id)
+        if from_statuses:
+            sql += f" AND status IN ({', '.join('?' for _ in from_statuses)})"
+            params += from_statuses
+        changed = self._execute(sql, params).rowcount > 0
+        if changed:
+            if status in FINISHED:
+                # Статус мог смениться в пуле потоков - будим wait() через его event loop
+                for future in self._waiters.pop(job_id, []):
+                    future.get_loop().call_soon_threadsafe(self._resolve, future)
+        return changed
+
+    @staticmethod
+    def _resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Отменить задание, если обработчик его ещё не взял
+
+        Returns:
+            bool: True если задание отменено
+        """
+        cancelled = self._set_status(job_id, CANCELLED, (PENDING,))
+        if cancelled:
+            print(f"[JOBS] Cancelled job {job_id}")
+        return cancelled
+
+    def retry(self, job_id: int) -> bool:
+        """Снова поставить в очередь неудачное задание (попытки считаются заново)"""
+        retried = self._set_status(job_id, PENDING, (FAILED, DISMISSED), attempts=0, run_after=time.time())
+        if retried:
+            print(f"[JOBS] Retrying job {job_id}")
+            self._wake()
+        return retried
+
+    def dismiss(self, job_id: int) -> bool:
+        """Скрыть неудачное задание из уведомлений"""
+        return self._set_status(job_id, DISMISSED, (FAILED,))
+
+    async def wait(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Дождаться завершения задания
+
+        Returns:
+            Optional[Dict]: Завершённое задание (None, если его нет)
+        """
+        job = await self._call(self.get, job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        # Статус мог смениться между чтением и подпиской, а задание
+        # может выполнять другой процесс - тогда узнаём о завершении из базы
+        while job is not None and job["status"] not in FINISHED:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            job = await self._call(self.get, job_id)
+        return job
+
+    def start(self, handler: JobHandler, on_finished: Optional[FinishedCallback] = None) -> bool:
+        """
+        Запустить фоновый обработчик
+
+        Args:
+            handler: Выполняет задание, исключение - неудачная попытка
+            on_finished: Вызывается, когда задание выполнено или не удалось
+
+        Returns:
+            bool: True если обработчик запущен этим вызовом (False - уже работал)
+        """
+        self._handler = handler
+        self._on_finished = on_finished
+        if self._task is not None and not self._task.done():
+            return False
+        self._loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        return True
+
+    def _restart_interrupted(self) -> int:
+        """
+        Вернуть в pending задания, прерванные перезапуском процессов этой машины
+
+        Процесс после перезапуска получает другой PID, поэтому задание
+        считается прерванным, если его worker - на этой машине и процесса
+        с тем PID больше нет (или это сам текущий процесс: в контейнере
+        PID после перезапуска часто тот же). Задания живых процессов и
+        других машин не трогаем - их вернёт _reclaim, когда они зависнут.
+
+        Returns:
+            int: Сколько заданий возвращено
+        """
+        restarted = 0
+        rows = self._execute("SELECT id, worker FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        for row in rows:
+            worker = row["worker"]
+            if worker is not None:
+                hostname, _, pid = worker.rpartition(":")
+                if hostname != self.hostname or not pid.isdigit():
+                    continue
+                if int(pid) != os.getpid() and _process_alive(int(pid)):
+                    continue
+            cursor = self._execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ? AND worker IS ?",
+                (PENDING, time.time(), row["id"], RUNNING, worker)
+            )
+            restarted += cursor.rowcount
+        if restarted:
+            self.restarted += restarted
+            print(f"[JOBS] Restarting {restarted} jobs interrupted by a restart")
+        return restarted
+
+    async def close(self):
+        """Остановить обработчик (незавершённое задание выполнится после перезапуска)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._execute(
+            "UPDATE jobs SET status = ? WHERE status = ? AND worker = ?", (PENDING, RUNNING, self.worker)
+        )
+        with self._lock:
+            self._db.close()
+
+    def _wake(self):
+        # enqueue()/retry() вызываются и из пула потоков
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _reclaim(self):
+        # Задания упавших процессов снова становятся pending
+        cursor = self._execute(
+            "UPDATE jobs SET status = ? WHERE status = ? AND updated_at < ?",
+            (PENDING, RUNNING, time.time() - self.stale_after)
+        )
+        if cursor.rowcount:
+            print(f"[JOBS] Reclaimed {cursor.rowcount} stale running jobs")
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        self._reclaim()
+        row = self._execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY run_after, id LIMIT 1", (PENDING,)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+
+    async def _run(self):
+        await self._call(self._restart_interrupted)
+        print(f"[JOBS] Worker started, pending: {await self._call(self._count, PENDING)}")
+        while True:
+            job = await self._call(self._next_job)
+            delay = POLL_INTERVAL if job is None else min(job["run_after"] - time.time(), POLL_INTERVAL)
+            if job is None or delay > 0:
+                # Спим до следующего повтора или до нового задания
+                # (не дольше POLL_INTERVAL - задания ставят и другие процессы)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if not await self._call(self._set_status, job["id"], RUNNING, (PENDING,), worker=self.worker):
+                continue  # Задание отменили или забрал другой процесс
+            await self._process(job)
+
+    async def _process(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        attempts = job["attempts"] + 1
+        result = job["result"]
+        print(f"[JOBS] Running job {job_id} ({job['kind']}), attempt {attempts}/{self.max_attempts}")
+        try:
+            await self._handler(job["kind"], job["payload"], result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                await self._call(
+                    self._set_status, job_id, FAILED, (RUNNING,),
+                    attempts=attempts, last_error=error, result=json.dumps(result)
+                )
+                print(f"[JOBS] Job {job_id} failed after {attempts} attempts: {error}")
+                await self._finished(job_id)
+            else:
+                self.retries += 1
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                await self._call(
+                    self._set_status, job_id, PENDING, (RUNNING,),
+                    attempts=attempts, last_error=error, result=json.dumps(result), run_after=time.time() + delay
+                )
+                print(f"[JOBS] Job {job_id} attempt {attempts} failed: {error}, retry in {delay:.1f}s")
+            return
+
+        self.processed += 1
+        await self._call(
+            self._set_status, job_id, DONE, (RUNNING,), attempts=attempts, last_error=None, result=json.dumps(result)
+        )
+        print(f"[JOBS] Job {job_id} done")
+        await self._finished(job_id)
+        await self._call(self._prune)
+
+    async def _finished(self, job_id: int):
+        if self._on_finished is None:
+            return
+        try:
+            # Задание читаем в пуле потоков, on_finished вызываем в event loop
+            self._on_finished(await self._call(self.get, job_id))
+        except Exception as e:
+            print(f"[JOBS] on_finished failed for job {job_id}: {e}")
+
+    def _prune(self):
+        # Храним только последние keep_finished завершённых заданий
+        self._execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND id NOT IN "
+            "(SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY id DESC LIMIT ?)",
+            (DONE, CANCELLED, DONE, CANCELLED, self.keep_finished)
+        )
+
+    def _count(self, status: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Статистика очереди"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pending": self._count(PENDING),
+            "failed_unseen": self._count(FAILED),
+            "processed": self.processed,
+            "retries": self.retries,
+            "failed": self.failed,
+            "restarted": self.restarted,
+        }
+
+
+# Singleton instance
+_job_queue = None
+
+def get_job_queue() -> JobQueue:
+    """Получить единственный экземпляр JobQueue"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            Path(os.getenv("JOB_QUEUE_DB", "../jobs.sqlite3")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+            retry_delay=float(os.getenv("JOB_RETRY_DELAY", "2")),
+            keep_finished=int(os.getenv("JOB_KEEP_FINISHED", "1000")),
+            stale_after=float(os.getenv("JOB_STALE_AFTER", "600"))
+        )
+    return _job_queue
@@ -1,29 +1,209 @@
 """
 Kaiten API Client
-Класс для взаимодействия с API Kaiten
+Асинхронный класс для взаимодействия с API Kaiten (httpx.AsyncClient)
 """
 
+import asyncio
+import json
+import random
+import time
 import httpx
-from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
+# h2 необязателен: без него соединения с Kaiten только HTTP/1.1
+try:
+    import h2
+except ImportError:
+    h2 = None
+
 # Загружаем переменные окружения
 load_dotenv()
 
+# Счётчик запросов к Kaiten в рамках одного HTTP-запроса к backend
+# (задаётся middleware через start_call_counter)
+_call_counter: ContextVar[Optional[Dict[str, int]]] = ContextVar("kaiten_call_counter", default=None)
+
+
+# Методы, которые можно безопасно повторить после сбоя: PATCH в Kaiten
+# выставляет абсолютные значения (колонка, роль), повтор даёт тот же результат
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE"}
+
+# Временные ошибки сервера, после которых идемпотентный запрос повторяется
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# Ошибки, при которых запрос точно не дошёл до Kaiten - повторяется любой метод
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def start_call_counter() -> Dict[str, int]:
+    """
+    Начать подсчёт запросов к Kaiten для текущего контекста (HTTP-запроса)
+
+    Returns:
+        Dict[str, int]: Счётчик {"calls": N}, обновляется по мере запросов
+    """
+    counter = {"calls": 0}
+    _call_counter.set(counter)
+    return counter
+
+
+async def iter_json_array(chunks: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """
+    Разобрать JSON-массив по частям: элементы отдаются по мере получения,
+    весь ответ в памяти не собирается
+
+    Args:
+        chunks: Куски текста ответа
+
+    Yields:
+        Any: Элементы массива верхнего уровня
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+
+    async for chunk in chunks:
+        buffer += chunk
+        position = 0
+
+        while True:
+            # Пропускаем пробелы и запятые между элементами
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected JSON array")
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == "]":
+                return
+
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Элемент пришёл не целиком - ждём следующий кусок
+                break
+            yield item
+
+        buffer = buffer[position:]
+
+    # Массив закончился бы на "]" - значит ответ оборван
+    raise ValueError("Unexpected end of JSON array")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Разобрать заголовок Retry-After
+
+    Args:
+        value: Секунды или HTTP-дата
+
+    Returns:
+        Optional[float]: Через сколько секунд можно повторить (None - заголовка нет)
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов (token bucket)
+
+    - acquire() - дождаться разрешения на запрос
+    - pause() - не пускать запросы заданное время (после 429 от Kaiten)
+
+    В ведро поступает rate токенов в секунду, не больше burst. Каждый
+    запрос забирает токен; если токенов нет, запрос ждёт. Реализовано
+    через расписание (GCRA): acquire() без await резервирует время
+    следующего запроса, поэтому блокировки не нужны и ожидающие
+    обслуживаются по порядку.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+
+        self._next_at = 0.0  # Когда ведро снова станет полным на один токен
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов на seconds секунд"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> float:
+        """
+        Получить токен на один запрос
+
+        Returns:
+            float: Сколько секунд пришлось ждать
+        """
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self.rate <= 0:
+                break
+            interval = 1 / self.rate
+            next_at = max(self._next_at, now)
+            delay = next_at - now - (self.burst - 1) * interval
+            self._next_at = next_at + interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Пока ждали, Kaiten мог ответить 429 - тогда ждём и паузу
+            if time.monotonic() >= self._paused_until:
+                break
+        return time.monotonic() - started
+
 
 class KaitenClient:
     """
-    Клиент для работы с API Kaiten
+    Асинхронный клиент для работы с API Kaiten
+    Все методы - корутины, их нужно вызывать через await
     
     Основные методы:
     - get_queue_cards_with_incoming_no() - получить карточки очереди с входящим номером
+    - iter_cards_from_column() - перебрать карточки колонки постранично
     - get_card() - получить одну карточку по ID
+    - update_card() - изменить поля карточки (возвращает обновлённую карточку)
     - move_card() - переместить карточку в другую колонку
     - add_comment() - добавить комментарий к карточке
     - add_card_member() - добавить участника
     - update_member_role() - изменить роль участника (type: 2 = ответственный)
+    - remove_card_member() - удалить одного участника
     - remove_all_members() - удалить всех участников
+    - reconcile_members() - привести участников к нужному составу (только diff)
+    - run_operations() - выполнить независимые операции параллельно (с лимитом)
+    
+    Все запросы проходят через общий ограничитель частоты (KAITEN_RATE_LIMIT
+    запросов в секунду). Идемпотентные запросы повторяются после сетевых
+    ошибок и 5xx с экспоненциальной задержкой и случайным разбросом;
+    на 429 повторяется любой запрос (он не был выполнен), с учётом
+    Retry-After - на это время приостанавливаются все запросы к Kaiten.
     """
     
     def __init__(self):
@@ -34,75 +214,350 @@ class KaitenClient:
         self.column_assign_id = int(os.getenv("KAITEN_COLUMN_ASSIGN_ID"))
         self.property_incoming_no = os.getenv("KAITEN_PROPERTY_INCOMING_NO")
         
-        # Настройка HTTP клиента
-        self.client = httpx.Client(
+        # Сколько независимых запросов по одной карточке выполнять одновременно
+        self.max_concurrency = int(os.getenv("KAITEN_MAX_CONCURRENCY", "5"))
+        
+        # Постраничная загрузка колонок: размер страницы и сколько страниц грузить параллельно
+        self.page_size = int(os.getenv("KAITEN_PAGE_SIZE", "100"))
+        self.page_concurrency = int(os.getenv("KAITEN_PAGE_CONCURRENCY", "4"))
+        
+        # Ограничение частоты запросов и повторы после временных ошибок
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv("KAITEN_RATE_LIMIT", "5")),
+            burst=int(os.getenv("KAITEN_RATE_BURST", "10"))
+        )
+        self.max_retries = int(os.getenv("KAITEN_MAX_RETRIES", "3"))
+        self.retry_base_delay = float(os.getenv("KAITEN_RETRY_BASE_DELAY", "0.5"))
+        self.retry_max_delay = float(os.getenv("KAITEN_RETRY_MAX_DELAY", "10"))
+        
+        # Всего запросов к Kaiten с момента запуска
+        self.calls_total = 0
+        self.retries = 0
+        self.rate_limited = 0  # Ответов 429
+        self.throttled_seconds = 0.0  # Ожидание в ограничителе частоты
+        self.retry_wait_seconds = 0.0  # Паузы перед повторами
+        
+        # Пул соединений: запросы назначений и фоновые синхронизации идут
+        # параллельно, keep-alive соединения переиспользуются между ними
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("KAITEN_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("KAITEN_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("KAITEN_KEEPALIVE_EXPIRY", "30"))
+        )
+        self.timeout = httpx.Timeout(
+            connect=float(os.getenv("KAITEN_CONNECT_TIMEOUT", "5")),
+            read=float(os.getenv("KAITEN_READ_TIMEOUT", "30")),
+            write=float(os.getenv("KAITEN_WRITE_TIMEOUT", "30")),
+            pool=float(os.getenv("KAITEN_POOL_TIMEOUT", "10"))
+        )
+        self.http2 = os.getenv("KAITEN_HTTP2", "0") == "1"
+        if self.http2 and h2 is None:
+            print("[WARN] KAITEN_HTTP2=1, but package h2 is not installed - using HTTP/1.1")
+            self.http2 = False
+        
+        # Пул: новые соединения, ожидание свободного соединения, одновременные запросы
+        self.connections_opened = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.pool_saturated = 0  # Запросы, отправленные при занятых всех соединениях
+        self.pool_timeouts = 0
+        
+        # Настройка HTTP клиента (асинхронный - не блокирует event loop)
+        self.client = httpx.AsyncClient(
             headers={
                 "Accept": "application/json",
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {self.token}"
             },
-            timeout=30.0
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2
         )
     
-    def get_cards_from_column(self, column_id: int) -> List[Dict]:
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
         """
-        Получить карточки из указанной колонки
+        Отправить запрос к Kaiten (единая точка для всех методов)
+        С ограничением частоты и повторами (см. _send)
+        """
+        return await self._send(method, url, stream=False, **kwargs)
+    
+    def _count_call(self):
+        self.calls_total += 1
+        counter = _call_counter.get()
+        if counter is not None:
+            counter["calls"] += 1
+    
+    async def _trace(self, event_name: str, info: Dict):
+        # События httpcore: новое TCP-соединение = keep-alive не помог
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+    
+    def _backoff(self, attempt: int) -> float:
+        # Экспоненциальная задержка со случайным разбросом ("full jitter"):
+        # повторы нескольких операторов не совпадают по времени
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+    
+    async def _send(self, method: str, url: str, stream: bool, **kwargs) -> httpx.Response:
+        """
+        Отправить запрос с ограничением частоты и повторами
+        Считает запросы: общий счётчик и счётчик текущего HTTP-запроса
+        
+        Повторы:
+        - 429 - любой метод, пауза из Retry-After (или экспоненциальная)
+          для всех запросов к Kaiten
+        - 5xx и сетевые ошибки - только идемпотентные методы
+        - ошибки соединения (запрос не отправлен) - любой метод
+        
+        Returns:
+            httpx.Response: Ответ (последний, если повторы не помогли)
+            
+        Raises:
+            httpx.HTTPError: Сетевая ошибка после всех повторов
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.throttled_seconds += await self.rate_limiter.acquire()
+            self._count_call()
+            
+            request = self.client.build_request(method, url, extensions={"trace": self._trace}, **kwargs)
+            if self.in_flight >= self.limits.max_connections:
+                self.pool_saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            held = False  # Потоковый ответ держит соединение до закрытия в _stream
+            try:
+                response = await self.client.send(request, stream=stream)
+                held = stream
+            except httpx.TransportError as e:
+                if isinstance(e, httpx.PoolTimeout):
+                    self.pool_timeouts += 1
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, NOT_SENT_ERRORS)):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"[KAITEN] {method} {url}: {type(e).__name__}, retry in {delay:.2f}s")
+            else:
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    delay = self._backoff(attempt) if retry_after is None else retry_after
+                    # Лимит общий для токена - притормаживаем все запросы
+                    self.rate_limiter.pause(delay)
+                    if attempt >= self.max_retries or delay > self.retry_max_delay:
+                        return response
+                elif response.status_code in RETRY_STATUSES and idempotent:
+                    if attempt >= self.max_retries:
+                        return response
+                    delay = self._backoff(attempt)
+                else:
+                    return response
+                if stream:
+                    await response.aclose()
+                    self.in_flight -= 1
+                print(f"[KAITEN] {method} {url}: HTTP {response.status_code}, retry in {delay:.2f}s")
+            finally:
+                if not held:
+                    self.in_flight -= 1
+            
+            attempt += 1
+            self.retries += 1
+            self.retry_wait_seconds += delay
+            await asyncio.sleep(delay)
+    
+    @asynccontextmanager
+    async def _stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Потоковый запрос к Kaiten: тело ответа читается по частям
+        Повторяется только получение заголовков ответа, не чтение тела
+        """
+        response = await self._send(method, url, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+            self.in_flight -= 1
+    
+    def parse_incoming_no(self, card: Dict) -> Optional[int]:
+        """
+        Входящий номер карточки из properties
         
         Args:
-            column_id: ID колонки
+            card: Данные карточки
             
         Returns:
-            List[Dict]: Список карточек
+            Optional[int]: Номер или None, если его нет или он невалидный
         """
+        incoming_no_value = (card.get("properties") or {}).get(self.property_incoming_no)
+        
+        # Проверяем что значение не пустое и можно преобразовать в число
+        if not incoming_no_value or not str(incoming_no_value).strip():
+            return None
         try:
-            # Правильный endpoint: GET /cards с параметрами
-            url = f"{self.base_url}/cards"
-            params = {
-                "board_id": self.board_id,
-                "column_id": column_id,
-                "condition": 1  # 1 = на доске, 2 = архив
-            }
+            return int(str(incoming_no_value).strip())
+        except (ValueError, TypeError):
+            print(f"[WARN] Card {card.get('id')} has invalid incoming_no: {incoming_no_value}")
+            return None
+    
+    async def _fetch_cards_page(
+        self,
+        filters: Dict,
+        offset: int,
+        transform: Optional[Callable[[Dict], Optional[Dict]]] = None
+    ) -> Tuple[List[Dict], int]:
+        """
+        Получить одну страницу карточек, разбирая JSON по мере получения
+        
+        Args:
+            filters: Параметры фильтрации GET /cards
+            offset: Смещение страницы
+            transform: Обработка каждой карточки сразу после разбора
+                (вернуть None - пропустить карточку)
             
-            response = self.client.get(url, params=params)
+        Returns:
+            Tuple[List[Dict], int]: Карточки после transform и сколько карточек было на странице
+        """
+        # Правильный endpoint: GET /cards с параметрами
+        url = f"{self.base_url}/cards"
+        params = {
+            **filters,
+            "offset": offset,
+            "limit": self.page_size
+        }
+        
+        page = []
+        received = 0
+        async with self._stream("GET", url, params=params) as response:
             response.raise_for_status()
+            async for card in iter_json_array(response.aiter_text()):
+                received += 1
+                if transform is not None:
+                    card = transform(card)
+                if card is not None:
+                    page.append(card)
+        return page, received
+    
+    async def iter_cards(
+        self,
+        filters: Dict,
+        transform: Optional[Callable[[Dict], Optional[Dict]]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Перебрать карточки постранично (offset/limit)
+        
+        Первая страница загружается одна. Если она полная, следующие
+        загружаются окнами по KAITEN_PAGE_CONCURRENCY страниц параллельно,
+        пока не придёт неполная страница. В памяти одновременно не больше
+        одного окна страниц - независимо от длины колонки.
+        
+        Args:
+            filters: Параметры фильтрации GET /cards
+            transform: Обработка каждой карточки сразу после разбора
+            
+        Yields:
+            Dict: Карточки в порядке страниц
+        """
+        page, received = await self._fetch_cards_page(filters, 0, transform)
+        for card in page:
+            yield card
+        if received < self.page_size:
+            return
+        
+        offset = self.page_size
+        while True:
+            offsets = [offset + i * self.page_size for i in range(self.page_concurrency)]
+            pages = await asyncio.gather(*[
+                self._fetch_cards_page(filters, page_offset, transform)
+                for page_offset in offsets
+            ])
+            for page, received in pages:
+                for card in page:
+                    yield card
+                if received < self.page_size:
+                    return
+            offset += self.page_concurrency * self.page_size
+    
+    def iter_cards_from_column(
+        self,
+        column_id: int,
+        transform: Optional[Callable[[Dict], Optional[Dict]]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Перебрать карточки колонки постранично (см. iter_cards)
+        
+        Args:
+            column_id: ID колонки
+            transform: Обработка каждой карточки сразу после разбора
+        """
+        filters = {
+            "board_id": self.board_id,
+            "column_id": column_id,
+            "condition": 1  # 1 = на доске, 2 = архив
+        }
+        return self.iter_cards(filters, transform)
+    
+    async def get_cards_from_column(self, column_id: int) -> List[Dict]:
+        """
+        Получить карточки из указанной колонки
+        
+        Args:
+            column_id: ID колонки
             
-            cards = response.json()
+        Returns:
+            List[Dict]: Список карточек
+        """
+        try:
+            cards = [card async for card in self.iter_cards_from_column(column_id)]
             print(f"[INFO] Got {len(cards)} cards from column {column_id}")
             return cards
-        except httpx.HTTPError as e:
+        except (httpx.HTTPError, ValueError) as e:
             print(f"[ERROR] Failed to get cards from column {column_id}: {e}")
             return []
     
-    def get_queue_cards_with_incoming_no(self) -> List[Dict]:
+    def trim_card(self, card: Dict) -> Dict:
+        """
+        Оставить от карточки только поля, нужные для очереди
+        
+        Returns:
+            Dict: id, title, column_id, updated и _incoming_no (может быть None)
+        """
+        return {
+            "id": card.get("id"),
+            "title": card.get("title"),
+            "column_id": card.get("column_id"),
+            "updated": card.get("updated"),
+            "_incoming_no": self.parse_incoming_no(card),
+        }
+    
+    def _trim_queue_card(self, card: Dict) -> Optional[Dict]:
+        """Урезанная карточка очереди или None, если входящего номера нет"""
+        trimmed = self.trim_card(card)
+        if trimmed["_incoming_no"] is None:
+            return None
+        return trimmed
+    
+    async def get_queue_cards_with_incoming_no(self) -> List[Dict]:
         """
         Получить карточки из колонки "Очередь" с входящим номером
         Фильтрует только карточки, у которых есть properties.id_228499
+        Карточки фильтруются и урезаются сразу по мере разбора страниц
         
         Returns:
             List[Dict]: Отфильтрованные и отсортированные карточки
-        """
-        # Получаем карточки из колонки "Очередь"
-        all_cards = self.get_cards_from_column(self.column_queue_id)
-        
-        # Фильтруем карточки с входящим номером
-        filtered_cards = []
-        
-        for card in all_cards:
-            # Проверяем наличие входящего номера в properties
-            if "properties" in card and self.property_incoming_no in card["properties"]:
-                incoming_no_value = card["properties"][self.property_incoming_no]
+                (поля id, title, column_id, updated, _incoming_no)
                 
-                # Проверяем что значение не пустое и можно преобразовать в число
-                if incoming_no_value and str(incoming_no_value).strip():
-                    try:
-                        incoming_no = int(str(incoming_no_value).strip())
-                        card["_incoming_no"] = incoming_no  # Сохраняем для сортировки
-                        filtered_cards.append(card)
-                        print(f"[DEBUG] Card {card.get('id')} - incoming_no: {incoming_no}, title: {card.get('title')}")
-                    except (ValueError, TypeError):
-                        # Игнорируем карточки с невалидным номером
-                        print(f"[WARN] Card {card.get('id')} has invalid incoming_no: {incoming_no_value}")
-                        continue
+        Raises:
+            httpx.HTTPError, ValueError: если получить очередь не удалось
+                (пустой список означал бы, что очередь действительно пуста)
+        """
+        try:
+            filtered_cards = [
+                card async for card in self.iter_cards_from_column(
+                    self.column_queue_id, transform=self._trim_queue_card
+                )
+            ]
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"[ERROR] Failed to get queue cards: {e}")
+            raise
         
         # Сортируем по входящему номеру (возрастание)
         filtered_cards.sort(key=lambda x: x["_incoming_no"])
@@ -110,7 +565,30 @@ class KaitenClient:
         print(f"[INFO] Found {len(filtered_cards)} cards in queue with incoming_no")
         return filtered_cards
     
-    def get_card(self, card_id: int) -> Optional[Dict]:
+    async def get_changed_cards(self, updated_after: str) -> List[Dict]:
+        """
+        Получить карточки доски, изменённые после указанного момента
+        Без фильтра по колонке - чтобы видеть и карточки, ушедшие из очереди
+        
+        Args:
+            updated_after: Момент в формате Kaiten (поле updated карточки)
+            
+        Returns:
+            List[Dict]: Урезанные карточки (см. trim_card)
+            
+        Raises:
+            httpx.HTTPError, ValueError: если получить изменения не удалось
+        """
+        filters = {
+            "board_id": self.board_id,
+            "condition": 1,
+            "updated_after": updated_after
+        }
+        cards = [card async for card in self.iter_cards(filters, transform=self.trim_card)]
+        print(f"[INFO] Got {len(cards)} cards changed after {updated_after}")
+        return cards
+    
+    async def get_card(self, card_id: int) -> Optional[Dict]:
         """
         Получить полную информацию о карточке по ID
         
@@ -122,38 +600,58 @@ class KaitenClient:
         """
         try:
             url = f"{self.base_url}/cards/{card_id}"
-            response = self.client.get(url)
+            response = await self._request("GET", url)
             response.raise_for_status()
             return response.json()
         except httpx.HTTPError as e:
             print(f"[ERROR] Failed to get card {card_id}: {e}")
             return None
     
-    def move_card(self, card_id: int, column_id: int) -> bool:
+    async def update_card(self, card_id: int, data: Dict) -> Optional[Dict]:
         """
-        Переместить карточку в другую колонку
+        Изменить поля карточки
         
         Args:
             card_id: ID карточки
-            column_id: ID целевой колонки
+            data: Изменяемые поля
             
         Returns:
-            bool: True если успешно
+            Dict: Обновлённая карточка из ответа Kaiten ({} если ответ пустой) или None при ошибке
         """
         try:
             url = f"{self.base_url}/cards/{card_id}"
-            data = {"column_id": column_id}
             
-            response = self.client.patch(url, json=data)
+            response = await self._request("PATCH", url, json=data)
             response.raise_for_status()
             
-            print(f"[INFO] Card {card_id} moved to column {column_id}")
-            return True
+            try:
+                return response.json() or {}
+            except ValueError:
+                return {}
         except httpx.HTTPError as e:
-            print(f"[ERROR] Failed to move card {card_id}: {e}")
+            print(f"[ERROR] Failed to update card {card_id}: {e}")
+            return None
+    
+    async def move_card(self, card_id: int, column_id: int) -> bool:
+        """
+        Переместить карточку в другую колонку
+        
+        Args:
+            card_id: ID карточки
+            column_id: ID целевой колонки
+            
+        Returns:
+            bool: True если успешно
+        """
+        card = await self.update_card(card_id, {"column_id": column_id})
+        if card is None:
+            print(f"[ERROR] Failed to move card {card_id}")
             return False
+        
+        print(f"[INFO] Card {card_id} moved to column {column_id}")
+        return True
     
-    def add_card_member(self, card_id: int, user_id: int) -> bool:
+    async def add_card_member(self, card_id: int, user_id: int) -> bool:
         """
         Добавить участника (member) к карточке
         
@@ -168,7 +666,7 @@ class KaitenClient:
             url = f"{self.base_url}/cards/{card_id}/members"
             data = {"user_id": user_id}
             
-            response = self.client.post(url, json=data)
+            response = await self._request("POST", url, json=data)
             response.raise_for_status()
             
             print(f"[INFO] User {user_id} added as member to card {card_id}")
@@ -177,7 +675,7 @@ class KaitenClient:
             print(f"[ERROR] Failed to add member to card {card_id}: {e}")
             return False
     
-    def update_member_role(self, card_id: int, user_id: int, role_type: int) -> bool:
+    async def update_member_role(self, card_id: int, user_id: int, role_type: int) -> bool:
         """
         Изменить роль участника карточки
         
@@ -193,7 +691,7 @@ class KaitenClient:
             url = f"{self.base_url}/cards/{card_id}/members/{user_id}"
             data = {"type": role_type}
             
-            response = self.client.patch(url, json=data)
+            response = await self._request("PATCH", url, json=data)
             response.raise_for_status()
             
             role_name = "ответственный" if role_type == 2 else "участник"
@@ -203,7 +701,31 @@ class KaitenClient:
             print(f"[ERROR] Failed to update member role on card {card_id}: {e}")
             return False
     
-    def remove_all_members(self, card_id: int) -> bool:
+    async def remove_card_member(self, card_id: int, user_id: int) -> bool:
+        """
+        Удалить одного участника из карточки
+
+        Args:
+            card_id: ID карточки
+            user_id: ID пользователя
+
+        Returns:
+            bool: True если успешно (или участник уже удалён)
+        """
+        try:
+            url = f"{self.base_url}/cards/{card_id}/members/{user_id}"
+            response = await self._request("DELETE", url)
+            # 200 = успешно, 404 = уже удалён
+            if response.status_code not in [200, 404]:
+                response.raise_for_status()
+
+            print(f"[INFO] User {user_id} removed from card {card_id}")
+            return True
+        except httpx.HTTPError as e:
+            print(f"[ERROR] Failed to remove member {user_id} from card {card_id}: {e}")
+            return False
+
+    async def remove_all_members(self, card_id: int) -> bool:
         """
         Удалить всех участников из карточки
         
@@ -215,7 +737,7 @@ class KaitenClient:
         """
         try:
             # Получаем текущих members
-            card = self.get_card(card_id)
+            card = await self.get_card(card_id)
             if not card:
                 return False
             
@@ -226,7 +748,7 @@ class KaitenClient:
                 user_id = member.get('user_id')
                 if user_id:
                     url = f"{self.base_url}/cards/{card_id}/members/{user_id}"
-                    response = self.client.delete(url)
+                    response = await self._request("DELETE", url)
                     # 200 = успешно, 404 = уже удалён
                     if response.status_code not in [200, 404]:
                         response.raise_for_status()
@@ -237,7 +759,130 @@ class KaitenClient:
             print(f"[ERROR] Failed to remove members from card {card_id}: {e}")
             return False
     
-    def add_comment(self, card_id: int, text: str) -> bool:
+    async def reconcile_members(
+        self,
+        card_id: int,
+        current_members: List[Dict],
+        desired: Dict[int, int]
+    ) -> bool:
+        """
+        Привести участников карточки к нужному составу минимальным числом запросов
+
+        Сравнивает текущих members с желаемыми и делает только нужные
+        DELETE / POST / PATCH. Если состав уже совпадает - запросов нет.
+
+        Порядок:
+        1. Удалить лишних и понизить роли (2 -> 1), чтобы не было двух ответственных
+        2. Только после этого добавить недостающих и выставить роли
+           добавленным и повышенным (если перед повышением нечего удалять
+           и понижать - всё выполняется одним параллельным этапом)
+
+        Args:
+            card_id: ID карточки
+            current_members: Текущие members карточки (из get_card)
+            desired: user_id -> type (2 = ответственный, 1 = участник)
+
+        Returns:
+            bool: True если все изменения прошли успешно
+        """
+        current = {
+            member['user_id']: member.get('type', 1)
+            for member in current_members
+            if member.get('user_id')
+        }
+
+        to_remove = [user_id for user_id in current if user_id not in desired]
+        to_add = [user_id for user_id in desired if user_id not in current]
+        to_demote = [
+            user_id for user_id, role_type in desired.items()
+            if user_id in current and current[user_id] != role_type and role_type == 1
+        ]
+        to_promote = [
+            user_id for user_id, role_type in desired.items()
+            if role_type != 1 and (user_id not in current or current[user_id] != role_type)
+        ]
+
+        print(f"[INFO] Reconcile members on card {card_id}: "
+              f"remove={to_remove}, add={to_add}, demote={to_demote}, promote={to_promote}")
+
+        def remove(user_id):
+            return lambda: self.remove_card_member(card_id, user_id)
+
+        def set_role(user_id, role_type):
+            return lambda: self.update_member_role(card_id, user_id, role_type)
+
+        def add(user_id):
+            async def add_with_role():
+                # Роль можно выставить только уже добавленному участнику
+                if not await self.add_card_member(card_id, user_id):
+                    return False
+                if user_id in to_promote:
+                    return await self.update_member_role(card_id, user_id, desired[user_id])
+                return True
+            return add_with_role
+
+        # Удаления и понижения не зависят от остальных операций
+        first_stage = [(f"remove {user_id}", remove(user_id)) for user_id in to_remove]
+        first_stage += [(f"demote {user_id}", set_role(user_id, 1)) for user_id in to_demote]
+
+        # Добавления (вместе с выставлением роли) и повышения существующих
+        second_stage = [(f"add {user_id}", add(user_id)) for user_id in to_add]
+        second_stage += [
+            (f"promote {user_id}", set_role(user_id, desired[user_id]))
+            for user_id in to_promote if user_id in current
+        ]
+
+        # Повышать можно только после понижений и удалений (удаляемый может
+        # быть прежним ответственным) - иначе запускаем всё сразу
+        if to_demote or (to_remove and to_promote):
+            stages = [first_stage, second_stage]
+        else:
+            stages = [first_stage + second_stage]
+
+        success = True
+        for stage in stages:
+            results = await self.run_operations(stage)
+            success = all(result["ok"] for result in results) and success
+
+        return success
+
+    async def run_operations(
+        self,
+        operations: List[Tuple[str, Callable[[], Awaitable[Any]]]],
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Выполнить независимые операции параллельно, не больше limit одновременно
+
+        Операции, порядок которых важен (добавить участника, потом сменить
+        роль), нужно объединять в одну операцию-цепочку.
+
+        Args:
+            operations: Список (имя, функция без аргументов, возвращающая корутину)
+            limit: Максимум одновременных операций (по умолчанию KAITEN_MAX_CONCURRENCY)
+
+        Returns:
+            List[Dict]: Результаты в порядке operations:
+                {"name": str, "ok": bool, "result": Any, "error": Optional[str]}
+                ok = False, если операция вернула False или упала с исключением
+        """
+        if not operations:
+            return []
+
+        semaphore = asyncio.Semaphore(limit or self.max_concurrency)
+
+        async def run_one(name: str, operation: Callable[[], Awaitable[Any]]) -> Dict:
+            async with semaphore:
+                try:
+                    result = await operation()
+                    return {"name": name, "ok": result is not False, "result": result, "error": None}
+                except Exception as e:
+                    print(f"[ERROR] Operation '{name}' failed: {e}")
+                    return {"name": name, "ok": False, "result": None, "error": str(e)}
+
+        return await asyncio.gather(*[run_one(name, operation) for name, operation in operations])
+
+    async def add_comment(self, card_id: int, text: str) -> bool:
         """
         Добавить комментарий к карточке
         
@@ -252,7 +897,7 @@ class KaitenClient:
             url = f"{self.base_url}/cards/{card_id}/comments"
             data = {"text": text}
             
-            response = self.client.post(url, json=data)
+            response = await self._request("POST", url, json=data)
             response.raise_for_status()
             
             print(f"[INFO] Comment added to card {card_id}")
@@ -261,9 +906,48 @@ class KaitenClient:
             print(f"[ERROR] Failed to add comment to card {card_id}: {e}")
             return False
     
-    def close(self):
+    def stats(self) -> Dict:
+        """Статистика запросов к Kaiten"""
+        return {
+            "calls_total": self.calls_total,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "retry_wait_seconds": round(self.retry_wait_seconds, 3),
+            "pool": self.pool_stats(),
+        }
+    
+    def pool_stats(self) -> Dict:
+        """
+        Состояние пула соединений
+        
+        reuse_ratio - доля запросов, ушедших по уже открытому соединению;
+        pool_saturated - сколько запросов застали все соединения занятыми
+        (если растёт - стоит увеличить KAITEN_MAX_CONNECTIONS)
+        """
+        stats = {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "connections_opened": self.connections_opened,
+            "reuse_ratio": round(1 - self.connections_opened / self.calls_total, 3) if self.calls_total else None,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "pool_saturated": self.pool_saturated,
+            "pool_timeouts": self.pool_timeouts,
+        }
+        # Открытые сейчас соединения - из пула httpcore, если он доступен
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        if pool is not None:
+            connections = pool.connections
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for connection in connections if connection.is_idle())
+        return stats
+
+    async def close(self):
         """Закрыть HTTP клиент"""
-        self.client.close()
+        await self.client.aclose()
 
 
 # Singleton instance
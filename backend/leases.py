@@ -0,0 +1,225 @@
+"""
+Аренда карточек операторами
+Карточка, выданная оператору, на время аренды не выдаётся другим операторам.
+Оператор - сессия (auth.session_id): под одной учётной записью работают несколько операторов
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from state_store import StateStore, get_state_store
+
+# Загружаем переменные окружения
+load_dotenv()
+
+
+class CardLeases:
+    """
+    Аренда карточек на ограниченное время
+
+    - active() - действующие аренды {card_id: запись}
+    - lease() - действующая аренда карточки
+    - lease_of() - аренда оператора
+    - acquire() - взять карточку (предыдущая аренда оператора отпускается)
+    - renew() - продлить аренду оператора, пока он смотрит на карточку
+    - refresh() - продлить аренду оператора и снять истёкшие (при опросе)
+    - release() - отпустить карточку (после назначения или пропуска)
+    - version - меняется при каждом изменении аренд (входит в версию состояния)
+    - stats() - счётчики
+
+    Записи {"card_id", "session_id", "username", "expires_at"} хранятся в общем
+    хранилище состояния (упорядоченная коллекция name) и видны всем
+    процессам. Захват истёкшей аренды, продление и освобождение идут через
+    compare-and-swap, поэтому два оператора не получат одну карточку.
+    У оператора не больше одной аренды.
+
+    Изменяющие методы пишут в хранилище (SQLite может ждать блокировку
+    другого процесса), поэтому из async-кода их вызывают в пуле потоков;
+    локальная копия защищена блокировкой.
+    """
+
+    def __init__(self, store: StateStore, ttl: float, name: str = "leases"):
+        self.store = store
+        self.ttl = ttl
+        self.name = name
+
+        self._leases: Dict[int, Dict[str, Any]] = {}
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.conflicts = 0
+        self.expired = 0
+        self.released = 0
+
+    def _sync(self):
+        with self._lock:
+            version = self.store.ordered_version(self.name)
+            if version == self._version:
+                return
+            self._leases = {entry["card_id"]: entry for entry in self.store.ordered_items(self.name)}
+            self._version = version
+
+    @property
+    def version(self) -> int:
+        """Версия аренд"""
+        self._sync()
+        return self._version
+
+    def active(self) -> Dict[int, Dict[str, Any]]:
+        """Действующие аренды (истёкшие не возвращаются)"""
+        self._sync()
+        now = time.time()
+        return {card_id: entry for card_id, entry in self._leases.items() if entry["expires_at"] > now}
+
+    def lease_of(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Действующая аренда оператора или None"""
+        for entry in self.active().values():
+            if entry.get("session_id") == session_id:
+                return entry
+        return None
+
+    def _entry(self, card_id: int, session_id: str, username: str) -> Dict[str, Any]:
+        return {
+            "card_id": card_id,
+            "session_id": session_id,
+            "username": username,
+            "expires_at": time.time() + self.ttl,
+        }
+
+    def acquire(self, card_id: int, session_id: str, username: str) -> bool:
+        """
+        Взять карточку в аренду
+
+        Args:
+            card_id: ID карточки
+            session_id: Сессия оператора
+            username: Учётная запись оператора (для /api/leases и сообщений)
+
+        Returns:
+            bool: True если карточка теперь у оператора (False - у другого)
+        """
+        self.sweep()
+        current = self._leases.get(card_id)
+        if current is not None and current.get("session_id") == session_id and current["expires_at"] > time.time():
+            return True
+        if current is not None and current["expires_at"] > time.time():
+            self.conflicts += 1
+            return False
+
+        # Оператор работает с одной карточкой: предыдущую отпускаем
+        own = self.lease_of(session_id)
+        if own is not None:
+            self.store.ordered_remove(self.name, own["card_id"], expected=own)
+
+        entry = self._entry(card_id, session_id, username)
+        if current is None:
+            taken = self.store.ordered_add(self.name, card_id, entry)
+        else:
+            # Истёкшая аренда другого оператора - заменяем, если её не забрали раньше нас
+            taken = self.store.ordered_replace(self.name, card_id, current, entry)
+            if taken:
+                self.expired += 1
+        self._sync()
+        if taken:
+            self.acquired += 1
+        else:
+            self.conflicts += 1
+        return taken
+
+    def renew(self, session_id: str) -> bool:
+        """
+        Продлить аренду оператора (не чаще, чем раз в половину срока)
+
+        Returns:
+            bool: True если у оператора есть действующая аренда
+        """
+        own = self.lease_of(session_id)
+        if own is None:
+            return False
+        if own["expires_at"] - time.time() > self.ttl / 2:
+            return True
+        renewed = self.store.ordered_replace(
+            self.name, own["card_id"], own, self._entry(own["card_id"], session_id, own["username"])
+        )
+        self._sync()
+        return renewed
+
+    def refresh(self, session_id: Optional[str] = None):
+        """
+        Продлить аренду оператора (если указан) и снять истёкшие аренды
+
+        Args:
+            session_id: Сессия оператора, который сейчас смотрит свою карточку
+        """
+        if session_id:
+            self.renew(session_id)
+        self.sweep()
+
+    def release(self, card_id: int, session_id: Optional[str] = None) -> bool:
+        """
+        Отпустить карточку
+
+        Args:
+            card_id: ID карточки
+            session_id: Отпустить, только если карточка у этого оператора
+                (None - у любого)
+
+        Returns:
+            bool: True если аренда снята
+        """
+        self._sync()
+        current = self._leases.get(card_id)
+        if current is None or (session_id is not None and current.get("session_id") != session_id):
+            return False
+        released = self.store.ordered_remove(self.name, card_id, expected=current)
+        self._sync()
+        if released:
+            self.released += 1
+        return released
+
+    def lease(self, card_id: int) -> Optional[Dict[str, Any]]:
+        """Действующая аренда карточки (None - свободна)"""
+        return self.active().get(card_id)
+
+    def items(self) -> List[Dict[str, Any]]:
+        """Действующие аренды в порядке получения"""
+        return list(self.active().values())
+
+    def sweep(self):
+        """Удалить из хранилища истёкшие аренды"""
+        self._sync()
+        now = time.time()
+        for entry in list(self._leases.values()):
+            if entry["expires_at"] <= now and self.store.ordered_remove(self.name, entry["card_id"], expected=entry):
+                self.expired += 1
+        self._sync()
+
+    def stats(self) -> Dict:
+        """Статистика аренд"""
+        return {
+            "active": len(self.active()),
+            "ttl": self.ttl,
+            "acquired": self.acquired,
+            "conflicts": self.conflicts,
+            "expired": self.expired,
+            "released": self.released,
+        }
+
+
+# Singleton instance
+_leases = None
+
+def get_leases() -> CardLeases:
+    """Получить единственный экземпляр CardLeases"""
+    global _leases
+    if _leases is None:
+        _leases = CardLeases(
+            get_state_store(),
+            ttl=float(os.getenv("CARD_LEASE_TTL", "120"))
+        )
+    return _leases
@@ -4,28 +4,64 @@ FastAPI приложение для распределения входящих
 ЭТАП 5 (финальная версия) + Авторизация
 """
 
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, NamedTuple, Set, Tuple
 from fastapi import FastAPI, HTTPException, Request, Header, Depends
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
 import os
+import asyncio
+import functools
+import hashlib
+import itertools
+import time
 from pathlib import Path
+from urllib.parse import quote
 from dotenv import load_dotenv
 
 
 # Импортируем модули
-from kaiten_client import get_kaiten_client
+from kaiten_client import get_kaiten_client, start_call_counter
+from card_unit_of_work import CardUnitOfWork
+from queue_cache import get_queue_cache
+from queue_index import QueueIndex
+from deferred_parties import DeferredParties
+from files_cache import get_files_cache, content_hash
+from prefetch import get_prefetcher
+from file_responses import build_file_response
+from previews import get_preview_cache
+from conversions import get_converter
+from compression import CompressionMiddleware, compression_stats, is_compressible, negotiate_precompressed
+from state_stream import StateBroadcaster
+from job_queue import get_job_queue, DONE, FAILED
+from state_store import MemoryStateStore, get_state_store
+from undo_history import get_undo_history
+from leases import get_leases
 import auth
 
 # Загружаем переменные окружения
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запуск и остановка фоновых обработчиков"""
+    if ASSIGN_WRITE_BEHIND:
+        await start_job_worker()
+    yield
+    if ASSIGN_WRITE_BEHIND:
+        await get_job_queue().close()
+    get_files_cache().close()
+    get_preview_cache().close()
+    state_store.close()
+    # Последним - фоновые задачи выше ещё могли обращаться к Kaiten
+    await get_kaiten_client().close()
+
 # Инициализация FastAPI
-app = FastAPI(title="Kaiten Inbox API", version="1.0.0")
+app = FastAPI(title="Kaiten Inbox API", version="1.0.0", lifespan=lifespan)
 
 # Обработчик ошибок валидации
 @app.exception_handler(RequestValidationError)
@@ -40,6 +76,19 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors()},
     )
 
+# Подсчёт запросов к Kaiten на каждый HTTP-запрос к backend
+@app.middleware("http")
+async def count_kaiten_calls(request: Request, call_next):
+    counter = start_call_counter()
+    response = await call_next(request)
+    if counter["calls"]:
+        response.headers["X-Kaiten-Calls"] = str(counter["calls"])
+        print(f"[KAITEN] {request.method} {request.url.path}: {counter['calls']} Kaiten calls")
+    return response
+
+# Сжатие JSON-ответов (gzip/brotli)
+app.add_middleware(CompressionMiddleware)
+
 # CORS для работы с React frontend
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 app.add_middleware(
@@ -53,28 +102,100 @@ app.add_middleware(
 # Конфигурация из .env
 FILES_ROOT = Path(os.getenv("FILES_ROOT", "../samples"))
 
-# Счётчик назначенных карточек за сессию
-assigned_session_count = 0
+# Общее хранилище состояния (STATE_BACKEND): счётчики, Undo, отложенные
+# карточки и сессии видны всем процессам backend и переживают перезапуск
+state_store = get_state_store()
 
-# ЭТАП 8: Хранение последнего действия для Undo
-last_action: Optional[Dict[str, Any]] = None
-# Структура: {
-#   "card_id": int,
-#   "prev_column_id": int,
-#   "prev_members": List[Dict],  # Все предыдущие members с их ролями
-#   "timestamp": datetime
+# Счётчик назначенных карточек за сессию (в хранилище)
+ASSIGNED_COUNTER = "assigned_session_count"
+
+# ЭТАП 8: История действий для Undo - стек у каждого оператора (см. UndoHistory)
+# Структура действия: {
+#   "kind": "assign" | "skip",
+#   "items": [{                     # Одна карточка или весь пакет назначений
+#       "card_id": int,
+#       "prev_column_id": int,
+#       "prev_members": List[Dict], # Все предыдущие members с их ролями
+#       # После успешного назначения - что стало (для отката только разницы):
+#       "column_id": int,
+#       "members_after": List[List[int]],  # [[user_id, type], ...]
+#       # False - назначение не удалось и не попало в счётчик назначенных,
+#       # Undo откатывает изменения, но счётчик не уменьшает (по умолчанию True)
+#       "counted": bool
+#   }],
+#   "timestamp": str                # ISO datetime
 # }
+# Пропуск: items = [{"card_id": int, "added": bool}] (added - карточка
+# попала в отложенные этим пропуском)
+
+# Сколько карточек пакетного назначения (и отмены) обрабатывать одновременно
+ASSIGN_BATCH_CONCURRENCY = int(os.getenv("ASSIGN_BATCH_CONCURRENCY", "4"))
 
-# ЭТАП 9: Хранение пропущенных карточек (Skip) с партиями
-deferred: List[Dict[str, Any]] = []
-# Структура элемента: {
+# Отложенная запись: назначение сохраняется в очередь заданий и сразу
+# получает ответ, изменения в Kaiten вносит фоновый обработчик
+ASSIGN_WRITE_BEHIND = os.getenv("ASSIGN_WRITE_BEHIND", "0") == "1"
+# При отложенной записи действие дополнительно содержит
+# "jobs": List[int] - задания, снимки для Undo которых сохранит обработчик
+
+def on_deferred_change(added: List[int], removed: List[int]):
+    """Отложенные карточки изменились (возможно, в другом процессе) - скрыть/показать их в индексе"""
+    index = get_queue_cache().index
+    for card_id in added:
+        index.hide(card_id)
+    for card_id in removed:
+        index.unhide(card_id)
+
+# ЭТАП 9: Хранение пропущенных карточек (Skip) с партиями (в хранилище)
+deferred = DeferredParties(state_store, on_change=on_deferred_change)
+# Структура записи: {
 #   "card_id": int,
 #   "incoming_no": int,
 #   "party_end": int,  # максимальный incoming_no партии на момент Skip
-#   "deferred_at": datetime
+#   "deferred_at": str  # ISO datetime
 # }
 
-deferred_set: set = set()  # Для быстрой проверки, пропущена ли карточка
+def assigned_count() -> int:
+    """Сколько карточек назначено за сессию"""
+    return state_store.counter(ASSIGNED_COUNTER)
+
+def add_assigned(delta: int) -> int:
+    """Изменить счётчик назначенных (атомарно, не меньше нуля)"""
+    return state_store.incr(ASSIGNED_COUNTER, delta, minimum=0)
+
+def record_undo(session_id: str, kind: str, items: List[Dict[str, Any]], jobs: Optional[List[int]] = None):
+    """Запомнить действие для Undo в истории сессии оператора (пустое действие не запоминается)"""
+    if not items and not jobs:
+        return
+    action = {"kind": kind, "items": items, "timestamp": datetime.now().isoformat()}
+    if jobs:
+        action["jobs"] = jobs
+    get_undo_history().push(session_id, action)
+
+def members_delta(item: Dict[str, Any]) -> Optional[List[Tuple[int, int, int]]]:
+    """
+    Изменение участников карточки при назначении
+    
+    Args:
+        item: Запись истории с prev_members и members_after
+        
+    Returns:
+        Optional[List]: [(user_id, type до, type после)] только для изменившихся
+            участников (0 - участника не было / нет), None - назначение не
+            завершилось и итоговый состав неизвестен
+    """
+    if item.get("members_after") is None:
+        return None
+    before = {
+        member['user_id']: member.get('type', 1)
+        for member in item['prev_members']
+        if member.get('user_id')
+    }
+    after = {user_id: role_type for user_id, role_type in item['members_after']}
+    return [
+        (user_id, before.get(user_id, 0), after.get(user_id, 0))
+        for user_id in list(before) + [user_id for user_id in after if user_id not in before]
+        if before.get(user_id, 0) != after.get(user_id, 0)
+    ]
 
 # ============================================================================
 # Модели данных
@@ -83,8 +204,10 @@ deferred_set: set = set()  # Для быстрой проверки, пропу
 class FileInfo(BaseModel):
     """Информация о файле письма"""
     name: str
-    url: str
+    url: str  # Подписанная ссылка, привязанная к содержимому файла (без токена сессии)
     ext: str
+    preview_url: Optional[str] = None  # Уменьшенная картинка (изображения, первая страница PDF), подписанная ссылка
+    converted_url: Optional[str] = None  # PDF-версия Office-документа, подписанная ссылка
 
 class CurrentCard(BaseModel):
     """Текущая карточка для обработки"""
@@ -93,12 +216,48 @@ class CurrentCard(BaseModel):
     incoming_no: int
     files: List[FileInfo]
 
+class PrefetchCard(BaseModel):
+    """Следующее письмо, файлы которого браузер может загрузить заранее"""
+    card_id: int
+    incoming_no: int
+    files: List[FileInfo]
+
+class JobInfo(BaseModel):
+    """Задание отложенной записи в Kaiten"""
+    id: int
+    kind: str
+    card_id: Optional[int]
+    status: str  # pending, running, done, failed, cancelled, dismissed
+    attempts: int
+    last_error: Optional[str]
+    created_by: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+class Operator(NamedTuple):
+    """
+    Оператор: учётная запись и сессия (под одной учётной записью работают
+    несколько операторов). Аренды, история Undo и поток состояния
+    привязаны к сессии
+    """
+    username: str
+    session_id: str
+
+class LeaseInfo(BaseModel):
+    """Аренда карточки оператором"""
+    card_id: int
+    incoming_no: Optional[int]  # None - карточки уже нет в снимке очереди
+    username: str
+    expires_at: datetime
+
 class AppState(BaseModel):
     """Состояние приложения"""
     queue_count: int
     deferred_count: int
     assigned_session_count: int
     current_card: Optional[CurrentCard]
+    prefetch: List[PrefetchCard] = []
+    failed_jobs: List[JobInfo] = []  # Назначения, которые не удалось записать в Kaiten
 
 class AssignRequest(BaseModel):
     """Запрос на назначение исполнителя"""
@@ -108,6 +267,22 @@ class AssignRequest(BaseModel):
     comment_text: str = ""
     multi: bool = False
 
+class BatchAssignRequest(BaseModel):
+    """Запрос на назначение исполнителей на несколько карточек"""
+    items: List[AssignRequest]
+
+class AssignResult(BaseModel):
+    """Результат назначения одной карточки из пакета"""
+    card_id: int
+    ok: bool
+    error: Optional[str] = None
+    job_id: Optional[int] = None  # При отложенной записи - задание в очереди
+
+class BatchAssignResponse(BaseModel):
+    """Результат пакетного назначения"""
+    results: List[AssignResult]
+    state: AppState
+
 class SkipRequest(BaseModel):
     """Запрос на пропуск письма"""
     card_id: int
@@ -129,13 +304,48 @@ def get_current_user(authorization: Optional[str] = Header(None)) -> str:
     
     return username
 
+def get_current_operator(authorization: Optional[str] = Header(None)) -> Operator:
+    """Получить текущего оператора (пользователя и его сессию) из токена"""
+    username = get_current_user(authorization)
+    token = authorization.replace("Bearer ", "")
+    return Operator(username=username, session_id=auth.session_id(token))
+
+def verify_file_access(
+    incoming_no: int,
+    filename: str,
+    token: Optional[str],
+    authorization: Optional[str],
+    v: Optional[str] = None,
+    exp: Optional[int] = None,
+    sig: Optional[str] = None
+):
+    """
+    Проверить доступ к файлу письма (или его превью и PDF-версии)
+    Подписанная ссылка из FileInfo (?v=&exp=&sig=) проверяется по HMAC без
+    поиска сессии; без подписи нужен токен из ?token= (img и iframe не
+    передают заголовки) или из Authorization header
+    
+    Raises:
+        HTTPException: 401, если нет ни действующей подписи, ни токена
+    """
+    if sig is not None:
+        if v is None or exp is None or not auth.verify_file_url(incoming_no, filename, v, exp, sig):
+            raise HTTPException(status_code=401, detail="Invalid or expired file link")
+        return
+    if not token and authorization:
+        token = authorization.replace("Bearer ", "")
+    if not auth.verify_token(token):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
 # ============================================================================
 # Вспомогательные функции
 # ============================================================================
 
-def get_files_for_card(incoming_no: int) -> List[FileInfo]:
+async def get_files_for_card(incoming_no: int) -> List[FileInfo]:
     """
     Получить список файлов для карточки по входящему номеру
+    Папка читается только при её изменении (см. FilesCache); чтение папки
+    и хэширование файлов выполняются в пуле потоков, не блокируя event loop
     
     Args:
         incoming_no: Входящий номер письма
@@ -143,143 +353,216 @@ def get_files_for_card(incoming_no: int) -> List[FileInfo]:
     Returns:
         List[FileInfo]: Список файлов
     """
-    files = []
+    loop = asyncio.get_event_loop()
+    entries = await loop.run_in_executor(None, get_files_cache().list_files, incoming_no)
+    return to_file_infos(incoming_no, entries)
+
+def to_file_infos(incoming_no: int, entries: List[Dict]) -> List[FileInfo]:
+    """
+    FileInfo для записей FilesCache
     
-    # Путь к папке с файлами письма
-    card_folder = FILES_ROOT / str(incoming_no)
+    Args:
+        incoming_no: Входящий номер письма
+        entries: Записи списка файлов (name, ext)
+        
+    Returns:
+        List[FileInfo]: Список файлов
+    """
+    previews = get_preview_cache()
+    converter = get_converter()
+    infos = []
+    for entry in entries:
+        # Одна подпись на файл: превью и PDF-версия открываются по ней же
+        path = f"{incoming_no}/{quote(entry['name'])}?{auth.sign_file_url(incoming_no, entry['name'], entry['hash'])}"
+        infos.append(FileInfo(
+            name=entry["name"],
+            url=f"/files/{path}",
+            ext=entry["ext"],
+            preview_url=f"/previews/{path}" if previews.supports(entry["ext"]) else None,
+            converted_url=f"/converted/{path}" if converter.supports(entry["ext"]) else None
+        ))
+    return infos
+
+def upcoming_cards(queue_cards: QueueIndex, exclude: Set[int]) -> List[Dict]:
+    """Первые PREFETCH_COUNT видимых карточек очереди, кроме exclude"""
+    upcoming = []
+    for card in queue_cards.iter_visible():
+        if len(upcoming) >= get_prefetcher().count:
+            break
+        if card["id"] not in exclude:
+            upcoming.append(card)
+    return upcoming
+
+def get_prefetch_cards(queue_cards: QueueIndex, exclude: Set[int]) -> List[PrefetchCard]:
+    """
+    Подсказки для браузера и фоновый прогрев следующих писем
     
-    # Проверяем существование папки
-    if not card_folder.exists() or not card_folder.is_dir():
-        print(f"[WARN] Folder not found: {card_folder}")
-        return files
+    Берутся первые PREFETCH_COUNT видимых карточек очереди, кроме текущей
+    и арендованных другими операторами (их этот оператор не получит).
+    В подсказки попадают только письма, уже прогретые в FilesCache -
+    чтобы не читать с диска лишние папки при построении состояния.
+    Остальные прогреваются в фоне и появятся в следующих ответах:
+    прогрев меняет Prefetcher.version(), а с ней версию состояния (ETag).
     
-    # Получаем все файлы из папки
-    try:
-        for file_path in card_folder.iterdir():
-            if file_path.is_file():
-                # Получаем расширение файла
-                ext = file_path.suffix.lstrip('.').lower()
-                
-                # Игнорируем служебные файлы
-                if file_path.name.startswith('.'):
-                    continue
-                
-                # Создаем FileInfo
-                files.append(FileInfo(
-                    name=file_path.name,
-                    url=f"/files/{incoming_no}/{file_path.name}",
-                    ext=ext if ext else "unknown"
-                ))
-        
-        # Сортируем файлы по имени для стабильности
-        files.sort(key=lambda f: f.name)
-        
-        print(f"[INFO] Found {len(files)} files for incoming_no {incoming_no}")
-    except Exception as e:
-        print(f"[ERROR] Failed to list files in {card_folder}: {e}")
+    Args:
+        queue_cards: Индекс очереди
+        exclude: ID текущей карточки и карточек других операторов
+        
+    Returns:
+        List[PrefetchCard]: Подсказки для уже прогретых писем
+    """
+    prefetcher = get_prefetcher()
+    upcoming = upcoming_cards(queue_cards, exclude)
+    
+    prefetcher.schedule([card["_incoming_no"] for card in upcoming])
+    
+    hints = []
+    for card in upcoming:
+        entries = get_files_cache().peek(card["_incoming_no"])
+        if entries is None:
+            continue
+        hints.append(PrefetchCard(
+            card_id=card["id"],
+            incoming_no=card["_incoming_no"],
+            files=to_file_infos(card["_incoming_no"], entries)
+        ))
+    return hints
+
+async def compute_state_version(queue_cards: QueueIndex, queue_version: str, session_id: Optional[str] = None) -> str:
+    """
+    Версия состояния приложения без построения CurrentCard/FileInfo
+    Меняется при изменении снимка очереди, deferred, аренд карточек,
+    счётчика назначений, статусов заданий отложенной записи или прогретых
+    подсказок prefetch
+    
+    Все составляющие берутся из общего хранилища, базы заданий или самого
+    содержимого очереди и FilesCache - у процессов backend (--workers N)
+    с одинаковым состоянием версия одинаковая, и 304 срабатывает на любом.
+    
+    Args:
+        queue_cards: Индекс очереди (по нему выбираются письма подсказок)
+        queue_version: Версия снимка очереди из QueueCache
+        session_id: Сессия оператора (у каждого оператора своя текущая карточка)
+        
+    Returns:
+        str: Версия состояния (используется как ETag и id SSE-события)
+    """
+    jobs_version = 0
+    if ASSIGN_WRITE_BEHIND:
+        jobs_version = await sync_job_cards()
+    leases = get_leases()
+    # Подсказки строятся для карточек после текущей и чужих - все они в аренде
+    upcoming = upcoming_cards(queue_cards, set(leases.active()))
+    prefetch_version = get_prefetcher().version([card["_incoming_no"] for card in upcoming])
+    raw = (f"{queue_version}|{deferred.version}|{leases.version}|{assigned_count()}"
+           f"|{jobs_version}|{prefetch_version}|{session_id}")
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def desired_members(owner_id: int, co_owner_ids: List[int]) -> Dict[int, int]:
+    """
+    Нужный состав участников карточки
     
-    return files
+    Args:
+        owner_id: Ответственный исполнитель
+        co_owner_ids: Соисполнители
+        
+    Returns:
+        Dict[int, int]: user_id -> type (2 = ответственный, 1 = участник)
+    """
+    desired = {user_id: 1 for user_id in co_owner_ids}
+    desired[owner_id] = 2
+    return desired
 
-def build_app_state() -> AppState:
+async def build_app_state(queue_cards: Optional[QueueIndex] = None, operator: Optional[Operator] = None) -> AppState:
     """
     Построить текущее состояние приложения на основе данных из Kaiten
     ЭТАП 9: С учетом логики deferred (пропущенных карточек)
     
+    Текущая карточка берётся в аренду оператора: пока аренда действует,
+    другие операторы получают следующие карточки. Оператор остаётся на
+    своей арендованной карточке, пока она есть в очереди или в отложенных.
+    
+    Args:
+        queue_cards: Уже полученный индекс очереди (если None - берём из кэша)
+        operator: Оператор (None - без аренды, как при одном операторе)
+    
     Returns:
         AppState: Состояние приложения
     """
-    global assigned_session_count, deferred, deferred_set
-    
     client = get_kaiten_client()
+    leases = get_leases()
+    loop = asyncio.get_event_loop()
     
-    # Получаем карточки из очереди с входящим номером
-    queue_cards = client.get_queue_cards_with_incoming_no()
+    # Получаем карточки из очереди с входящим номером (через общий кэш)
+    if queue_cards is None:
+        queue_cards = await get_queue_cache().get()
     
     # ДИАГНОСТИКА
     print(f"[BUILD_STATE] ===== START =====")
+    print(f"[BUILD_STATE] Operator: {operator.username if operator else None}")
     print(f"[BUILD_STATE] Queue cards count: {len(queue_cards)}")
     print(f"[BUILD_STATE] Deferred count: {len(deferred)}")
-    print(f"[BUILD_STATE] Deferred set: {deferred_set}")
     if queue_cards:
-        print(f"[BUILD_STATE] Queue incoming_nos: {[c['_incoming_no'] for c in queue_cards]}")
+        print(f"[BUILD_STATE] Queue incoming_nos: {queue_cards.first()['_incoming_no']}..{queue_cards.last()['_incoming_no']}")
     
     # Счётчики
     queue_count = len(queue_cards)
     deferred_count = len(deferred)
     
+    if deferred.party_end is not None:
+        print(f"[BUILD_STATE] Deferred mode: party_end={deferred.party_end}, deferred_count={deferred_count}")
+    
+    # Карточки, арендованные другими операторами, пропускаем
+    leased_by_others = {
+        card_id for card_id, entry in leases.active().items()
+        if operator is None or entry.get("session_id") != operator.session_id
+    }
+    own_lease = leases.lease_of(operator.session_id) if operator else None
+    
     # ЭТАП 9: Выбор current_card с учётом deferred
-    current_card = None
+    # Отложенные карточки скрыты в индексе, поэтому видимые карточки -
+    # это НЕ отложенные карточки очереди
+    candidates = deferred.candidates(queue_cards)
+    if own_lease is not None:
+        card_id = own_lease["card_id"]
+        entry = deferred.get(card_id)
+        if queue_cards.is_visible(card_id):
+            card = queue_cards.get(card_id)
+            candidates = itertools.chain([(card_id, card["_incoming_no"], card)], candidates)
+        elif entry is not None:
+            candidates = itertools.chain([(card_id, entry["incoming_no"], None)], candidates)
     
-    if deferred:
-        # Есть пропущенные карточки - применяем логику партий
-        party_end = deferred[0]["party_end"]
-        
-        print(f"[BUILD_STATE] Deferred mode: party_end={party_end}, deferred_count={deferred_count}")
+    current_card = None
+    for card_id, incoming_no, card in candidates:
+        if card_id in leased_by_others:
+            continue
+        # Карточку могли взять между чтением аренд и захватом - берём следующую
+        # (захват пишет в хранилище - в пуле потоков, как и продление аренд)
+        if operator and not await loop.run_in_executor(
+            None, leases.acquire, card_id, operator.session_id, operator.username
+        ):
+            print(f"[BUILD_STATE] Card {card_id} was leased by another operator, trying next")
+            leased_by_others.add(card_id)
+            continue
         
-        # Ищем первую НЕ отложенную карточку с incoming_no <= party_end
-        found_in_queue = False
-        for card in queue_cards:
-            card_id = card["id"]
-            incoming_no = card["_incoming_no"]
-            
-            print(f"[BUILD_STATE]   Checking card_id={card_id}, incoming_no={incoming_no}, in_deferred={card_id in deferred_set}")
-            
-            # Пропускаем карточки из deferred_set
-            if card_id in deferred_set:
-                print(f"[BUILD_STATE]   SKIP (in deferred_set)")
+        if card is None:
+            # Отложенная карточка - получаем полную информацию из Kaiten
+            print(f"[BUILD_STATE] Selected from deferred: card_id={card_id}, incoming_no={incoming_no}")
+            card = await client.get_card(card_id)
+            if not card:
+                if operator:
+                    await loop.run_in_executor(None, leases.release, card_id, operator.session_id)
                 continue
-            
-            # Берем первую карточку с incoming_no <= party_end
-            if incoming_no <= party_end:
-                print(f"[BUILD_STATE]   MATCH! (incoming_no {incoming_no} <= party_end {party_end})")
-                print(f"[BUILD_STATE] Selected from queue: card_id={card_id}, incoming_no={incoming_no}")
-                
-                files = get_files_for_card(incoming_no)
-                current_card = CurrentCard(
-                    card_id=card_id,
-                    title=card["title"],
-                    incoming_no=incoming_no,
-                    files=files
-                )
-                found_in_queue = True
-                break
-            else:
-                print(f"[BUILD_STATE]   NO MATCH (incoming_no {incoming_no} > party_end {party_end})")
-        
-        # Если не нашли в очереди - отдаем первую отложенную
-        if not found_in_queue and deferred:
-            deferred_card = deferred[0]
-            card_id = deferred_card["card_id"]
-            incoming_no = deferred_card["incoming_no"]
-            
-            print(f"[BUILD_STATE] No cards <= party_end, returning deferred: card_id={card_id}, incoming_no={incoming_no}")
-            
-            # Получаем полную информацию о карточке из Kaiten
-            card_data = client.get_card(card_id)
-            if card_data:
-                files = get_files_for_card(incoming_no)
-                current_card = CurrentCard(
-                    card_id=card_id,
-                    title=card_data["title"],
-                    incoming_no=incoming_no,
-                    files=files
-                )
-    else:
-        # Нет пропущенных - берем первую из очереди
-        if queue_cards:
-            first_card = queue_cards[0]
-            card_id = first_card["id"]
-            incoming_no = first_card["_incoming_no"]
-            
-            print(f"[BUILD_STATE] Normal mode: card_id={card_id}, incoming_no={incoming_no}")
-            
-            files = get_files_for_card(incoming_no)
-            current_card = CurrentCard(
-                card_id=card_id,
-                title=first_card["title"],
-                incoming_no=incoming_no,
-                files=files
-            )
+        else:
+            print(f"[BUILD_STATE] Selected from queue: card_id={card_id}, incoming_no={incoming_no}")
+        
+        current_card = CurrentCard(
+            card_id=card_id,
+            title=card["title"],
+            incoming_no=incoming_no,
+            files=await get_files_for_card(incoming_no)
+        )
+        break
     
     print(f"[BUILD_STATE] ===== END =====")
     if current_card:
@@ -287,13 +570,62 @@ def build_app_state() -> AppState:
     else:
         print(f"[BUILD_STATE] Result: No current card")
     
+    exclude = set(leased_by_others)
+    if current_card:
+        exclude.add(current_card.card_id)
+    
+    failed_jobs: List[Dict[str, Any]] = []
+    if ASSIGN_WRITE_BEHIND:
+        failed_jobs = await loop.run_in_executor(None, get_job_queue().failures)
+    
     return AppState(
         queue_count=queue_count,
         deferred_count=deferred_count,
-        assigned_session_count=assigned_session_count,
-        current_card=current_card
+        assigned_session_count=assigned_count(),
+        current_card=current_card,
+        prefetch=get_prefetch_cards(queue_cards, exclude),
+        failed_jobs=[job_info(job) for job in failed_jobs]
     )
 
+async def load_app_state(known_version: Optional[str] = None, operator: Optional[Operator] = None) -> Tuple[str, Optional[AppState]]:
+    """
+    Получить версию состояния и, если она изменилась, само состояние
+    
+    Заодно продлевает аренду текущей карточки оператора (он её смотрит)
+    и снимает истёкшие аренды - их карточки достанутся другим операторам.
+    
+    Args:
+        known_version: Версия, которая уже есть у клиента
+        operator: Оператор
+        
+    Returns:
+        Tuple[str, Optional[AppState]]: Версия и состояние
+            (None, если версия совпала с known_version - ничего не строим)
+    """
+    # Продление и снятие аренд - записи в хранилище (SQLite может ждать
+    # блокировку другого процесса), поэтому не в event loop
+    session_id = operator.session_id if operator else None
+    await asyncio.get_event_loop().run_in_executor(None, get_leases().refresh, session_id)
+    
+    queue_cards, queue_version = await get_queue_cache().get_snapshot()
+    version = await compute_state_version(queue_cards, queue_version, session_id)
+    
+    if version == known_version:
+        return version, None
+    
+    state = await build_app_state(queue_cards, operator)
+    # Построение могло взять карточку в аренду - версия учитывает это
+    return await compute_state_version(queue_cards, queue_version, session_id), state
+
+# Общий фоновый обновлятель для /api/state/stream
+state_broadcaster = StateBroadcaster(
+    load_app_state,
+    interval=float(os.getenv("STATE_STREAM_INTERVAL", "5")),
+    heartbeat=float(os.getenv("STATE_STREAM_HEARTBEAT", "15"))
+)
+# Прогретые подсказки меняют состояние - сразу рассылаем его подписчикам
+get_prefetcher().on_warmed = state_broadcaster.notify
+
 # ============================================================================
 # API Endpoints - Публичные (без авторизации)
 # ============================================================================
@@ -310,15 +642,20 @@ async def root():
             "logout": "/api/logout",
             "verify": "/api/verify",
             "state": "/api/state",
+            "state_stream": "/api/state/stream",
             "assign": "/api/assign",
+            "assign_batch": "/api/assign/batch",
+            "jobs": "/api/jobs",
             "skip": "/api/skip",
             "undo": "/api/undo",
+            "leases": "/api/leases",
+            "stats": "/api/stats",
             "files": "/files/{incoming_no}/{filename}"
         },
         "kaiten_connected": True,
         "files_root": str(FILES_ROOT),
-        "assigned_this_session": assigned_session_count,
-        "undo_available": last_action is not None  # Показываем, доступна ли отмена
+        "assigned_this_session": assigned_count(),
+        "undo_available": get_undo_history().has_entries()  # Показываем, доступна ли отмена
     }
 
 @app.post("/api/login")
@@ -377,16 +714,33 @@ async def get_public_url():
 # ============================================================================
 
 @app.get("/api/state", response_model=AppState)
-async def get_state(username: str = Depends(get_current_user)):
+async def get_state(
+    if_none_match: Optional[str] = Header(None),
+    operator: Operator = Depends(get_current_operator)
+):
     """
     Получить текущее состояние очереди
+    Поддерживает условный запрос: ETag = версия состояния,
+    при совпадении If-None-Match отвечаем 304 без построения состояния
     
     Returns:
         AppState: Текущее состояние с очередью, счетчиками и текущей карточкой
     """
     try:
-        state = build_app_state()
-        return state
+        known_version = None
+        if if_none_match:
+            known_version = if_none_match.replace("W/", "").strip().strip('"')
+        
+        version, state = await load_app_state(known_version, operator)
+        headers = {
+            "ETag": f'"{version}"',
+            "Cache-Control": "no-cache"  # Браузер всегда перепроверяет по ETag
+        }
+        
+        if state is None:
+            return Response(status_code=304, headers=headers)
+        
+        return Response(content=state.json(), media_type="application/json", headers=headers)
     except Exception as e:
         print(f"[ERROR] Failed to build app state: {e}")
         import traceback
@@ -395,170 +749,375 @@ async def get_state(username: str = Depends(get_current_user)):
         return AppState(
             queue_count=0,
             deferred_count=0,
-            assigned_session_count=assigned_session_count,
+            assigned_session_count=assigned_count(),
             current_card=None
         )
 
-@app.post("/api/assign", response_model=AppState)
-async def assign_card(request: AssignRequest, username: str = Depends(get_current_user)):
+@app.get("/api/state/stream")
+async def stream_state(
+    request: Request,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None)
+):
     """
-    Назначить исполнителя на карточку
-    ЭТАП 5 (final): Назначение через members с правильными roles
+    Поток состояния очереди (Server-Sent Events)
+    Новый AppState приходит только при изменении очереди, deferred, аренд или счётчиков
+    Поддерживает авторизацию через ?token=XXX (EventSource не умеет заголовки)
     
-    Логика:
-    1. Удалить всех текущих members
-    2. Добавить первого исполнителя как member
-    3. Изменить его роль на type: 2 (ответственный)
-    4. Добавить остальных как members с type: 1 (участники)
-    5. Добавить комментарий, если есть
-    6. Переместить карточку в колонку "Назначить исполнителя"
-    7. Проверить и удалить лишних members
+    Args:
+        token: Опциональный токен авторизации через query parameter
+        last_event_id: Версия последнего полученного состояния (при переподключении)
+        
+    Returns:
+        StreamingResponse: text/event-stream
+    """
+    if not token and authorization:
+        token = authorization.replace("Bearer ", "")
+    username = auth.verify_token(token)
+    if not username:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    operator = Operator(username=username, session_id=auth.session_id(token))
+    
+    return StreamingResponse(
+        state_broadcaster.events(operator, last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Отключаем буферизацию в nginx
+        }
+    )
+
+@app.get("/api/stats")
+async def get_stats(username: str = Depends(get_current_user)):
+    """
+    Статистика работы backend (кэши, счётчики)
+    
+    Returns:
+        Dict: Счётчики по компонентам
+    """
+    return {
+        "kaiten": get_kaiten_client().stats(),
+        "queue_cache": get_queue_cache().stats(),
+        "files_cache": get_files_cache().stats(),
+        "prefetch": get_prefetcher().stats(),
+        "previews": get_preview_cache().stats(),
+        "conversions": get_converter().stats(),
+        "compression": compression_stats(),
+        "state_stream": state_broadcaster.stats(),
+        "jobs": get_job_queue().stats() if ASSIGN_WRITE_BEHIND else None,
+        "state": state_store.stats(),
+        "auth": auth.stats(),
+        "undo": get_undo_history().stats(),
+        "leases": get_leases().stats()
+    }
+
+async def perform_assignment(
+    request: AssignRequest,
+    undo_items: List[Dict[str, Any]],
+    progress: Optional[Dict[str, Any]] = None
+):
+    """
+    Назначить исполнителя на одну карточку (шаги 1-7)
+    
+    Состояние приложения не пересобирается и счётчик назначений не меняется -
+    это делает вызывающий endpoint (один раз на запрос).
     
     Args:
         request: Данные о назначении
+        undo_items: Сюда добавляется снимок карточки для Undo
+            (сразу после загрузки, до изменений)
+        progress: Сюда отмечаются выполненные шаги, которые нельзя
+            повторять (комментарий) - для повторных попыток заданий
         
-    Returns:
-        AppState: Обновленное состояние
+    Raises:
+        HTTPException: Если назначение не удалось
     """
-    global assigned_session_count, last_action, deferred, deferred_set    
     client = get_kaiten_client()
     
-    try:
-        print("="*60)
-        print(f"[INFO] ===== STARTING ASSIGNMENT =====")
-        print(f"[INFO] Card ID: {request.card_id}")
-        print(f"[INFO] Owner (type: 2): {request.owner_id}")
-        print(f"[INFO] Co-owners (type: 1): {request.co_owner_ids}")
-        print("="*60)
+    print("="*60)
+    print(f"[INFO] ===== STARTING ASSIGNMENT =====")
+    print(f"[INFO] Card ID: {request.card_id}")
+    print(f"[INFO] Owner (type: 2): {request.owner_id}")
+    print(f"[INFO] Co-owners (type: 1): {request.co_owner_ids}")
+    print("="*60)
+    
+    # Карточка загружается один раз и дальше ведётся в памяти
+    card_work = CardUnitOfWork(client, request.card_id)
+    
+    # ========== ЭТАП 8: Сохраняем текущее состояние для Undo ==========
+    print(f"\n[UNDO] Saving current state for undo...")
+    current_card = await card_work.load()
+    undo_item: Optional[Dict[str, Any]] = None
+    if current_card:
+        prev_members = current_card.get('members', [])
+        prev_column_id = current_card.get('column_id')
         
-        # ========== ЭТАП 8: Сохраняем текущее состояние для Undo ==========
-        print(f"\n[UNDO] Saving current state for undo...")
-        current_card = client.get_card(request.card_id)
-        if current_card:
-            prev_members = current_card.get('members', [])
-            prev_column_id = current_card.get('column_id')
-            
-            last_action = {
-                "card_id": request.card_id,
-                "prev_column_id": prev_column_id,
-                "prev_members": prev_members.copy(),  # Сохраняем копию всех members
-                "timestamp": datetime.now()
-            }
-            print(f"[UNDO] Saved: column={prev_column_id}, members={len(prev_members)}")
-        else:
-            print(f"[UNDO] WARNING: Could not get card info")
-            last_action = None
-        # ================================================================
+        undo_item = {
+            "card_id": request.card_id,
+            "prev_column_id": prev_column_id,
+            "prev_members": prev_members.copy()  # Сохраняем копию всех members
+        }
+        undo_items.append(undo_item)
+        print(f"[UNDO] Saved: column={prev_column_id}, members={len(prev_members)}")
+    else:
+        print(f"[UNDO] WARNING: Could not get card info")
+    # ================================================================
 
 
-        # Шаг 1: Удалить всех текущих members
-        print(f"\n[STEP 1] Removing all existing members...")
-        success = client.remove_all_members(request.card_id)
-        print(f"[STEP 1] Result: {'SUCCESS' if success else 'FAILED'}")
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to remove existing members")
+    # Шаги 1-4: Привести members к нужному составу (только разница)
+    print(f"\n[STEP 1-4] Reconciling members...")
+    desired = desired_members(request.owner_id, request.co_owner_ids)
+    operations = [
+        ("members", lambda: card_work.reconcile_members(desired))
+    ]
+    
+    # Шаг 5: Комментарий - не зависит от members, отправляем параллельно
+    if request.comment_text and request.comment_text.strip():
+        print(f"[STEP 5] Adding comment in parallel...")
+        operations.append(("comment", lambda: card_work.add_comment(request.comment_text)))
+    
+    results = {result["name"]: result for result in await client.run_operations(operations)}
+    success = results["members"]["ok"]
+    print(f"[STEP 1-4] Result: {'SUCCESS' if success else 'FAILED'}")
+    if "comment" in results:
+        print(f"[STEP 5] Result: {'SUCCESS' if results['comment']['ok'] else 'FAILED'}")
+        if progress is not None:
+            progress["comment"] = results["comment"]["ok"]
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to update card members")
+
+    # ========== ЭТАП 9: УДАЛЕНИЕ ИЗ DEFERRED (если была пропущена) ==========
+    print(f"\n[ASSIGN] Checking if card was deferred...")
+    if deferred.discard(request.card_id):
+        print(f"[ASSIGN] Card {request.card_id} was deferred, removed from deferred list")
+        # Карточка снова участвует в выборе (пока не уйдёт из очереди)
+        get_queue_cache().index.unhide(request.card_id)
+        print(f"[ASSIGN] Remaining deferred: {len(deferred)}")
+    else:
+        print(f"[ASSIGN] Card was not deferred, skipping cleanup")
+    
+    # Шаг 6: Переместить карточку
+    print(f"\n[STEP 6] Moving card to column...")
+    column_assign_id = int(os.getenv("KAITEN_COLUMN_ASSIGN_ID"))
+    success = await card_work.move(column_assign_id)
+    print(f"[STEP 6] Result: {'SUCCESS' if success else 'FAILED'}")
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to move card")
+    # Карточка ушла из очереди - правим снимок без повторной загрузки
+    get_queue_cache().remove_card(request.card_id)
+    
+    # ========== ШАГ 7: ПРОВЕРКА MEMBERS ==========
+    # Сверка со свежими данными: удаляет лишних, появившихся после
+    # перемещения, и исправляет роли. Карточка перечитывается, только если
+    # Kaiten не вернул участников в ответе на перемещение
+    print(f"\n[STEP 7] Verifying members...")
+    if not await card_work.verify_members(desired):
+        print(f"  ⚠️  Failed to fix some members")
+    
+    if undo_item is not None:
+        # Итог назначения - Undo откатит только разницу, не перечитывая карточку
+        undo_item["column_id"] = column_assign_id
+        undo_item["members_after"] = [
+            [member['user_id'], member.get('type', 1)]
+            for member in card_work.members
+            if member.get('user_id')
+        ]
+    
+    print(f"\n[SUCCESS] ===== ASSIGNMENT COMPLETE: card {request.card_id} =====")
+    print("="*60)
+
+def job_info(job: Dict[str, Any]) -> JobInfo:
+    """Задание из очереди в виде ответа API"""
+    return JobInfo(
+        id=job["id"],
+        kind=job["kind"],
+        card_id=job["card_id"],
+        status=job["status"],
+        attempts=job["attempts"],
+        last_error=job["last_error"],
+        created_by=job["created_by"],
+        created_at=datetime.fromtimestamp(job["created_at"]),
+        updated_at=datetime.fromtimestamp(job["updated_at"])
+    )
+
+async def run_job(kind: str, payload: Dict[str, Any], result: Dict[str, Any]):
+    """
+    Выполнить задание отложенной записи (вызывается фоновым обработчиком)
+    
+    Args:
+        kind: Тип задания
+        payload: Данные задания
+        result: Сохраняемый результат (снимок для Undo, выполненные шаги)
         
-        # Шаг 2: Добавить первого исполнителя как member
-        print(f"\n[STEP 2] Adding primary member {request.owner_id}...")
-        success = client.add_card_member(request.card_id, request.owner_id)
-        print(f"[STEP 2] Result: {'SUCCESS' if success else 'FAILED'}")
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to add primary member")
+    Raises:
+        Exception: Попытка не удалась - задание будет повторено
+    """
+    if kind != "assign":
+        raise ValueError(f"Unknown job kind: {kind}")
+    
+    request = AssignRequest(**payload)
+    progress = result.setdefault("progress", {})
+    if progress.get("comment"):
+        # Комментарий добавлен прошлой попыткой - не дублируем
+        request = request.copy(update={"comment_text": ""})
+    
+    undo_items: List[Dict[str, Any]] = []
+    try:
+        await perform_assignment(request, undo_items, progress)
+    finally:
+        # Для Undo нужен снимок первой попытки - до любых изменений,
+        # а итог назначения - из последней (успешной) попытки
+        if undo_items and not result.get("undo_items"):
+            result["undo_items"] = undo_items
+        elif undo_items and "members_after" in undo_items[0]:
+            result["undo_items"][0]["column_id"] = undo_items[0]["column_id"]
+            result["undo_items"][0]["members_after"] = undo_items[0]["members_after"]
+
+def on_job_finished(job: Dict[str, Any]):
+    """Задание выполнено или окончательно не удалось - обновить состояние"""
+    card_id = job["card_id"]
+    if card_id is not None:
+        get_queue_cache().index.unhide(card_id)
+    if job["status"] == FAILED:
+        # Назначение не состоялось: карточка возвращается в очередь
+        add_assigned(-1)
+        get_queue_cache().invalidate()
+    state_broadcaster.notify()
+
+# Карточки незавершённых заданий, скрытые в индексе очереди
+_job_cards: Set[int] = set()
+_job_cards_version: Optional[str] = None
+
+async def sync_job_cards() -> str:
+    """
+    Скрыть в индексе карточки незавершённых заданий
+    Задания могут ставить и выполнять другие процессы backend - их
+    карточки тоже не показываем оператору повторно
+    
+    Returns:
+        str: Версия заданий (чтение базы - в пуле потоков, индекс меняется в event loop)
+    """
+    global _job_cards, _job_cards_version
+    loop = asyncio.get_event_loop()
+    version, jobs = await loop.run_in_executor(None, get_job_queue().snapshot, _job_cards_version)
+    if jobs is None:
+        return version
+    active = {job["card_id"] for job in jobs if job["card_id"] is not None}
+    index = get_queue_cache().index
+    for card_id in active - _job_cards:
+        index.hide(card_id)
+    for card_id in _job_cards - active:
+        if card_id not in deferred:
+            index.unhide(card_id)
+    _job_cards = active
+    _job_cards_version = version
+    return version
+
+async def start_job_worker():
+    """Запустить обработчик заданий (если ещё не запущен)"""
+    if get_job_queue().start(run_job, on_job_finished):
+        await sync_job_cards()
+
+async def check_lease(card_id: int, operator: Operator):
+    """
+    Проверить, что карточка не в аренде у другого оператора
+    (другой сессии - в том числе под той же учётной записью)
+    Аренды читаются из хранилища - в пуле потоков
+    
+    Args:
+        card_id: ID карточки
+        operator: Оператор, который назначает или пропускает карточку
         
-        # Шаг 3: Изменить его роль на type: 2
-        print(f"\n[STEP 3] Updating member role to type: 2...")
-        success = client.update_member_role(request.card_id, request.owner_id, 2)
-        print(f"[STEP 3] Result: {'SUCCESS' if success else 'FAILED'}")
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to update member role")
-        
-        # Шаг 4: Добавить co-owners
-        if request.co_owner_ids:
-            print(f"\n[STEP 4] Adding {len(request.co_owner_ids)} co-owners...")
-            for co_owner_id in request.co_owner_ids:
-                print(f"  Adding co-owner {co_owner_id}...")
-                client.add_card_member(request.card_id, co_owner_id)
-        
-        # Шаг 5: Комментарий
-        if request.comment_text and request.comment_text.strip():
-            print(f"\n[STEP 5] Adding comment...")
-            client.add_comment(request.card_id, request.comment_text)
-
-        # ========== ЭТАП 9: УДАЛЕНИЕ ИЗ DEFERRED (если была пропущена) ==========
-        print(f"\n[ASSIGN] Checking if card was deferred...")
-        if request.card_id in deferred_set:
-            print(f"[ASSIGN] Card {request.card_id} was deferred, removing from deferred list...")
-            
-            # Удаляем из deferred_set
-            deferred_set.discard(request.card_id)
-            
-            # Удаляем из deferred list
-            original_count = len(deferred)
-            deferred[:] = [d for d in deferred if d["card_id"] != request.card_id]
-            removed_count = original_count - len(deferred)
-            
-            print(f"[ASSIGN] Removed from deferred: {removed_count} entries")
-            print(f"[ASSIGN] Remaining deferred: {len(deferred)}")
-        else:
-            print(f"[ASSIGN] Card was not deferred, skipping cleanup")
+    Raises:
+        HTTPException: 409, если карточку обрабатывает другой оператор
+    """
+    lease = await asyncio.get_event_loop().run_in_executor(None, get_leases().lease, card_id)
+    if lease is not None and lease.get("session_id") != operator.session_id:
+        print(f"[LEASE] Card {card_id} is leased by another session of {lease['username']}, "
+              f"rejecting action of {operator.username}")
+        raise HTTPException(status_code=409, detail=f"Card is being processed by another operator ({lease['username']})")
+
+async def enqueue_assignment(request: AssignRequest, username: str) -> Optional[int]:
+    """
+    Поставить назначение в очередь заданий вместо синхронной записи
+    
+    Карточка сразу убирается из очереди и из отложенных, так что следующей
+    показывается другая карточка; до выполнения задания она скрыта в
+    индексе и не вернётся при синхронизации с Kaiten.
+    
+    Args:
+        request: Данные о назначении
+        username: Пользователь, назначивший исполнителя
         
-        # Шаг 6: Переместить карточку
-        print(f"\n[STEP 6] Moving card to column...")
-        column_assign_id = int(os.getenv("KAITEN_COLUMN_ASSIGN_ID"))
-        success = client.move_card(request.card_id, column_assign_id)
-        print(f"[STEP 6] Result: {'SUCCESS' if success else 'FAILED'}")
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to move card")
-        
-        # ========== ШАГ 7: ПРОВЕРКА MEMBERS ==========
-        print(f"\n[STEP 7] Verifying members...")
-        card = client.get_card(request.card_id)
-        if card:
-            members = card.get('members', [])
-            print(f"  Total members: {len(members)}")
-            
-            # Список разрешённых user_id
-            allowed_ids = {request.owner_id} | set(request.co_owner_ids)
-            print(f"  Expected members: {allowed_ids}")
-            
-            # Список лишних для удаления
-            to_remove = []
-            
-            # Проверяем каждого member
-            for member in members:
-                user_id = member.get('user_id')
-                member_type = member.get('type')
-                full_name = member.get('full_name')
-                
-                if user_id in allowed_ids:
-                    print(f"  ✅ {full_name} (ID: {user_id}, Type: {member_type}) - OK")
-                else:
-                    print(f"  ⚠️  UNEXPECTED: {full_name} (ID: {user_id}, Type: {member_type})")
-                    to_remove.append((user_id, full_name))
+    Returns:
+        Optional[int]: ID задания или None, если карточки нет в снимке
+            очереди (её нужно назначить синхронно)
             
-            # ========== ШАГ 8: УДАЛИТЬ ЛИШНИХ ==========
-            if to_remove:
-                print(f"\n[STEP 8] Removing {len(to_remove)} unexpected members...")
-                for user_id, full_name in to_remove:
-                    print(f"  Removing {full_name} (ID: {user_id})...")
-                    url = f"{client.base_url}/cards/{request.card_id}/members/{user_id}"
-                    try:
-                        response = client.client.delete(url)
-                        if response.status_code in [200, 404]:
-                            print(f"    ✅ Removed")
-                        else:
-                            print(f"    ⚠️  Status: {response.status_code}")
-                    except Exception as e:
-                        print(f"    ❌ Error: {e}")
-        
-        assigned_session_count += 1
-        
-        print(f"\n[SUCCESS] ===== ASSIGNMENT COMPLETE =====")
-        print(f"[SUCCESS] Total assigned: {assigned_session_count}")
-        print("="*60)
+    Raises:
+        HTTPException: Назначение карточки уже стоит в очереди
+    """
+    await start_job_worker()
+    job_queue = get_job_queue()
+    loop = asyncio.get_event_loop()
+    
+    queue_cards = await get_queue_cache().get()
+    if request.card_id not in queue_cards:
+        print(f"[ASSIGN] Card {request.card_id} is not in queue snapshot, assigning synchronously")
+        return None
+    if await loop.run_in_executor(None, job_queue.has_active, request.card_id):
+        raise HTTPException(status_code=409, detail="Card assignment is already queued")
+    
+    # Запись задания в SQLite (может ждать блокировку другого процесса) - в пуле потоков
+    job_id = await loop.run_in_executor(
+        None, functools.partial(job_queue.enqueue, "assign", request.dict(), card_id=request.card_id, created_by=username)
+    )
+    
+    deferred.discard(request.card_id)
+    queue_cards.hide(request.card_id)
+    get_queue_cache().remove_card(request.card_id)
+    return job_id
+
+@app.post("/api/assign", response_model=AppState)
+async def assign_card(request: AssignRequest, operator: Operator = Depends(get_current_operator)):
+    """
+    Назначить исполнителя на карточку
+    ЭТАП 5 (final): Назначение через members с правильными roles
+    
+    Логика:
+    1-4. Сверить текущих members с нужными и сделать только разницу:
+         первый исполнитель - type: 2 (ответственный),
+         остальные - type: 1 (участники), лишние удаляются
+    5. Добавить комментарий, если есть
+    6. Переместить карточку в колонку "Назначить исполнителя"
+    7. Проверить и удалить лишних members
+    
+    Args:
+        request: Данные о назначении
         
-        return build_app_state()
+    Returns:
+        AppState: Обновленное состояние
         
+    Raises:
+        HTTPException: 409, если карточка в аренде у другого оператора
+    """
+    await check_lease(request.card_id, operator)
+    
+    if ASSIGN_WRITE_BEHIND:
+        job_id = await enqueue_assignment(request, operator.username)
+        if job_id is not None:
+            record_undo(operator.session_id, "assign", [], jobs=[job_id])
+            add_assigned(1)
+            await asyncio.get_event_loop().run_in_executor(None, get_leases().release, request.card_id, operator.session_id)
+            state_broadcaster.notify()
+            print(f"[ASSIGN] Card {request.card_id} queued as job {job_id}")
+            return await build_app_state(operator=operator)
+    
+    undo_items: List[Dict[str, Any]] = []
+    assigned = False
+    try:
+        await perform_assignment(request, undo_items)
+        assigned = True
     except HTTPException:
         raise
     except Exception as e:
@@ -568,9 +1127,88 @@ async def assign_card(request: AssignRequest, username: str = Depends(get_curren
         traceback.print_exc()
         print("="*60)
         raise HTTPException(status_code=500, detail=f"Failed to assign card: {str(e)}")
+    finally:
+        # Снимок сохраняется и при частичной неудаче - изменения можно откатить,
+        # но в счётчик назначенных такая карточка не попала
+        if not assigned:
+            undo_items = [{**item, "counted": False} for item in undo_items]
+        record_undo(operator.session_id, "assign", undo_items)
+    
+    total = add_assigned(1)
+    # Карточка ушла из очереди - аренда больше не нужна
+    await asyncio.get_event_loop().run_in_executor(None, get_leases().release, request.card_id, operator.session_id)
+    state_broadcaster.notify()
+    print(f"[SUCCESS] Total assigned: {total}")
+    
+    return await build_app_state(operator=operator)
+
+@app.post("/api/assign/batch", response_model=BatchAssignResponse)
+async def assign_batch(request: BatchAssignRequest, operator: Operator = Depends(get_current_operator)):
+    """
+    Назначить исполнителей сразу на несколько карточек
+    
+    Карточки обрабатываются параллельно, но не больше ASSIGN_BATCH_CONCURRENCY
+    одновременно. Неудача одной карточки не останавливает остальные.
+    Карточки в аренде у других операторов не назначаются (ошибка в результате).
+    Состояние пересобирается один раз в конце, Undo откатывает весь пакет.
+    
+    Args:
+        request: Список назначений (card_id не должны повторяться)
+        
+    Returns:
+        BatchAssignResponse: Результат по каждой карточке и новое состояние
+    """
+    card_ids = [item.card_id for item in request.items]
+    if not card_ids:
+        raise HTTPException(status_code=400, detail="No cards to assign")
+    if len(set(card_ids)) != len(card_ids):
+        raise HTTPException(status_code=400, detail="Duplicate card_id in batch")
+    
+    print(f"[BATCH] Assigning {len(card_ids)} cards, concurrency={ASSIGN_BATCH_CONCURRENCY}")
+    semaphore = asyncio.Semaphore(ASSIGN_BATCH_CONCURRENCY)
+    loop = asyncio.get_event_loop()
+    undo_items: List[Dict[str, Any]] = []
+    job_ids: List[int] = []
+    
+    async def assign_one(item: AssignRequest) -> AssignResult:
+        async with semaphore:
+            try:
+                await check_lease(item.card_id, operator)
+                if ASSIGN_WRITE_BEHIND:
+                    job_id = await enqueue_assignment(item, operator.username)
+                    if job_id is not None:
+                        job_ids.append(job_id)
+                        await loop.run_in_executor(None, get_leases().release, item.card_id, operator.session_id)
+                        return AssignResult(card_id=item.card_id, ok=True, job_id=job_id)
+                item_undo: List[Dict[str, Any]] = []
+                try:
+                    await perform_assignment(item, item_undo)
+                except Exception:
+                    # Частично назначенную карточку можно откатить, но в счётчик
+                    # назначенных (succeeded) она не попадает
+                    undo_items.extend({**snapshot, "counted": False} for snapshot in item_undo)
+                    raise
+                undo_items.extend(item_undo)
+                await loop.run_in_executor(None, get_leases().release, item.card_id, operator.session_id)
+                return AssignResult(card_id=item.card_id, ok=True)
+            except HTTPException as e:
+                return AssignResult(card_id=item.card_id, ok=False, error=str(e.detail))
+            except Exception as e:
+                print(f"[BATCH] Card {item.card_id} failed: {e}")
+                return AssignResult(card_id=item.card_id, ok=False, error=str(e))
+    
+    results = await asyncio.gather(*(assign_one(item) for item in request.items))
+    succeeded = sum(1 for result in results if result.ok)
+    
+    record_undo(operator.session_id, "assign", undo_items, jobs=job_ids)
+    total = add_assigned(succeeded)
+    state_broadcaster.notify()
+    print(f"[BATCH] Done: {succeeded}/{len(results)} assigned, total assigned: {total}")
+    
+    return BatchAssignResponse(results=results, state=await build_app_state(operator=operator))
 
 @app.post("/api/skip", response_model=AppState)
-async def skip_card(request: SkipRequest, username: str = Depends(get_current_user)):
+async def skip_card(request: SkipRequest, operator: Operator = Depends(get_current_operator)):
     """
     Пропустить текущую карточку (Skip)
     ЭТАП 9: Логика партий
@@ -580,7 +1218,7 @@ async def skip_card(request: SkipRequest, username: str = Depends(get_current_us
     2. Вычислить party_end = MAX(incoming_no) среди всех карточек
     3. Получить incoming_no пропускаемой карточки
     4. Добавить запись в deferred с party_end
-    5. Добавить card_id в deferred_set
+    5. Скрыть карточку в индексе очереди и снять её аренду
     6. Вернуть следующую карточку
     
     Args:
@@ -589,19 +1227,17 @@ async def skip_card(request: SkipRequest, username: str = Depends(get_current_us
     Returns:
         AppState: Обновленное состояние
     """
-    global deferred, deferred_set
-    
-    client = get_kaiten_client()
-    
     try:
         print("="*60)
         print(f"[SKIP] ===== STARTING SKIP =====")
         print(f"[SKIP] Card ID: {request.card_id}")
         print("="*60)
         
+        await check_lease(request.card_id, operator)
+        
         # Шаг 1: Получить актуальный список карточек из очереди
         print(f"\n[SKIP STEP 1] Getting current queue...")
-        queue_cards = client.get_queue_cards_with_incoming_no()
+        queue_cards = await get_queue_cache().get()
         print(f"[SKIP STEP 1] Queue size: {len(queue_cards)}")
         
         if not queue_cards:
@@ -610,17 +1246,14 @@ async def skip_card(request: SkipRequest, username: str = Depends(get_current_us
         
         # Шаг 2: Вычислить party_end = MAX(incoming_no)
         print(f"\n[SKIP STEP 2] Calculating party_end...")
-        party_end = max(card["_incoming_no"] for card in queue_cards)
+        party_end = queue_cards.last()["_incoming_no"]
         print(f"[SKIP STEP 2] party_end = {party_end}")
         
         # Шаг 3: Получить incoming_no пропускаемой карточки
         print(f"\n[SKIP STEP 3] Finding incoming_no for card {request.card_id}...")
         
-        skipped_incoming_no = None
-        for card in queue_cards:
-            if card["id"] == request.card_id:
-                skipped_incoming_no = card["_incoming_no"]
-                break
+        skipped_card = queue_cards.get(request.card_id)
+        skipped_incoming_no = skipped_card["_incoming_no"] if skipped_card else None
         
         if skipped_incoming_no is None:
             print(f"[SKIP] Error: Card {request.card_id} not found in queue!")
@@ -635,24 +1268,29 @@ async def skip_card(request: SkipRequest, username: str = Depends(get_current_us
             "card_id": request.card_id,
             "incoming_no": skipped_incoming_no,
             "party_end": party_end,
-            "deferred_at": datetime.now()
+            "deferred_at": datetime.now().isoformat()
         }
         
-        deferred.append(deferred_entry)
-        print(f"[SKIP STEP 4] Added to deferred: {deferred_entry}")
+        added = deferred.add(deferred_entry)
+        if added:
+            print(f"[SKIP STEP 4] Added to deferred: {deferred_entry}")
+        else:
+            print(f"[SKIP STEP 4] Card already deferred, keeping its place")
+        record_undo(operator.session_id, "skip", [{"card_id": request.card_id, "added": added}])
         
-        # Шаг 5: Добавить card_id в deferred_set
-        print(f"\n[SKIP STEP 5] Adding to deferred_set...")
-        deferred_set.add(request.card_id)
-        print(f"[SKIP STEP 5] deferred_set size: {len(deferred_set)}")
+        # Шаг 5: Скрыть карточку из выбора следующей
+        print(f"\n[SKIP STEP 5] Hiding card in queue index...")
+        queue_cards.hide(request.card_id)
+        # Отложенную карточку может взять другой оператор
+        await asyncio.get_event_loop().run_in_executor(None, get_leases().release, request.card_id, operator.session_id)
+        state_broadcaster.notify()
         
         print(f"\n[SUCCESS] ===== SKIP COMPLETE =====")
         print(f"[SUCCESS] Total deferred: {len(deferred)}")
-        print(f"[SUCCESS] Deferred cards: {[d['incoming_no'] for d in deferred]}")
         print("="*60)
         
         # Шаг 6: Вернуть обновленное состояние
-        return build_app_state()
+        return await build_app_state(operator=operator)
         
     except HTTPException:
         raise
@@ -664,84 +1302,179 @@ async def skip_card(request: SkipRequest, username: str = Depends(get_current_us
         print("="*60)
         raise HTTPException(status_code=500, detail=f"Failed to skip card: {str(e)}")
 
+async def restore_undo_item(item: Dict[str, Any]) -> bool:
+    """
+    Вернуть одну карточку в состояние до назначения
+    
+    Если назначение завершилось, откатывается только его разница: участники,
+    которых оно добавило, удалило или у которых сменило роль, - без загрузки
+    карточки. Иначе (или если разница не применилась - карточку успели
+    изменить) карточка загружается и сверяется с полным снимком.
+    
+    Args:
+        item: Запись истории {"card_id", "prev_column_id", "prev_members",
+            "column_id", "members_after"}
+        
+    Returns:
+        bool: True если карточка перемещена обратно
+    """
+    client = get_kaiten_client()
+    card_id = item['card_id']
+    card_work = CardUnitOfWork(client, card_id)
+    
+    # Шаги 1-2: Вернуть предыдущих members с их ролями
+    delta = members_delta(item)
+    success = False
+    if delta is not None:
+        print(f"[UNDO] Card {card_id}: restoring to column {item['prev_column_id']}, inverse delta of {len(delta)} members")
+        current = [{"user_id": user_id, "type": after} for user_id, _, after in delta if after]
+        previous = {user_id: before for user_id, before, _ in delta if before}
+        success = await client.reconcile_members(card_id, current, previous)
+        if not success:
+            print(f"[UNDO] Card {card_id}: inverse delta failed, restoring from snapshot")
+    if not success:
+        print(f"[UNDO] Card {card_id}: restoring to column {item['prev_column_id']}, {len(item['prev_members'])} members")
+        desired = {
+            member['user_id']: member.get('type', 1)  # По умолчанию участник
+            for member in item['prev_members']
+            if member.get('user_id')
+        }
+        await card_work.load()
+        success = await card_work.reconcile_members(desired)
+    print(f"[UNDO] Card {card_id} members: {'SUCCESS' if success else 'FAILED'}")
+    
+    # Шаг 3: Переместить карточку обратно в очередь
+    success = await card_work.move(item['prev_column_id'])
+    print(f"[UNDO] Card {card_id} move: {'SUCCESS' if success else 'FAILED'}")
+    if not success:
+        return False
+    
+    # Карточка вернулась в очередь - правим снимок без повторной загрузки
+    # (при откате разницы карточка берётся из ответа на перемещение)
+    restored = card_work.card
+    incoming_no = client.parse_incoming_no(restored) if restored else None
+    if incoming_no is not None and item['prev_column_id'] == client.column_queue_id:
+        get_queue_cache().upsert_card({**restored, "_incoming_no": incoming_no})
+    else:
+        get_queue_cache().invalidate()
+    return True
+
+def undo_skip(action: Dict[str, Any]):
+    """Отменить пропуск: карточка снова не отложена (запросов к Kaiten нет)"""
+    for item in action['items']:
+        if item['added'] and deferred.discard(item['card_id']):
+            print(f"[UNDO] Card {item['card_id']} removed from deferred")
+
+async def lease_restored(card_ids: List[int], operator: Operator):
+    """Вернуть оператору первую восстановленную карточку (если её не взял другой)"""
+    if not card_ids:
+        return
+    if await asyncio.get_event_loop().run_in_executor(
+        None, get_leases().acquire, card_ids[0], operator.session_id, operator.username
+    ):
+        print(f"[UNDO] Card {card_ids[0]} leased back to {operator.username}")
+
 @app.post("/api/undo", response_model=AppState)
-async def undo_last_action(username: str = Depends(get_current_user)):
+async def undo_last_action(operator: Operator = Depends(get_current_operator)):
     """
-    Отменить последнее действие
+    Отменить последнее действие оператора
     ЭТАП 8: Восстановление карточки в очередь
     
-    Логика:
-    1. Переместить карточку обратно в колонку "Очередь" (5592671)
-    2. Восстановить всех предыдущих members с их ролями
+    У каждой сессии оператора своя история (UNDO_HISTORY_SIZE действий, не старше
+    UNDO_HISTORY_MAX_AGE) - повторный Undo отменяет предыдущее действие.
+    
+    Логика для пропуска: карточка убирается из отложенных и снова
+    берётся в аренду оператора.
+    Логика для назначения (для каждой карточки назначения или пакета):
+    1. Вернуть предыдущих members с их ролями (только разница)
+    2. Переместить карточку обратно в колонку "Очередь" (5592671)
     3. Уменьшить session_assigned_counter
-    4. Очистить last_action
-    5. Вернуть обновлённое состояние (карточка станет current_card)
+    4. Неоткатившиеся карточки остаются в истории
+    5. Вернуть обновлённое состояние (первая восстановленная карточка
+       берётся в аренду оператора и становится его current_card)
     
     Returns:
         AppState: Обновленное состояние
     """
-    global assigned_session_count, last_action
-    
-    # Проверяем наличие last_action
+    history = get_undo_history()
+    # Забираем действие атомарно: два одновременных Undo (в том числе
+    # из разных процессов) не откатят одно действие дважды
+    last_action = history.pop(operator.session_id)
     if not last_action:
         print("[UNDO] No action to undo")
         raise HTTPException(status_code=400, detail="No action to undo")
     
-    client = get_kaiten_client()
+    if last_action.get('kind') == "skip":
+        undo_skip(last_action)
+        await lease_restored([item['card_id'] for item in last_action['items']], operator)
+        state_broadcaster.notify()
+        print(f"[SUCCESS] Skip undone, total deferred: {len(deferred)}")
+        return await build_app_state(operator=operator)
     
     try:
+        items = list(last_action['items'])
+        cancelled = 0
+        restored_ids: List[int] = []
+        
+        # Отложенная запись: ещё не начатые задания просто отменяем,
+        # остальные дожидаемся и откатываем по сохранённым снимкам
+        loop = asyncio.get_event_loop()
+        for job_id in last_action.get('jobs', []):
+            job_queue = get_job_queue()
+            job = await loop.run_in_executor(None, job_queue.get, job_id)
+            if job is None:
+                continue
+            if await loop.run_in_executor(None, job_queue.cancel, job_id):
+                print(f"[UNDO] Job {job_id} cancelled before it ran")
+                get_queue_cache().index.unhide(job['card_id'])
+                restored_ids.append(job['card_id'])
+                cancelled += 1
+                continue
+            job = await job_queue.wait(job_id)
+            # Неудавшееся задание уже вычтено из счётчика назначенных
+            items.extend(
+                {**item, "counted": job['status'] == DONE}
+                for item in job['result'].get('undo_items', [])
+            )
+        if cancelled:
+            # Карточки остались в очереди Kaiten - вернём их в зеркало
+            get_queue_cache().invalidate()
+        
         print("="*60)
-        print(f"[UNDO] ===== STARTING UNDO =====")
-        print(f"[UNDO] Card ID: {last_action['card_id']}")
-        print(f"[UNDO] Restoring to column: {last_action['prev_column_id']}")
-        print(f"[UNDO] Restoring {len(last_action['prev_members'])} members")
+        print(f"[UNDO] ===== STARTING UNDO: {len(items)} cards =====")
         print("="*60)
         
-        card_id = last_action['card_id']
-        
-        # Шаг 1: Удалить всех текущих members
-        print(f"\n[UNDO STEP 1] Removing current members...")
-        success = client.remove_all_members(card_id)
-        print(f"[UNDO STEP 1] Result: {'SUCCESS' if success else 'FAILED'}")
+        semaphore = asyncio.Semaphore(ASSIGN_BATCH_CONCURRENCY)
         
-        # Шаг 2: Восстановить предыдущих members
-        print(f"\n[UNDO STEP 2] Restoring previous members...")
-        for member in last_action['prev_members']:
-            user_id = member.get('user_id')
-            member_type = member.get('type', 1)  # По умолчанию участник
-            full_name = member.get('full_name', f'User {user_id}')
-            
-            print(f"  Restoring {full_name} (ID: {user_id}, Type: {member_type})...")
-            
-            # Добавляем member
-            success = client.add_card_member(card_id, user_id)
-            if success and member_type != 1:
-                # Если роль не "участник" (type=1), обновляем роль
-                client.update_member_role(card_id, user_id, member_type)
+        async def restore_one(item: Dict[str, Any]) -> bool:
+            async with semaphore:
+                return await restore_undo_item(item)
         
-        # Шаг 3: Переместить карточку обратно в очередь
-        print(f"\n[UNDO STEP 3] Moving card back to queue...")
-        success = client.move_card(card_id, last_action['prev_column_id'])
-        print(f"[UNDO STEP 3] Result: {'SUCCESS' if success else 'FAILED'}")
+        restored = await asyncio.gather(*(restore_one(item) for item in items))
+        failed = [item for item, ok in zip(items, restored) if not ok]
         
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to move card back to queue")
+        # Шаг 3: Уменьшить счётчик назначенных
+        undone = cancelled + sum(1 for item, ok in zip(items, restored) if ok and item.get("counted", True))
+        total = add_assigned(-undone)
+        print(f"[UNDO] assigned_session_count = {total}")
         
-        # Шаг 4: Уменьшить счётчик назначенных
-        if assigned_session_count > 0:
-            assigned_session_count -= 1
-            print(f"[UNDO] Decreased assigned_session_count to {assigned_session_count}")
+        # Шаг 4: Неоткатившиеся карточки возвращаются в историю
+        if failed:
+            history.push_back(operator.session_id, {**last_action, "items": failed, "jobs": []})
+        restored_ids.extend(item['card_id'] for item, ok in zip(items, restored) if ok)
+        await lease_restored(restored_ids, operator)
+        state_broadcaster.notify()
         
-        # Шаг 5: Очистить last_action
-        last_action = None
-        print(f"[UNDO] Cleared last_action")
+        if failed:
+            failed_ids = [item['card_id'] for item in failed]
+            raise HTTPException(status_code=500, detail=f"Failed to move cards back to queue: {failed_ids}")
         
         print(f"\n[SUCCESS] ===== UNDO COMPLETE =====")
         print("="*60)
         
         # Возвращаем обновлённое состояние
         # Карточка должна снова появиться в очереди и стать current_card
-        return build_app_state()
+        return await build_app_state(operator=operator)
         
     except HTTPException:
         raise
@@ -751,38 +1484,127 @@ async def undo_last_action(username: str = Depends(get_current_user)):
         import traceback
         traceback.print_exc()
         print("="*60)
+        # Откат прервался - возвращаем действие, чтобы Undo можно было повторить
+        history.push_back(operator.session_id, last_action)
         raise HTTPException(status_code=500, detail=f"Failed to undo: {str(e)}")
 
+@app.get("/api/jobs", response_model=List[JobInfo])
+async def list_jobs(
+    status: Optional[str] = None,
+    limit: int = 50,
+    username: str = Depends(get_current_user)
+):
+    """
+    Задания отложенной записи в Kaiten
+    
+    Args:
+        status: Только задания с этим статусом (pending, running, done, failed...)
+        limit: Сколько последних заданий вернуть
+        
+    Returns:
+        List[JobInfo]: Задания от новых к старым
+    """
+    jobs = await asyncio.get_event_loop().run_in_executor(None, get_job_queue().list, status, min(limit, 500))
+    return [job_info(job) for job in jobs]
+
+@app.get("/api/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: int, username: str = Depends(get_current_user)):
+    """Статус задания отложенной записи"""
+    job = await asyncio.get_event_loop().run_in_executor(None, get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_info(job)
+
+@app.post("/api/jobs/{job_id}/retry", response_model=AppState)
+async def retry_job(job_id: int, operator: Operator = Depends(get_current_operator)):
+    """
+    Повторить неудавшееся задание
+    
+    Returns:
+        AppState: Обновленное состояние (карточка снова скрыта из очереди)
+    """
+    await start_job_worker()
+    job_queue = get_job_queue()
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(None, job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await loop.run_in_executor(None, job_queue.retry, job_id):
+        raise HTTPException(status_code=400, detail=f"Job is {job['status']}, only failed jobs can be retried")
+    
+    if job['card_id'] is not None:
+        get_queue_cache().index.hide(job['card_id'])
+        get_queue_cache().remove_card(job['card_id'])
+    add_assigned(1)
+    state_broadcaster.notify()
+    return await build_app_state(operator=operator)
+
+@app.post("/api/jobs/{job_id}/dismiss", response_model=AppState)
+async def dismiss_job(job_id: int, operator: Operator = Depends(get_current_operator)):
+    """
+    Скрыть уведомление о неудавшемся задании
+    
+    Returns:
+        AppState: Обновленное состояние
+    """
+    if not await asyncio.get_event_loop().run_in_executor(None, get_job_queue().dismiss, job_id):
+        raise HTTPException(status_code=404, detail="Failed job not found")
+    state_broadcaster.notify()
+    return await build_app_state(operator=operator)
+
+@app.get("/api/leases", response_model=List[LeaseInfo])
+async def list_leases(username: str = Depends(get_current_user)):
+    """
+    Какие карточки сейчас обрабатывают операторы
+    
+    Returns:
+        List[LeaseInfo]: Действующие аренды в порядке получения
+    """
+    queue_cards = await get_queue_cache().get()
+    entries = await asyncio.get_event_loop().run_in_executor(None, get_leases().items)
+    leases = []
+    for entry in entries:
+        card = queue_cards.get(entry["card_id"])
+        leases.append(LeaseInfo(
+            card_id=entry["card_id"],
+            incoming_no=card["_incoming_no"] if card else None,
+            username=entry["username"],
+            expires_at=datetime.fromtimestamp(entry["expires_at"])
+        ))
+    return leases
+
 @app.get("/files/{incoming_no}/{filename}")
 async def get_file(
+    request: Request,
     incoming_no: int, 
     filename: str, 
     token: Optional[str] = None,
+    v: Optional[str] = None,
+    exp: Optional[int] = None,
+    sig: Optional[str] = None,
     authorization: Optional[str] = Header(None)
 ):
     """
     Получить файл письма для просмотра в браузере
-    Поддерживает авторизацию через ?token=XXX или Authorization header
+    Поддерживает подписанные ссылки из FileInfo.url (?v=&exp=&sig=),
+    авторизацию через ?token=XXX или Authorization header,
+    условные запросы (304) и Range (206)
     
     Args:
         incoming_no: Входящий номер письма
         filename: Имя файла
         token: Опциональный токен авторизации через query parameter
+        v: Хэш содержимого файла (подписанная ссылка)
+        exp: Срок действия ссылки, unix time (подписанная ссылка)
+        sig: Подпись ссылки
         
     Returns:
-        FileResponse: Файл для просмотра
+        Response: Файл для просмотра
     """
     import mimetypes
     import urllib.parse
     
-    # Если токен передан через URL - проверяем его
-    if token:
-        verified_username = auth.verify_token(token)
-        if not verified_username:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        # Используем username из токена
-        username = verified_username
-    # Иначе username уже проверен через Depends(get_current_user)
+    verify_file_access(incoming_no, filename, token, authorization, v, exp, sig)
     
     # Защита от path traversal
     if ".." in filename or "/" in filename or "\\" in filename:
@@ -838,16 +1660,137 @@ async def get_file(
     else:
         content_disposition = f"attachment; filename*=UTF-8''{encoded_filename}"
     
-    return FileResponse(
-        path=str(file_path),
+    # Текстовые файлы отдаём из заранее сжатой копии, если браузер её принимает
+    encoded = await negotiate_precompressed(request, file_path, mime_type)
+    
+    # Браузер хранит файл, но перепроверяет его по ETag при каждом показе
+    cache_control = "private, no-cache"
+    if sig is not None:
+        # Ссылка привязана к содержимому: пока файл тот же, браузер и
+        # кэширующий прокси отдают его без запросов до конца срока ссылки
+        loop = asyncio.get_event_loop()
+        if await loop.run_in_executor(None, content_hash, file_path) == v:
+            cache_control = f"public, max-age={max(0, int(exp - time.time()))}, immutable"
+    
+    return build_file_response(
+        request,
+        file_path,
         media_type=mime_type,
         headers={
             "Content-Disposition": content_disposition
-        }
+        },
+        cache_control=cache_control,
+        encoded=encoded,
+        vary_encoding=is_compressible(mime_type)
+    )
+
+@app.get("/previews/{incoming_no}/{filename}")
+async def get_preview(
+    request: Request,
+    incoming_no: int,
+    filename: str,
+    width: int = 320,
+    token: Optional[str] = None,
+    v: Optional[str] = None,
+    exp: Optional[int] = None,
+    sig: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Получить превью файла письма (JPEG заданной ширины)
+    Для изображений - уменьшенная копия, для PDF - первая страница
+    
+    Args:
+        incoming_no: Входящий номер письма
+        filename: Имя файла
+        width: Нужная ширина в пикселях (округляется до ближайшей большей из набора)
+        token: Токен авторизации через query parameter (или Authorization header)
+        v, exp, sig: Подписанная ссылка из FileInfo.preview_url (вместо токена)
+        
+    Returns:
+        Response: JPEG превью
+    """
+    verify_file_access(incoming_no, filename, token, authorization, v, exp, sig)
+    
+    # Защита от path traversal
+    if ".." in filename or "/" in filename or "\\" in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    file_path = FILES_ROOT / str(incoming_no) / filename
+    if not file_path.exists() or not file_path.is_file():
+        raise HTTPException(status_code=404, detail=f"File not found: {filename}")
+    
+    ext = file_path.suffix.lstrip('.').lower()
+    preview_path = await get_preview_cache().get(file_path, ext, width)
+    if preview_path is None:
+        raise HTTPException(status_code=404, detail=f"Preview not available: {filename}")
+    
+    return build_file_response(
+        request,
+        preview_path,
+        media_type="image/jpeg",
+        headers={},
+        cache_control="private, no-cache"
+    )
+
+@app.get("/converted/{incoming_no}/{filename}")
+async def get_converted(
+    request: Request,
+    incoming_no: int,
+    filename: str,
+    token: Optional[str] = None,
+    v: Optional[str] = None,
+    exp: Optional[int] = None,
+    sig: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Получить Office-документ письма, сконвертированный в PDF
+    Конвертация локальная (LibreOffice), результат кэшируется по содержимому файла
+    
+    Args:
+        incoming_no: Входящий номер письма
+        filename: Имя исходного файла
+        token: Токен авторизации через query parameter (или Authorization header)
+        v, exp, sig: Подписанная ссылка из FileInfo.converted_url (вместо токена)
+        
+    Returns:
+        Response: PDF для просмотра
+    """
+    import urllib.parse
+    
+    verify_file_access(incoming_no, filename, token, authorization, v, exp, sig)
+    
+    # Защита от path traversal
+    if ".." in filename or "/" in filename or "\\" in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    file_path = FILES_ROOT / str(incoming_no) / filename
+    if not file_path.exists() or not file_path.is_file():
+        raise HTTPException(status_code=404, detail=f"File not found: {filename}")
+    
+    ext = file_path.suffix.lstrip('.').lower()
+    converter = get_converter()
+    if not converter.supports(ext):
+        raise HTTPException(status_code=404, detail=f"Conversion not available: {filename}")
+    
+    pdf_path = await converter.get(file_path, ext)
+    if pdf_path is None:
+        raise HTTPException(status_code=502, detail=f"Failed to convert: {filename}")
+    
+    encoded_filename = urllib.parse.quote(f"{file_path.stem}.pdf")
+    return build_file_response(
+        request,
+        pdf_path,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"inline; filename*=UTF-8''{encoded_filename}"
+        },
+        cache_control="private, no-cache"
     )
 
 @app.get("/public-files/{incoming_no}/{filename}")
-async def get_public_file(incoming_no: int, filename: str):
+async def get_public_file(request: Request, incoming_no: int, filename: str):
     """
     Публичный доступ к файлам для внешних viewers (Google Docs, Office Online)
     БЕЗ авторизации - используется только для просмотра через iframe
@@ -875,12 +1818,14 @@ async def get_public_file(incoming_no: int, filename: str):
     
     print(f"[DEBUG] Public file request: {incoming_no}/{filename}")
     
-    return FileResponse(
-        path=str(file_path),
+    return build_file_response(
+        request,
+        file_path,
         media_type=mime_type,
         headers={
             "Content-Disposition": f"inline; filename*=UTF-8''{encoded_filename}"
-        }
+        },
+        cache_control="public, no-cache"
     )
 
 # ============================================================================
@@ -893,6 +1838,7 @@ if __name__ == "__main__":
     # Получаем параметры из .env
     host = os.getenv("BACKEND_HOST", "0.0.0.0")
     port = int(os.getenv("BACKEND_PORT", "8000"))
+    workers = int(os.getenv("BACKEND_WORKERS", "1"))
     
     print(f"🚀 Starting Kaiten Inbox Backend (ЭТАП 5 + Auth)")
     print(f"📍 Server: http://{host}:{port}")
@@ -900,10 +1846,15 @@ if __name__ == "__main__":
     print(f"📁 Files root: {FILES_ROOT}")
     print(f"✅ Members-based assignment enabled!")
     print(f"🔒 Authentication enabled: {auth.VALID_USERNAME}")
+    print(f"🗄️ State backend: {state_store.backend}, workers: {workers}")
+    if workers > 1 and isinstance(state_store, MemoryStateStore):
+        print(f"⚠️ STATE_BACKEND=memory is per-process: sessions, Undo and deferred cards will not be shared between workers")
     
+    # reload несовместим с несколькими процессами
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
-        reload=True
+        reload=workers == 1,
+        workers=workers
     )
\ No newline at end of file
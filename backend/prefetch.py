@@ -0,0 +1,176 @@
+"""
+Упреждающая загрузка следующих писем
+После каждого изменения состояния в фоне прогреваются списки файлов
+и начала файлов следующих карточек очереди
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from files_cache import FilesCache, get_files_cache
+from previews import PreviewCache, get_preview_cache
+from conversions import DocumentConverter, get_converter
+
+# Загружаем переменные окружения
+load_dotenv()
+
+
+class Prefetcher:
+    """
+    Фоновый прогрев следующих писем
+
+    - schedule() - прогреть письма с указанными входящими номерами
+    - version() - хэш списков файлов писем, уже лежащих в FilesCache
+      (меняется, когда список появился или изменился)
+    - stats() - счётчики прогрева
+
+    Для каждого письма список файлов загружается в FilesCache, а первые
+    read_bytes байт каждого файла - в page cache ОС (posix_fadvise WILLNEED,
+    где он есть, иначе обычное чтение). Если заданы preview_cache и converter,
+    заранее строятся превью и PDF-версии Office-документов. Файловые операции выполняются в пуле потоков,
+    чтобы не блокировать event loop.
+
+    Новый вызов schedule() отменяет незаконченный прогрев: нужны только
+    письма, которые идут сразу за текущим.
+
+    Подсказки prefetch в AppState берутся из FilesCache, поэтому version()
+    входит в версию состояния, а on_warmed() вызывается после прогрева
+    списка - клиенты получают подсказки в следующем ответе или SSE-событии.
+    version() зависит только от самих списков (а не от счётчика процесса),
+    поэтому у процессов backend, прогревших те же письма, она одинаковая.
+    """
+
+    def __init__(
+        self,
+        files_cache: FilesCache,
+        count: int,
+        read_bytes: int,
+        preview_cache: Optional[PreviewCache] = None,
+        preview_width: int = 320,
+        converter: Optional[DocumentConverter] = None,
+        on_warmed: Optional[Callable[[], None]] = None
+    ):
+        self.files_cache = files_cache
+        self.count = count
+        self.read_bytes = read_bytes
+        self.preview_cache = preview_cache
+        self.preview_width = preview_width
+        self.converter = converter
+        self.on_warmed = on_warmed
+
+        self._scheduled: Tuple[int, ...] = ()
+        self._task: Optional[asyncio.Future] = None
+
+        self.runs = 0
+        self.warmed_cards = 0
+        self.warmed_files = 0
+        self.errors = 0
+
+    def version(self, incoming_nos: List[int]) -> str:
+        """
+        Версия подсказок для писем - по спискам файлов, уже лежащих в FilesCache
+
+        Args:
+            incoming_nos: Входящие номера писем, для которых строятся подсказки
+
+        Returns:
+            str: Хэш прогретых списков файлов
+        """
+        warmed = [[incoming_no, self.files_cache.peek(incoming_no)] for incoming_no in incoming_nos]
+        raw = json.dumps(warmed, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def schedule(self, incoming_nos: List[int]):
+        """
+        Прогреть письма в фоне (повторный вызов с теми же номерами ничего не делает)
+
+        Args:
+            incoming_nos: Входящие номера следующих писем по порядку
+        """
+        incoming_nos = tuple(incoming_nos[:self.count])
+        if not incoming_nos or incoming_nos == self._scheduled:
+            return
+
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+        self._scheduled = incoming_nos
+        self._task = asyncio.ensure_future(self._warm(incoming_nos))
+
+    async def _warm(self, incoming_nos: Tuple[int, ...]):
+        loop = asyncio.get_event_loop()
+        self.runs += 1
+        try:
+            for incoming_no in incoming_nos:
+                listed = self.files_cache.peek(incoming_no)
+                files = await loop.run_in_executor(None, self.files_cache.list_files, incoming_no)
+                if self.files_cache.peek(incoming_no) != listed:
+                    # Подсказка для письма появилась или изменилась - новая версия состояния
+                    if self.on_warmed is not None:
+                        self.on_warmed()
+                for file in files:
+                    path = self.files_cache.files_root / str(incoming_no) / file["name"]
+                    await loop.run_in_executor(None, self._read_ahead, path)
+                    if self.preview_cache is not None:
+                        await self.preview_cache.get(path, file["ext"], self.preview_width)
+                    if self.converter is not None:
+                        await self.converter.get(path, file["ext"])
+                self.warmed_cards += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Прогрев - только оптимизация, ошибку не пробрасываем
+            self.errors += 1
+            self._scheduled = ()
+            print(f"[PREFETCH] Failed to warm {incoming_nos}: {e}")
+
+    def _read_ahead(self, path: Path):
+        if self.read_bytes <= 0:
+            return
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            if hasattr(os, "posix_fadvise"):
+                # Ядро читает файл в page cache само, без копирования в процесс
+                os.posix_fadvise(fd, 0, self.read_bytes, os.POSIX_FADV_WILLNEED)
+            else:
+                os.read(fd, self.read_bytes)
+            self.warmed_files += 1
+        finally:
+            os.close(fd)
+
+    def stats(self) -> Dict:
+        """Статистика прогрева"""
+        return {
+            "count": self.count,
+            "scheduled": list(self._scheduled),
+            "runs": self.runs,
+            "warmed_cards": self.warmed_cards,
+            "warmed_files": self.warmed_files,
+            "errors": self.errors,
+        }
+
+
+# Singleton instance
+_prefetcher = None
+
+def get_prefetcher() -> Prefetcher:
+    """Получить единственный экземпляр Prefetcher"""
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = Prefetcher(
+            get_files_cache(),
+            count=int(os.getenv("PREFETCH_COUNT", "2")),
+            read_bytes=int(os.getenv("PREFETCH_READ_BYTES", str(1024 * 1024))),
+            preview_cache=get_preview_cache() if os.getenv("PREFETCH_PREVIEWS", "1") == "1" else None,
+            converter=get_converter() if os.getenv("PREFETCH_CONVERSIONS", "1") == "1" else None
+        )
+    return _prefetcher
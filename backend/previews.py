@@ -0,0 +1,230 @@
+"""
+Превью вложений
+Уменьшенные изображения и первая страница PDF в JPEG.
+Рендеринг - в отдельных процессах, результат - в дисковом кэше по хэшу содержимого
+"""
+
+import asyncio
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from disk_cache import DiskLRU
+from files_cache import content_hash
+
+# Загружаем переменные окружения
+load_dotenv()
+
+IMAGE_EXTS = {"jpg", "jpeg", "png", "gif", "webp", "bmp", "tif", "tiff"}
+
+# Запрошенная ширина округляется вверх до одной из этих -
+# иначе каждая ширина окна браузера давала бы отдельный файл в кэше
+PREVIEW_WIDTHS = (160, 320, 640, 1280)
+
+
+def render_preview(source: str, ext: str, width: int, target: str):
+    """
+    Отрендерить превью (выполняется в процессе пула)
+
+    Args:
+        source: Путь к исходному файлу
+        ext: Расширение исходного файла
+        width: Ширина превью в пикселях
+        target: Куда сохранить JPEG
+    """
+    target_dir = os.path.dirname(target)
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        if ext == "pdf":
+            # pdftoppm сам добавляет расширение к префиксу
+            prefix = tmp_path[:-len(".tmp")]
+            subprocess.run(
+                [
+                    "pdftoppm", "-f", "1", "-l", "1", "-singlefile", "-jpeg",
+                    "-scale-to-x", str(width), "-scale-to-y", "-1",
+                    source, prefix
+                ],
+                check=True,
+                capture_output=True,
+                timeout=60
+            )
+            os.replace(prefix + ".jpg", tmp_path)
+        else:
+            from PIL import Image, ImageOps
+
+            with Image.open(source) as image:
+                # Для JPEG декодер сразу читает уменьшенную копию
+                image.draft("RGB", (width, width * 4))
+                image = ImageOps.exif_transpose(image)
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                else:
+                    image = image.convert("RGB")
+                image.thumbnail((width, width * 4))
+                image.save(tmp_path, "JPEG", quality=80, optimize=True)
+
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class PreviewCache:
+    """
+    Превью вложений с дисковым LRU-кэшем
+
+    - supports() - можно ли построить превью для расширения
+    - get() - путь к готовому превью (рендерит при первом запросе)
+    - stats() - попадания/промахи, размер кэша
+
+    Имя файла в кэше - sha256 содержимого и ширина, поэтому одинаковые
+    вложения в разных письмах рендерятся один раз, а изменённый файл
+    получает новое превью. Одновременные запросы одного превью ждут
+    один рендеринг. Когда кэш больше max_bytes, удаляются давно
+    не запрашивавшиеся превью.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, workers: int):
+        self.workers = workers
+
+        self._disk = DiskLRU(cache_dir, max_bytes, "*/*.jpg")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pdf_supported = shutil.which("pdftoppm") is not None
+        try:
+            import PIL  # noqa: F401
+            self._images_supported = True
+        except ImportError:
+            self._images_supported = False
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def supports(self, ext: str) -> bool:
+        """Можно ли построить превью для файла с таким расширением"""
+        if ext == "pdf":
+            return self._pdf_supported
+        return ext in IMAGE_EXTS and self._images_supported
+
+    @staticmethod
+    def snap_width(width: int) -> int:
+        """Ширина из PREVIEW_WIDTHS, не меньше запрошенной (или максимальная)"""
+        for allowed in PREVIEW_WIDTHS:
+            if width <= allowed:
+                return allowed
+        return PREVIEW_WIDTHS[-1]
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: дочерний процесс не наследует потоки и сокеты сервера
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def get(self, source: Path, ext: str, width: int) -> Optional[Path]:
+        """
+        Получить превью файла
+
+        Args:
+            source: Путь к исходному файлу
+            ext: Расширение файла
+            width: Запрошенная ширина
+
+        Returns:
+            Optional[Path]: Путь к JPEG или None, если превью не построить
+        """
+        if not self.supports(ext):
+            return None
+
+        loop = asyncio.get_event_loop()
+        width = self.snap_width(width)
+        try:
+            digest = await loop.run_in_executor(None, content_hash, source)
+        except OSError as e:
+            print(f"[PREVIEW] Failed to hash {source}: {e}")
+            return None
+
+        name = f"{digest[:2]}/{digest}-{width}.jpg"
+        cached = self._disk.lookup(name)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        future = self._inflight.get(name)
+        if future is None:
+            future = asyncio.ensure_future(self._render(source, ext, width, name))
+            self._inflight[name] = future
+        return await asyncio.shield(future)
+
+    async def _render(self, source: Path, ext: str, width: int, name: str) -> Optional[Path]:
+        loop = asyncio.get_event_loop()
+        target = self._disk.path(name)
+        try:
+            target.parent.mkdir(exist_ok=True)
+            await loop.run_in_executor(
+                self._get_pool(), render_preview, str(source), ext, width, str(target)
+            )
+            size = self._disk.add(name)
+        except BrokenProcessPool as e:
+            # Процесс пула упал - следующий рендеринг создаст новый пул
+            self.errors += 1
+            self._pool = None
+            print(f"[PREVIEW] Render pool broken, restarting: {e}")
+            return None
+        except Exception as e:
+            self.errors += 1
+            print(f"[PREVIEW] Failed to render {source} at {width}px: {e}")
+            return None
+        finally:
+            self._inflight.pop(name, None)
+
+        print(f"[PREVIEW] Rendered {source.name} at {width}px ({size} bytes)")
+        return target
+
+    def close(self):
+        """Остановить процессы рендеринга"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def stats(self) -> Dict:
+        """Статистика кэша превью"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            **self._disk.stats(),
+            "pdf_supported": self._pdf_supported,
+            "images_supported": self._images_supported,
+        }
+
+
+# Singleton instance
+_preview_cache = None
+
+def get_preview_cache() -> PreviewCache:
+    """Получить единственный экземпляр PreviewCache"""
+    global _preview_cache
+    if _preview_cache is None:
+        _preview_cache = PreviewCache(
+            Path(os.getenv("PREVIEW_CACHE_DIR", "../preview_cache")),
+            max_bytes=int(os.getenv("PREVIEW_CACHE_MAX_MB", "512")) * 1024 * 1024,
+            workers=int(os.getenv("PREVIEW_WORKERS", "2"))
+        )
+    return _preview_cache
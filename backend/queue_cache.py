@@ -0,0 +1,279 @@
+"""
+Кэш очереди
+Общее для процесса локальное зеркало колонки "Очередь" с TTL,
+инкрементальной синхронизацией и single-flight обновлением
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from kaiten_client import KaitenClient, get_kaiten_client
+from queue_index import QueueIndex
+from state_store import StateStore, get_state_store
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Счётчик локальных изменений очереди в общем хранилище
+CHANGES_COUNTER = "queue.changes"
+
+
+class QueueCache:
+    """
+    Зеркало очереди поверх QueueIndex
+
+    - get() - вернуть индекс очереди (синхронизировав его, если TTL истёк)
+    - get_snapshot() - индекс очереди вместе с его версией
+    - invalidate() - потребовать полную синхронизацию
+    - remove_card()/upsert_card() - поправить зеркало на месте,
+      когда изменение известно заранее (без запроса к Kaiten)
+    - stats() - счётчики попаданий/промахов и синхронизаций
+
+    Когда TTL истёк, из Kaiten загружаются только карточки, изменённые
+    после последней синхронизации (updated_after). Полная загрузка колонки -
+    при старте, после invalidate(), раз в QUEUE_FULL_SYNC_INTERVAL секунд
+    (ловит архивированные и удалённые карточки) и если дельту получить не удалось.
+
+    Если Kaiten недоступен, отдаётся последний удачный снимок (а не пустая
+    очередь); следующая попытка синхронизации - не раньше чем через TTL.
+
+    Если задано общее хранилище состояния, локальные правки зеркала
+    увеличивают в нём счётчик изменений очереди. Другие процессы backend,
+    увидев новое значение, досинхронизируются с Kaiten, не дожидаясь TTL.
+
+    Одновременные запросы ждут одну общую синхронизацию (single-flight).
+    Индекс общий для всех - читатели не должны его изменять.
+    """
+
+    def __init__(
+        self,
+        client: KaitenClient,
+        ttl: float,
+        full_sync_interval: float,
+        delta_sync: bool = True,
+        store: Optional[StateStore] = None
+    ):
+        self.client = client
+        self.store = store
+        self.ttl = ttl
+        self.full_sync_interval = full_sync_interval
+        self.delta_sync = delta_sync
+
+        self._index = QueueIndex()
+        self._loaded = False
+        self._has_snapshot = False  # Была хотя бы одна удачная полная синхронизация
+        self._retry_at = 0.0  # До этого момента после сбоя отдаём прежний снимок
+        self._watermark: Optional[str] = None  # Максимальный updated среди увиденных карточек
+        self._synced_at = 0.0
+        self._full_synced_at = 0.0
+        self._generation = 0  # Увеличивается при локальных изменениях
+        self._inflight: Optional[asyncio.Future] = None
+        self._seen_changes = store.counter(CHANGES_COUNTER) if store is not None else 0
+
+        self.hits = 0
+        self.misses = 0
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.failed_syncs = 0
+
+    @property
+    def index(self) -> QueueIndex:
+        """Индекс очереди (один и тот же объект на всё время работы)"""
+        return self._index
+
+    @property
+    def version(self) -> str:
+        """
+        Версия зеркала - меняется только при реальном изменении очереди
+        Зависит только от содержимого, поэтому совпадает у всех процессов backend
+        """
+        return f"{len(self._index)}.{self._index.digest:016x}"
+
+    def _is_fresh(self) -> bool:
+        now = time.monotonic()
+        if self._loaded and now - self._synced_at < self.ttl:
+            return True
+        return self._has_snapshot and now < self._retry_at
+
+    async def get(self) -> QueueIndex:
+        """
+        Получить индекс очереди
+
+        Returns:
+            QueueIndex: Карточки очереди с _incoming_no, упорядоченные по номеру
+        """
+        index, _ = await self.get_snapshot()
+        return index
+
+    async def get_snapshot(self) -> Tuple[QueueIndex, str]:
+        """
+        Получить индекс очереди и его версию
+
+        Returns:
+            Tuple[QueueIndex, str]: Индекс очереди и версия
+        """
+        if self.store is not None:
+            changes = self.store.counter(CHANGES_COUNTER)
+            if changes != self._seen_changes:
+                # Очередь поправил другой процесс - подтягиваем изменения
+                self._seen_changes = changes
+                self._synced_at = 0.0
+                self._retry_at = 0.0
+
+        if self._is_fresh():
+            self.hits += 1
+            return self._index, self.version
+
+        self.misses += 1
+
+        # Присоединяемся к уже идущей синхронизации или запускаем новую
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._sync(self._generation))
+
+        # shield: отмена одного ожидающего запроса не отменяет общую синхронизацию
+        await asyncio.shield(self._inflight)
+        return self._index, self.version
+
+    def _advance_watermark(self, card: Dict):
+        updated = card.get("updated")
+        if updated and (self._watermark is None or updated > self._watermark):
+            self._watermark = updated
+
+    async def _sync(self, generation: int):
+        task = self._inflight
+        try:
+            now = time.monotonic()
+            need_full = (
+                not self._loaded
+                or not self.delta_sync
+                or self._watermark is None
+                or now - self._full_synced_at >= self.full_sync_interval
+            )
+
+            if not need_full:
+                try:
+                    changes = await self.client.get_changed_cards(self._watermark)
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"[CACHE] Delta sync failed, falling back to full sync: {e}")
+                    need_full = True
+
+            if need_full:
+                try:
+                    cards = await self.client.get_queue_cards_with_incoming_no()
+                except (httpx.HTTPError, ValueError) as e:
+                    if not self._has_snapshot:
+                        raise
+                    self.failed_syncs += 1
+                    self._retry_at = now + self.ttl
+                    print(f"[CACHE] Full sync failed, serving stale queue snapshot: {e}")
+                    return
+                self.full_syncs += 1
+
+            # Пока шёл запрос, зеркало поправили локально - ответ мог устареть.
+            # Водяной знак не двигаем: следующая синхронизация увидит изменения
+            if generation != self._generation:
+                print(f"[CACHE] Queue changed during sync, result discarded")
+                return
+
+            if need_full:
+                changed = self._index.replace_all(cards)
+                for card in cards:
+                    self._advance_watermark(card)
+                self._full_synced_at = now
+                self._loaded = True
+                self._has_snapshot = True
+                print(f"[CACHE] Full sync: {len(cards)} cards, {changed} changed")
+            else:
+                self.delta_syncs += 1
+                changed = 0
+                for card in changes:
+                    if card["column_id"] == self.client.column_queue_id and card["_incoming_no"] is not None:
+                        changed += self._index.upsert(card)
+                    else:
+                        changed += self._index.remove(card["id"])
+                    self._advance_watermark(card)
+                print(f"[CACHE] Delta sync: {len(changes)} changed cards, {changed} applied")
+
+            self._synced_at = now
+        finally:
+            if self._inflight is task:
+                self._inflight = None
+
+    def invalidate(self):
+        """Потребовать полную синхронизацию при следующем обращении"""
+        self._generation += 1
+        self._loaded = False
+        self._retry_at = 0.0
+        self._inflight = None
+        self._publish_change()
+        print(f"[CACHE] Queue cache invalidated")
+
+    def _local_change(self):
+        # Идущая синхронизация могла начаться до изменения - её результат не применяем
+        self._generation += 1
+        self._inflight = None
+        self._publish_change()
+
+    def _publish_change(self):
+        if self.store is not None:
+            self._seen_changes = self.store.incr(CHANGES_COUNTER)
+
+    def remove_card(self, card_id: int):
+        """
+        Убрать карточку из зеркала (она ушла из очереди, например после assign)
+
+        Args:
+            card_id: ID карточки
+        """
+        self._local_change()
+        if self._index.remove(card_id):
+            print(f"[CACHE] Card {card_id} removed from queue mirror")
+
+    def upsert_card(self, card: Dict):
+        """
+        Добавить или обновить карточку в зеркале (например, после undo)
+
+        Args:
+            card: Данные карточки с заполненным _incoming_no
+        """
+        self._local_change()
+        trimmed = self.client.trim_card(card)
+        trimmed["_incoming_no"] = card["_incoming_no"]
+        if self._index.upsert(trimmed):
+            print(f"[CACHE] Card {card['id']} added to queue mirror")
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "full_syncs": self.full_syncs,
+            "delta_syncs": self.delta_syncs,
+            "failed_syncs": self.failed_syncs,
+            "cached_cards": len(self._index) if self._loaded else None,
+            "age": round(time.monotonic() - self._synced_at, 3) if self._loaded else None,
+            "version": self.version,
+        }
+
+
+# Singleton instance
+_queue_cache = None
+
+def get_queue_cache() -> QueueCache:
+    """Получить единственный экземпляр QueueCache"""
+    global _queue_cache
+    if _queue_cache is None:
+        _queue_cache = QueueCache(
+            get_kaiten_client(),
+            ttl=float(os.getenv("QUEUE_CACHE_TTL", "5")),
+            full_sync_interval=float(os.getenv("QUEUE_FULL_SYNC_INTERVAL", "300")),
+            delta_sync=os.getenv("QUEUE_DELTA_SYNC", "1") == "1",
+            store=get_state_store()
+        )
+    return _queue_cache
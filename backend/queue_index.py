@@ -0,0 +1,212 @@
+"""
+Индекс очереди
+Локальное зеркало колонки "Очередь", упорядоченное по входящему номеру
+"""
+
+import hashlib
+import json
+import math
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sortedcontainers import SortedList
+
+
+class QueueIndex:
+    """
+    Карточки очереди, отсортированные по (incoming_no, card_id)
+
+    - upsert() - добавить или обновить карточку
+    - remove() - убрать карточку
+    - replace_all() - синхронизировать с полным списком карточек
+    - first()/last() - первая и последняя карточка по номеру
+    - hide()/unhide() - скрыть карточку из выбора (отложенные карточки)
+    - first_visible()/iter_visible() - то же только по нескрытым карточкам
+    - итерация - карточки по возрастанию входящего номера
+
+    Ключи хранятся в SortedList: вставка и удаление - O(log n), первая
+    и последняя карточка - O(log n), сортировка всего списка при опросе
+    не нужна (в обычном списке bisect.insort сдвигает элементы - O(n)).
+
+    digest - XOR хэшей содержимого карточек: меняется только при реальном
+    изменении карточек (скрытие его не меняет) и не зависит от порядка
+    изменений, поэтому у процессов с одинаковой очередью он одинаковый.
+    Скрытие переживает удаление и повторное добавление карточки.
+    """
+
+    def __init__(self):
+        self._keys = SortedList()          # (incoming_no, card_id)
+        self._visible_keys = SortedList()  # То же без скрытых карточек
+        self._cards: Dict[int, Dict] = {}               # card_id -> карточка
+        self._hidden: Set[int] = set()
+        self.digest = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, card_id: int) -> bool:
+        return card_id in self._cards
+
+    def __iter__(self) -> Iterator[Dict]:
+        for _, card_id in self._keys:
+            yield self._cards[card_id]
+
+    @staticmethod
+    def _key(card: Dict) -> Tuple[int, int]:
+        return card["_incoming_no"], card["id"]
+
+    @staticmethod
+    def _hash(card: Dict) -> int:
+        # Стабильный между процессами хэш (встроенный hash() строк случаен)
+        raw = json.dumps(card, sort_keys=True, ensure_ascii=False, default=str)
+        return int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def get(self, card_id: int) -> Optional[Dict]:
+        """Карточка по ID или None"""
+        return self._cards.get(card_id)
+
+    def first(self) -> Optional[Dict]:
+        """Карточка с минимальным входящим номером"""
+        if not self._keys:
+            return None
+        return self._cards[self._keys[0][1]]
+
+    def last(self) -> Optional[Dict]:
+        """Карточка с максимальным входящим номером"""
+        if not self._keys:
+            return None
+        return self._cards[self._keys[-1][1]]
+
+    def first_visible(self) -> Optional[Dict]:
+        """Нескрытая карточка с минимальным входящим номером"""
+        if not self._visible_keys:
+            return None
+        return self._cards[self._visible_keys[0][1]]
+
+    def is_visible(self, card_id: int) -> bool:
+        """Есть ли карточка в индексе и не скрыта ли она"""
+        return card_id in self._cards and card_id not in self._hidden
+
+    def iter_visible(self, after: Optional[int] = None, up_to: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Нескрытые карточки по возрастанию входящего номера
+
+        Начало диапазона находится поиском - O(log n), карточки до него не
+        просматриваются. Каждая следующая карточка ищется заново после
+        предыдущего ключа, поэтому итератор можно продолжать после изменения
+        индекса (между шагами build_app_state ждёт Kaiten).
+
+        Args:
+            after: Только карточки с incoming_no > after
+            up_to: Только карточки с incoming_no <= up_to
+        """
+        key = (after, math.inf) if after is not None else None
+        maximum = (up_to, math.inf) if up_to is not None else None
+        while True:
+            keys = self._visible_keys.irange(key, maximum, inclusive=(False, True))
+            key = next(keys, None)
+            if key is None:
+                return
+            yield self._cards[key[1]]
+
+    def hide(self, card_id: int):
+        """Скрыть карточку из first_visible()/iter_visible()"""
+        if card_id in self._hidden:
+            return
+        self._hidden.add(card_id)
+        card = self._cards.get(card_id)
+        if card is not None:
+            self._visible_keys.discard(self._key(card))
+
+    def unhide(self, card_id: int):
+        """Вернуть карточку в выбор"""
+        if card_id not in self._hidden:
+            return
+        self._hidden.discard(card_id)
+        card = self._cards.get(card_id)
+        if card is not None:
+            self._visible_keys.add(self._key(card))
+
+    def _insert_key(self, key: Tuple[int, int]):
+        self._keys.add(key)
+        if key[1] not in self._hidden:
+            self._visible_keys.add(key)
+
+    def _delete_key(self, key: Tuple[int, int]):
+        self._keys.discard(key)
+        if key[1] not in self._hidden:
+            self._visible_keys.discard(key)
+
+    def upsert(self, card: Dict) -> bool:
+        """
+        Добавить карточку или обновить существующую
+
+        Args:
+            card: Карточка с id, title и _incoming_no
+
+        Returns:
+            bool: True если индекс изменился
+        """
+        card_id = card["id"]
+        existing = self._cards.get(card_id)
+
+        if existing is not None:
+            if existing == card:
+                return False
+            if self._key(existing) != self._key(card):
+                self._delete_key(self._key(existing))
+                self._insert_key(self._key(card))
+            self.digest ^= self._hash(existing)
+        else:
+            self._insert_key(self._key(card))
+
+        self._cards[card_id] = card
+        self.digest ^= self._hash(card)
+        return True
+
+    def remove(self, card_id: int) -> bool:
+        """
+        Убрать карточку из индекса
+
+        Args:
+            card_id: ID карточки
+
+        Returns:
+            bool: True если карточка была в индексе
+        """
+        card = self._cards.pop(card_id, None)
+        if card is None:
+            return False
+        self._delete_key(self._key(card))
+        self.digest ^= self._hash(card)
+        return True
+
+    def replace_all(self, cards: List[Dict]) -> int:
+        """
+        Привести индекс к полному списку карточек (после полной синхронизации)
+        Меняются только отличающиеся карточки
+
+        Args:
+            cards: Все карточки очереди
+
+        Returns:
+            int: Сколько карточек изменилось
+        """
+        if not self._cards:
+            # Пустой индекс - одна сортировка вместо вставок по одной
+            self._cards = {card["id"]: card for card in cards}
+            self._keys = SortedList(self._key(card) for card in self._cards.values())
+            self._visible_keys = SortedList(key for key in self._keys if key[1] not in self._hidden)
+            self.digest = 0
+            for card in self._cards.values():
+                self.digest ^= self._hash(card)
+            return len(self._cards)
+
+        changed = 0
+        incoming_ids = {card["id"] for card in cards}
+
+        for card_id in [card_id for card_id in self._cards if card_id not in incoming_ids]:
+            changed += self.remove(card_id)
+        for card in cards:
+            changed += self.upsert(card)
+
+        return changed
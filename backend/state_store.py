@@ -0,0 +1,644 @@
+"""
+Общее хранилище состояния
+Счётчики, последнее действие (Undo), отложенные карточки и сессии -
+в памяти процесса, в SQLite или в Redis (для нескольких процессов backend)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# redis необязателен: нужен только для STATE_BACKEND=redis
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Как часто удалять истёкшие значения, которые никто не запрашивает
+# (например, брошенные сессии), секунды
+SWEEP_INTERVAL = 60.0
+
+
+class StateStore(ABC):
+    """
+    Интерфейс хранилища состояния
+
+    - get()/set()/delete() - значения (JSON) по ключу, с необязательным TTL
+    - pop() - прочитать и удалить значение одной атомарной операцией
+    - setdefault() - записать значение, только если ключа ещё нет (атомарно)
+    - counter()/incr() - целочисленные счётчики (incr атомарен)
+    - ordered_add()/ordered_remove()/ordered_items() - упорядоченные
+      коллекции: элементы по ключу в порядке добавления, повторное
+      добавление не меняет место элемента
+    - ordered_replace() - заменить значение элемента, если оно не менялось
+      (compare-and-swap); ordered_remove() с expected - удалить так же
+    - ordered_version() - меняется при каждом изменении коллекции
+    - stats() - сведения о хранилище
+
+    Все изменения атомарны относительно других процессов, которые
+    работают с тем же хранилищем (кроме MemoryStateStore - он живёт
+    внутри одного процесса).
+    """
+
+    backend = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Значение по ключу или None (ключа нет или истёк TTL)"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Записать значение (ttl - срок жизни в секундах, None - бессрочно)"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Удалить значение"""
+
+    @abstractmethod
+    def pop(self, key: str) -> Optional[Any]:
+        """Прочитать и удалить значение (атомарно)"""
+
+    @abstractmethod
+    def setdefault(self, key: str, value: Any) -> Any:
+        """
+        Записать значение (без TTL), если ключа нет
+
+        Returns:
+            Any: Значение, которое в итоге хранится по ключу
+        """
+
+    @abstractmethod
+    def counter(self, name: str) -> int:
+        """Значение счётчика (0, если счётчика ещё нет)"""
+
+    @abstractmethod
+    def incr(self, name: str, delta: int = 1, minimum: Optional[int] = None) -> int:
+        """
+        Изменить счётчик
+
+        Args:
+            name: Имя счётчика
+            delta: На сколько изменить
+            minimum: Нижняя граница значения (None - без ограничения)
+
+        Returns:
+            int: Новое значение
+        """
+
+    @abstractmethod
+    def ordered_add(self, name: str, member: Any, value: Any) -> bool:
+        """
+        Добавить элемент в упорядоченную коллекцию
+
+        Returns:
+            bool: True если добавлен (False - элемент с таким ключом уже есть)
+        """
+
+    @abstractmethod
+    def ordered_remove(self, name: str, member: Any, expected: Any = None) -> bool:
+        """
+        Убрать элемент из упорядоченной коллекции
+
+        Args:
+            name: Коллекция
+            member: Ключ элемента
+            expected: Удалить, только если значение элемента равно этому
+                (None - удалить в любом случае)
+
+        Returns:
+            bool: True если элемент удалён
+        """
+
+    @abstractmethod
+    def ordered_replace(self, name: str, member: Any, expected: Any, value: Any) -> bool:
+        """
+        Заменить значение элемента, если оно равно expected (место не меняется)
+
+        Returns:
+            bool: True если значение заменено
+        """
+
+    @abstractmethod
+    def ordered_items(self, name: str) -> List[Any]:
+        """Значения коллекции в порядке добавления"""
+
+    @abstractmethod
+    def ordered_drop(self, name: str) -> bool:
+        """
+        Удалить пустую коллекцию вместе с её версией (для коллекций с
+        уникальным именем, например по сессии, чтобы они не копились)
+
+        Returns:
+            bool: True если удалена (False - в коллекции есть элементы)
+        """
+
+    def ordered_version(self, name: str) -> int:
+        """Версия коллекции (меняется при каждом изменении)"""
+        return self.counter(f"{name}.version")
+
+    def stats(self) -> Dict:
+        """Сведения о хранилище"""
+        return {"backend": self.backend}
+
+    def close(self):
+        """Закрыть соединение с хранилищем"""
+
+
+class MemoryStateStore(StateStore):
+    """
+    Хранилище в памяти процесса
+
+    Прежнее поведение: состояние теряется при перезапуске и не видно
+    другим процессам - годится только для одного процесса backend.
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}  # ключ -> (значение, истекает)
+        self._counters: Dict[str, int] = {}
+        self._ordered: Dict[str, "OrderedDict[str, Any]"] = {}
+        self._next_sweep = time.time() + SWEEP_INTERVAL
+        self.swept = 0
+
+    def _sweep(self):
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        expired = [key for key, (_, expires_at) in self._values.items() if expires_at is not None and now >= expires_at]
+        for key in expired:
+            del self._values[key]
+        self.swept += len(expired)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.time() >= expires_at:
+            del self._values[key]
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._sweep()
+        # Храним копию через JSON - как и остальные хранилища
+        self._values[key] = (json.loads(json.dumps(value)), time.time() + ttl if ttl else None)
+
+    def delete(self, key: str):
+        self._values.pop(key, None)
+
+    def pop(self, key: str) -> Optional[Any]:
+        value = self.get(key)
+        self._values.pop(key, None)
+        return value
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        current = self.get(key)
+        if current is not None:
+            return current
+        self.set(key, value)
+        return self.get(key)
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def incr(self, name: str, delta: int = 1, minimum: Optional[int] = None) -> int:
+        value = self._counters.get(name, 0) + delta
+        if minimum is not None:
+            value = max(minimum, value)
+        self._counters[name] = value
+        return value
+
+    def ordered_add(self, name: str, member: Any, value: Any) -> bool:
+        items = self._ordered.setdefault(name, OrderedDict())
+        if str(member) in items:
+            return False
+        items[str(member)] = json.loads(json.dumps(value))
+        self.incr(f"{name}.version")
+        return True
+
+    def ordered_remove(self, name: str, member: Any, expected: Any = None) -> bool:
+        items = self._ordered.get(name)
+        if not items or str(member) not in items:
+            return False
+        if expected is not None and items[str(member)] != json.loads(json.dumps(expected)):
+            return False
+        del items[str(member)]
+        self.incr(f"{name}.version")
+        return True
+
+    def ordered_replace(self, name: str, member: Any, expected: Any, value: Any) -> bool:
+        items = self._ordered.get(name)
+        if not items or items.get(str(member)) != json.loads(json.dumps(expected)):
+            return False
+        items[str(member)] = json.loads(json.dumps(value))
+        self.incr(f"{name}.version")
+        return True
+
+    def ordered_items(self, name: str) -> List[Any]:
+        return list(self._ordered.get(name, {}).values())
+
+    def ordered_drop(self, name: str) -> bool:
+        if self._ordered.get(name):
+            return False
+        self._ordered.pop(name, None)
+        self._counters.pop(f"{name}.version", None)
+        return True
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "values": len(self._values), "swept": self.swept}
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ordered (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    member TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE (name, member)
+);
+"""
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Хранилище в файле SQLite (режим WAL)
+
+    Переживает перезапуск и общее для всех процессов на одной машине
+    (uvicorn --workers N). Изменения идут в транзакциях BEGIN IMMEDIATE,
+    поэтому чтение-изменение-запись атомарны между процессами.
+
+    Счётчики и версии коллекций читаются при каждом опросе состояния,
+    поэтому их значения кэшируются в процессе на cache_ttl секунд:
+    изменения этого процесса видны сразу (запись сбрасывает кэш), других
+    процессов - не позже чем через cache_ttl. Атомарные операции
+    (incr, ordered_*) всегда работают с файлом, а не с кэшем.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, db_path: Path, cache_ttl: float = 0.0):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_ttl = cache_ttl
+
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL NORMAL не теряет согласованность, но не ждёт fsync на
+        # каждом COMMIT - блокировка записи держится меньше
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")  # Ждём, пока другой процесс допишет
+        self._db.executescript(SQLITE_SCHEMA)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Tuple[int, float]] = {}  # имя -> (значение, годно до)
+        self._next_sweep = time.time() + SWEEP_INTERVAL
+        self.swept = 0
+        self.cache_hits = 0
+
+    def _read(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _transaction(self, operation):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def get(self, key: str) -> Optional[Any]:
+        rows = self._read("SELECT value, expires_at FROM kv WHERE key = ?", (key,))
+        if not rows:
+            return None
+        value, expires_at = rows[0]
+        if expires_at is not None and time.time() >= expires_at:
+            self._transaction(lambda db: db.execute(
+                "DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, time.time())
+            ))
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        sweep = now >= self._next_sweep
+        if sweep:
+            self._next_sweep = now + SWEEP_INTERVAL
+
+        def operation(db):
+            db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl else None)
+            )
+            if sweep:
+                return db.execute("DELETE FROM kv WHERE expires_at <= ?", (now,)).rowcount
+            return 0
+        self.swept += self._transaction(operation)
+
+    def delete(self, key: str):
+        self._transaction(lambda db: db.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    def pop(self, key: str) -> Optional[Any]:
+        def operation(db):
+            row = db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+            return row
+        row = self._transaction(operation)
+        if row is None or (row[1] is not None and time.time() >= row[1]):
+            return None
+        return json.loads(row[0])
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        def operation(db):
+            db.execute("DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, time.time()))
+            db.execute("INSERT OR IGNORE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+            return db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0]
+        return json.loads(self._transaction(operation))
+
+    def counter(self, name: str) -> int:
+        # Чтение и запись в кэш под той же блокировкой, что и транзакции -
+        # значение, прочитанное до чужого COMMIT в этом процессе, не попадёт в кэш после него
+        with self._lock:
+            now = time.monotonic()
+            cached = self._counters.get(name)
+            if cached is not None and now < cached[1]:
+                self.cache_hits += 1
+                return cached[0]
+            row = self._db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+            value = row[0] if row else 0
+            if self.cache_ttl > 0:
+                self._counters[name] = (value, now + self.cache_ttl)
+            return value
+
+    def _incr(self, db: sqlite3.Connection, name: str, delta: int, minimum: Optional[int]) -> int:
+        row = db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        value = (row[0] if row else 0) + delta
+        if minimum is not None:
+            value = max(minimum, value)
+        db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)", (name, value))
+        # Вызывается внутри транзакции под self._lock - следующее чтение возьмёт новое значение
+        self._counters.pop(name, None)
+        return value
+
+    def incr(self, name: str, delta: int = 1, minimum: Optional[int] = None) -> int:
+        return self._transaction(lambda db: self._incr(db, name, delta, minimum))
+
+    def ordered_add(self, name: str, member: Any, value: Any) -> bool:
+        def operation(db):
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO ordered (name, member, value) VALUES (?, ?, ?)",
+                (name, str(member), json.dumps(value))
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._incr(db, f"{name}.version", 1, None)
+            return True
+        return self._transaction(operation)
+
+    def ordered_remove(self, name: str, member: Any, expected: Any = None) -> bool:
+        def operation(db):
+            if expected is None:
+                cursor = db.execute("DELETE FROM ordered WHERE name = ? AND member = ?", (name, str(member)))
+            else:
+                cursor = db.execute(
+                    "DELETE FROM ordered WHERE name = ? AND member = ? AND value = ?",
+                    (name, str(member), json.dumps(expected))
+                )
+            if cursor.rowcount == 0:
+                return False
+            self._incr(db, f"{name}.version", 1, None)
+            return True
+        return self._transaction(operation)
+
+    def ordered_replace(self, name: str, member: Any, expected: Any, value: Any) -> bool:
+        def operation(db):
+            cursor = db.execute(
+                "UPDATE ordered SET value = ? WHERE name = ? AND member = ? AND value = ?",
+                (json.dumps(value), name, str(member), json.dumps(expected))
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._incr(db, f"{name}.version", 1, None)
+            return True
+        return self._transaction(operation)
+
+    def ordered_items(self, name: str) -> List[Any]:
+        rows = self._read("SELECT value FROM ordered WHERE name = ? ORDER BY seq", (name,))
+        return [json.loads(row[0]) for row in rows]
+
+    def ordered_drop(self, name: str) -> bool:
+        def operation(db):
+            if db.execute("SELECT 1 FROM ordered WHERE name = ? LIMIT 1", (name,)).fetchone():
+                return False
+            db.execute("DELETE FROM counters WHERE name = ?", (f"{name}.version",))
+            self._counters.pop(f"{name}.version", None)
+            return True
+        return self._transaction(operation)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "path": str(self.db_path),
+            "swept": self.swept,
+            "cache_ttl": self.cache_ttl,
+            "cache_hits": self.cache_hits,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisStateStore(StateStore):
+    """
+    Хранилище в Redis (или совместимом сервере)
+
+    Общее для процессов на разных машинах. Составные изменения идут
+    через WATCH/MULTI (оптимистичные транзакции) - Lua-скрипты не нужны,
+    поэтому подходят и упрощённые совместимые серверы.
+    Упорядоченная коллекция - hash значений плюс sorted set порядка.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, prefix: str):
+        self._redis = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._redis.get(self._key(key))
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._redis.set(self._key(key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+        self._redis.delete(self._key(key))
+
+    def pop(self, key: str) -> Optional[Any]:
+        pipe = self._redis.pipeline()  # MULTI/EXEC - чтение и удаление атомарны
+        pipe.get(self._key(key))
+        pipe.delete(self._key(key))
+        value, _ = pipe.execute()
+        return json.loads(value) if value is not None else None
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        self._redis.set(self._key(key), json.dumps(value), nx=True)
+        return self.get(key)
+
+    def counter(self, name: str) -> int:
+        value = self._redis.get(self._key(f"counter:{name}"))
+        return int(value) if value is not None else 0
+
+    def incr(self, name: str, delta: int = 1, minimum: Optional[int] = None) -> int:
+        key = self._key(f"counter:{name}")
+        if minimum is None:
+            return int(self._redis.incrby(key, delta))
+
+        def operation(pipe):
+            current = pipe.get(key)
+            value = max(minimum, (int(current) if current is not None else 0) + delta)
+            pipe.multi()
+            pipe.set(key, value)
+            return value
+        return self._redis.transaction(operation, key, value_from_callable=True)
+
+    def _ordered_keys(self, name: str) -> Tuple[str, str, str]:
+        return (
+            self._key(f"ordered:{name}:values"),
+            self._key(f"ordered:{name}:order"),
+            self._key(f"counter:{name}.version"),
+        )
+
+    def ordered_add(self, name: str, member: Any, value: Any) -> bool:
+        values_key, order_key, version_key = self._ordered_keys(name)
+
+        def operation(pipe):
+            if pipe.hexists(values_key, str(member)):
+                return False
+            position = int(pipe.get(version_key) or 0) + 1
+            pipe.multi()
+            pipe.hset(values_key, str(member), json.dumps(value))
+            pipe.zadd(order_key, {str(member): position})
+            pipe.incr(version_key)
+            return True
+        return self._redis.transaction(operation, values_key, version_key, value_from_callable=True)
+
+    def ordered_remove(self, name: str, member: Any, expected: Any = None) -> bool:
+        values_key, order_key, version_key = self._ordered_keys(name)
+
+        def operation(pipe):
+            current = pipe.hget(values_key, str(member))
+            if current is None:
+                return False
+            if expected is not None and json.loads(current) != json.loads(json.dumps(expected)):
+                return False
+            pipe.multi()
+            pipe.hdel(values_key, str(member))
+            pipe.zrem(order_key, str(member))
+            pipe.incr(version_key)
+            return True
+        return self._redis.transaction(operation, values_key, version_key, value_from_callable=True)
+
+    def ordered_replace(self, name: str, member: Any, expected: Any, value: Any) -> bool:
+        values_key, _, version_key = self._ordered_keys(name)
+
+        def operation(pipe):
+            current = pipe.hget(values_key, str(member))
+            if current is None or json.loads(current) != json.loads(json.dumps(expected)):
+                return False
+            pipe.multi()
+            pipe.hset(values_key, str(member), json.dumps(value))
+            pipe.incr(version_key)
+            return True
+        return self._redis.transaction(operation, values_key, version_key, value_from_callable=True)
+
+    def ordered_items(self, name: str) -> List[Any]:
+        values_key, order_key, _ = self._ordered_keys(name)
+        pipe = self._redis.pipeline()
+        pipe.zrange(order_key, 0, -1)
+        pipe.hgetall(values_key)
+        order, values = pipe.execute()
+        return [json.loads(values[member]) for member in order if member in values]
+
+    def ordered_drop(self, name: str) -> bool:
+        values_key, order_key, version_key = self._ordered_keys(name)
+
+        def operation(pipe):
+            if pipe.hlen(values_key):
+                return False
+            pipe.multi()
+            pipe.delete(order_key, version_key)
+            return True
+        return self._redis.transaction(operation, values_key, version_key, value_from_callable=True)
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "prefix": self.prefix}
+
+    def close(self):
+        self._redis.close()
+
+
+def create_state_store(backend: str) -> StateStore:
+    """
+    Создать хранилище по имени
+
+    Args:
+        backend: "memory", "sqlite" или "redis"
+
+    Returns:
+        StateStore: Хранилище
+    """
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(
+            Path(os.getenv("STATE_DB", "../state.sqlite3")),
+            cache_ttl=float(os.getenv("STATE_CACHE_TTL", "0.5"))
+        )
+    if backend == "redis":
+        if redis is None:
+            raise RuntimeError("STATE_BACKEND=redis requires the redis package (pip install redis)")
+        client = redis.Redis.from_url(os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        return RedisStateStore(client, prefix=os.getenv("STATE_REDIS_PREFIX", "kaiten-inbox:"))
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+
+
+# Singleton instance
+_state_store = None
+
+def get_state_store() -> StateStore:
+    """Получить единственный экземпляр StateStore"""
+    global _state_store
+    if _state_store is None:
+        _state_store = create_state_store(os.getenv("STATE_BACKEND", "memory"))
+        print(f"[STATE] Using {_state_store.backend} state store")
+    return _state_store
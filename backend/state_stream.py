@@ -0,0 +1,167 @@
+"""
+Поток состояния (Server-Sent Events)
+Один общий фоновый обновлятель рассылает AppState подписчикам каждого
+оператора, только когда его состояние изменилось
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+
+class StateBroadcaster:
+    """
+    Рассылка состояния подписчикам /api/state/stream
+
+    - subscribe()/unsubscribe() - подписка на изменения
+    - notify() - немедленно перестроить состояние (после assign/skip/undo)
+    - events() - генератор SSE-сообщений для одного подписчика
+
+    Фоновая задача работает, только пока есть хотя бы один подписчик.
+    Состояние у каждого оператора своё (текущая карточка - его аренда):
+    load_state(known_version, operator) возвращает (версия, состояние) и
+    не строит состояние, если версия не изменилась.
+    Версия состояния используется как id события - по Last-Event-ID
+    переподключившийся клиент не получает повторно то, что уже видел.
+    """
+
+    def __init__(
+        self,
+        load_state: Callable[[Optional[str], Any], Awaitable[Tuple[str, Optional[Any]]]],
+        interval: float,
+        heartbeat: float
+    ):
+        self.load_state = load_state
+        self.interval = interval
+        self.heartbeat = heartbeat
+
+        # Последнее разосланное состояние каждого оператора: оператор -> (версия, JSON)
+        self._latest: Dict[Hashable, Tuple[str, str]] = {}
+
+        self._subscribers: Dict[Hashable, Set[asyncio.Queue]] = {}
+        self._wakeup: Optional[asyncio.Event] = None  # Создаётся внутри event loop
+        self._task: Optional[asyncio.Task] = None
+
+        self.refreshes = 0
+        self.published = 0
+
+    def _count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, operator: Hashable) -> asyncio.Queue:
+        """Добавить подписчика оператора и запустить обновлятель при необходимости"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(operator, set()).add(queue)
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        print(f"[STREAM] Subscribed {operator}, total: {self._count()}")
+        return queue
+
+    def unsubscribe(self, operator: Hashable, queue: asyncio.Queue):
+        """Удалить подписчика"""
+        queues = self._subscribers.get(operator, set())
+        queues.discard(queue)
+        if not queues:
+            self._subscribers.pop(operator, None)
+            self._latest.pop(operator, None)
+        print(f"[STREAM] Unsubscribed {operator}, total: {self._count()}")
+
+    def notify(self):
+        """Попросить обновлятель перестроить состояние прямо сейчас"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @staticmethod
+    def _put_latest(queue: asyncio.Queue, item):
+        """Положить в очередь подписчика, вытеснив непрочитанное старое состояние"""
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(item)
+
+    def _publish(self, operator: Hashable, version: str, payload: str):
+        self._latest[operator] = (version, payload)
+        self.published += 1
+        queues = self._subscribers.get(operator, set())
+        for queue in list(queues):
+            self._put_latest(queue, (version, payload))
+        print(f"[STREAM] Published state {version} to {len(queues)} subscribers of {operator}")
+
+    async def _run(self):
+        """Фоновый цикл: перестроить состояния операторов и разослать изменившиеся"""
+        print(f"[STREAM] Refresher started")
+        while self._subscribers:
+            self._wakeup.clear()
+            for operator in list(self._subscribers):
+                known = self._latest.get(operator)
+                try:
+                    self.refreshes += 1
+                    version, state = await self.load_state(known[0] if known else None, operator)
+                    if state is not None and (known is None or version != known[0]):
+                        self._publish(operator, version, state.json())
+                except Exception as e:
+                    print(f"[STREAM] Failed to refresh state for {operator}: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+        print(f"[STREAM] Refresher stopped (no subscribers)")
+
+    async def events(
+        self,
+        operator: Hashable,
+        last_event_id: Optional[str],
+        is_disconnected: Callable[[], Awaitable[bool]]
+    ) -> AsyncIterator[str]:
+        """
+        SSE-сообщения для одного подписчика
+
+        Args:
+            operator: Оператор (состояние строится для него; ключ подписки)
+            last_event_id: Версия, которую клиент уже получил (при переподключении)
+            is_disconnected: Проверка, что клиент отключился
+
+        Yields:
+            str: Готовые SSE-сообщения (state или heartbeat-комментарий)
+        """
+        queue = self.subscribe(operator)
+        try:
+            # Клиент переподключается через 3 секунды после обрыва
+            yield "retry: 3000\n\n"
+
+            # Сразу отдаём известное состояние, если клиент его ещё не видел
+            known = self._latest.get(operator)
+            if known is not None and known[0] != last_event_id:
+                self._put_latest(queue, known)
+
+            while True:
+                try:
+                    version, payload = await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+
+                if version == last_event_id:
+                    continue
+                last_event_id = version
+                yield f"id: {version}\nevent: state\ndata: {payload}\n\n"
+        finally:
+            self.unsubscribe(operator, queue)
+
+    def stats(self) -> dict:
+        """Статистика рассылки"""
+        return {
+            "subscribers": self._count(),
+            "operators": len(self._subscribers),
+            "refreshes": self.refreshes,
+            "published": self.published,
+        }
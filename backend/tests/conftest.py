@@ -0,0 +1,78 @@
+"""
+Общие настройки тестов backend
+
+Модули backend импортируются как в run.sh (из каталога backend),
+Kaiten и файлы писем в тестах не нужны - задаём заглушечные настройки.
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("KAITEN_BASE_URL", "http://kaiten.test/api/latest")
+os.environ.setdefault("KAITEN_TOKEN", "test")
+os.environ.setdefault("KAITEN_BOARD_ID", "1")
+os.environ.setdefault("KAITEN_COLUMN_QUEUE_ID", "10")
+os.environ.setdefault("KAITEN_COLUMN_ASSIGN_ID", "20")
+os.environ.setdefault("KAITEN_PROPERTY_INCOMING_NO", "id_1")
+os.environ.setdefault("FILES_ROOT", tempfile.mkdtemp(prefix="inbox-files-"))
+os.environ.setdefault("AUTH_USERNAME", "operator")
+os.environ.setdefault("AUTH_PASSWORD", "secret")
+os.environ["STATE_BACKEND"] = "memory"
+
+
+def _backend_modules():
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and Path(path).resolve().parent == BACKEND_DIR:
+            yield name
+
+
+@pytest.fixture
+def api():
+    """
+    Приложение с чистым состоянием и заглушкой Kaiten
+
+    Модули backend импортируются заново: их singleton'ы (хранилище,
+    кэш очереди, аренды, история Undo) не переходят между тестами.
+
+    Returns:
+        SimpleNamespace: client (TestClient), main, fake (FakeKaiten),
+            login(username) - заголовки с токеном новой сессии
+    """
+    from types import SimpleNamespace
+    from fastapi.testclient import TestClient
+    from kaiten_fake import FakeKaiten
+
+    for name in list(_backend_modules()):
+        del sys.modules[name]
+    main = importlib.import_module("main")
+    import auth
+    from kaiten_client import get_kaiten_client
+
+    kaiten = get_kaiten_client()
+    fake = FakeKaiten(
+        httpx.URL(kaiten.base_url).path,
+        queue_column=kaiten.column_queue_id,
+        incoming_property=kaiten.property_incoming_no
+    )
+    kaiten.client = httpx.AsyncClient(
+        base_url=kaiten.client.base_url,
+        headers=kaiten.client.headers,
+        transport=httpx.MockTransport(fake.handler)
+    )
+
+    def login(username=None):
+        token = auth.create_session(username or os.environ["AUTH_USERNAME"])
+        return {"Authorization": f"Bearer {token}"}
+
+    with TestClient(main.app) as client:
+        yield SimpleNamespace(client=client, main=main, fake=fake, login=login)
@@ -0,0 +1,96 @@
+"""
+Заглушка Kaiten API для тестов endpoint'ов
+
+Хранит карточки в памяти и отвечает на запросы, которые делает KaitenClient:
+карточки колонки, карточка, участники, комментарии, перемещение.
+"""
+
+import json
+import re
+from typing import Dict, List, Set, Tuple
+
+import httpx
+
+
+class FakeKaiten:
+    """
+    Карточки в памяти
+
+    - cards - card_id -> карточка (column_id, properties, members, ...)
+    - calls - журнал запросов (метод, путь)
+    - fail_moves - ID карточек, перемещение которых в колонку назначения
+      заканчивается ошибкой 400
+    """
+
+    def __init__(self, base_path: str, queue_column: int, incoming_property: str):
+        self.base_path = base_path.rstrip("/")
+        self.queue_column = queue_column
+        self.incoming_property = incoming_property
+        self.cards: Dict[int, Dict] = {}
+        self.calls: List[Tuple[str, str]] = []
+        self.fail_moves: Set[int] = set()
+
+    def add_card(self, card_id: int, incoming_no: int) -> Dict:
+        """Добавить карточку в колонку очереди"""
+        self.cards[card_id] = {
+            "id": card_id,
+            "title": f"Письмо {incoming_no}",
+            "column_id": self.queue_column,
+            "properties": {self.incoming_property: str(incoming_no)},
+            "members": [],
+            "updated": "2026-01-01T00:00:00Z"
+        }
+        return self.cards[card_id]
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path[len(self.base_path):]
+        method = request.method
+        self.calls.append((method, path))
+        body = json.loads(request.content) if request.content else {}
+
+        if path == "/cards" and method == "GET":
+            params = request.url.params
+            cards = sorted(self.cards.values(), key=lambda card: card["id"])
+            if "column_id" in params:
+                cards = [card for card in cards if str(card["column_id"]) == params["column_id"]]
+            if "updated_after" in params:
+                cards = [card for card in cards if card["updated"] > params["updated_after"]]
+            offset = int(params.get("offset", 0))
+            limit = int(params.get("limit", len(cards)))
+            return httpx.Response(200, json=cards[offset:offset + limit])
+
+        match = re.fullmatch(r"/cards/(\d+)", path)
+        if match:
+            card = self.cards.get(int(match.group(1)))
+            if card is None:
+                return httpx.Response(404)
+            if method == "PATCH":
+                if card["id"] in self.fail_moves and body.get("column_id", self.queue_column) != self.queue_column:
+                    return httpx.Response(400, json={"message": "move rejected"})
+                card.update(body)
+            return httpx.Response(200, json=card)
+
+        match = re.fullmatch(r"/cards/(\d+)/members(?:/(\d+))?", path)
+        if match:
+            card = self.cards[int(match.group(1))]
+            if method == "POST":
+                user_id = body["user_id"]
+                if not any(member["user_id"] == user_id for member in card["members"]):
+                    card["members"].append({"user_id": user_id, "type": 1})
+                return httpx.Response(200, json={})
+            user_id = int(match.group(2))
+            if method == "DELETE":
+                card["members"] = [member for member in card["members"] if member["user_id"] != user_id]
+                return httpx.Response(200, json={})
+            if method == "PATCH":
+                for member in card["members"]:
+                    if member["user_id"] == user_id:
+                        member["type"] = body["type"]
+                return httpx.Response(200, json={})
+
+        match = re.fullmatch(r"/cards/(\d+)/comments", path)
+        if match and method == "POST":
+            self.cards[int(match.group(1))].setdefault("comments", []).append(body["text"])
+            return httpx.Response(200, json={})
+
+        return httpx.Response(404)
@@ -0,0 +1,41 @@
+"""Тесты пакетного назначения и его отмены"""
+
+
+def test_undo_of_partially_failed_batch_keeps_assigned_count(api):
+    for card_id, incoming_no in [(1, 101), (2, 102), (3, 103)]:
+        api.fake.add_card(card_id, incoming_no)
+    headers = api.login()
+
+    response = api.client.post("/api/assign", headers=headers, json={"card_id": 1, "owner_id": 7, "co_owner_ids": []})
+    assert response.json()["assigned_session_count"] == 1
+
+    # Участники карточки 3 меняются, а перемещение не проходит
+    api.fake.fail_moves.add(3)
+    response = api.client.post("/api/assign/batch", headers=headers, json={"items": [
+        {"card_id": 2, "owner_id": 7, "co_owner_ids": []},
+        {"card_id": 3, "owner_id": 7, "co_owner_ids": []},
+    ]}).json()
+    assert [result["ok"] for result in response["results"]] == [True, False]
+    assert response["state"]["assigned_session_count"] == 2
+    assert api.fake.cards[3]["members"] == [{"user_id": 7, "type": 2}]
+
+    # Undo откатывает обе карточки, но вычитает только назначенную
+    state = api.client.post("/api/undo", headers=headers).json()
+    assert state["assigned_session_count"] == 1
+    assert api.fake.cards[3]["members"] == []
+    assert api.fake.cards[2]["column_id"] == api.fake.queue_column
+
+
+def test_undo_of_failed_single_assignment_keeps_assigned_count(api):
+    for card_id, incoming_no in [(1, 101), (2, 102)]:
+        api.fake.add_card(card_id, incoming_no)
+    headers = api.login()
+
+    api.client.post("/api/assign", headers=headers, json={"card_id": 1, "owner_id": 7, "co_owner_ids": []})
+    api.fake.fail_moves.add(2)
+    response = api.client.post("/api/assign", headers=headers, json={"card_id": 2, "owner_id": 7, "co_owner_ids": []})
+    assert response.status_code == 500
+
+    state = api.client.post("/api/undo", headers=headers).json()
+    assert state["assigned_session_count"] == 1
+    assert api.fake.cards[2]["members"] == []
@@ -0,0 +1,183 @@
+"""
+Тесты отложенных карточек: выбор следующей карточки совпадает с прежним
+линейным алгоритмом (проход по всей очереди и списку deferred)
+"""
+
+import random
+from typing import Dict, List, Optional, Set
+
+from deferred_parties import DeferredParties
+from queue_index import QueueIndex
+from state_store import MemoryStateStore
+
+
+class LinearModel:
+    """
+    Прежний алгоритм: список deferred + множество deferred_set и проход по
+    отсортированной очереди. Повторный пропуск уже отложенной карточки не
+    добавляет вторую запись - как и в DeferredParties.
+    """
+
+    def __init__(self):
+        self.queue: Dict[int, int] = {}  # card_id -> incoming_no
+        self.deferred: List[Dict] = []
+        self.deferred_set: Set[int] = set()
+
+    def select(self) -> Optional[int]:
+        cards = sorted(self.queue.items(), key=lambda item: (item[1], item[0]))
+        if not self.deferred:
+            return cards[0][0] if cards else None
+        party_end = self.deferred[0]["party_end"]
+        for card_id, incoming_no in cards:
+            if card_id in self.deferred_set:
+                continue
+            if incoming_no <= party_end:
+                return card_id
+        return self.deferred[0]["card_id"]
+
+    def skip(self, card_id: int):
+        if card_id not in self.deferred_set:
+            self.deferred.append({
+                "card_id": card_id,
+                "incoming_no": self.queue[card_id],
+                "party_end": max(self.queue.values())
+            })
+        self.deferred_set.add(card_id)
+
+    def undo_skip(self, card_id: int):
+        self.deferred = [entry for entry in self.deferred if entry["card_id"] != card_id]
+        self.deferred_set.discard(card_id)
+
+
+class IndexedModel:
+    """Новый алгоритм: QueueIndex со скрытием + DeferredParties"""
+
+    def __init__(self):
+        self.index = QueueIndex()
+        self.deferred = DeferredParties(MemoryStateStore(), on_change=self._on_change)
+
+    def _on_change(self, added: List[int], removed: List[int]):
+        for card_id in added:
+            self.index.hide(card_id)
+        for card_id in removed:
+            self.index.unhide(card_id)
+
+    def select(self) -> Optional[int]:
+        first = next(self.deferred.candidates(self.index), None)
+        return first[0] if first else None
+
+    def skip(self, card_id: int):
+        self.deferred.add({
+            "card_id": card_id,
+            "incoming_no": self.index.get(card_id)["_incoming_no"],
+            "party_end": self.index.last()["_incoming_no"]
+        })
+
+    def undo_skip(self, card_id: int):
+        self.deferred.discard(card_id)
+
+
+def run_scenario(seed: int, steps: int = 300):
+    rng = random.Random(seed)
+    linear = LinearModel()
+    indexed = IndexedModel()
+    next_no = 1000
+    next_id = 1
+
+    def arrive(incoming_no: int):
+        nonlocal next_id
+        card_id = next_id
+        next_id += 1
+        linear.queue[card_id] = incoming_no
+        indexed.index.upsert({"id": card_id, "title": "Письмо", "_incoming_no": incoming_no})
+
+    for _ in range(rng.randrange(1, 15)):
+        arrive(next_no)
+        next_no += 1
+
+    for step in range(steps):
+        current = linear.select()
+        assert indexed.select() == current, f"seed={seed} step={step}"
+
+        operation = rng.random()
+        if operation < 0.3 and current is not None and current in linear.queue:
+            # Оператор пропускает текущую карточку
+            linear.skip(current)
+            indexed.skip(current)
+        elif operation < 0.5 and current is not None:
+            # Оператор назначает текущую карточку - она уходит из очереди
+            linear.queue.pop(current, None)
+            linear.undo_skip(current)
+            indexed.index.remove(current)
+            indexed.deferred.discard(current)
+        elif operation < 0.65:
+            # Новое письмо (иногда с номером меньше уже пришедших)
+            arrive(next_no if rng.random() < 0.8 else rng.randrange(900, next_no))
+            next_no += 1
+        elif operation < 0.75 and linear.queue:
+            # Карточку забрали из очереди в самом Kaiten
+            card_id = rng.choice(sorted(linear.queue))
+            linear.queue.pop(card_id)
+            indexed.index.remove(card_id)
+        elif operation < 0.85 and linear.deferred:
+            # Undo пропуска
+            card_id = rng.choice(linear.deferred)["card_id"]
+            linear.undo_skip(card_id)
+            indexed.undo_skip(card_id)
+
+        assert len(indexed.deferred) == len(linear.deferred)
+        assert indexed.deferred.party_end == (linear.deferred[0]["party_end"] if linear.deferred else None)
+
+
+def test_selection_matches_linear_algorithm():
+    for seed in range(200):
+        run_scenario(seed)
+
+
+def test_candidates_order():
+    model = IndexedModel()
+    for card_id, incoming_no in [(1, 10), (2, 11), (3, 12)]:
+        model.index.upsert({"id": card_id, "title": "Письмо", "_incoming_no": incoming_no})
+    model.skip(1)  # party_end = 12
+    model.index.upsert({"id": 4, "title": "Письмо", "_incoming_no": 13})
+
+    assert [card_id for card_id, _, _ in model.deferred.candidates(model.index)] == [2, 3, 1, 4]
+    # Отложенные карточки отдаются без данных из индекса
+    assert [card for card_id, _, card in model.deferred.candidates(model.index) if card_id == 1] == [None]
+
+
+def test_get_and_repeated_skip_keeps_place():
+    model = IndexedModel()
+    for card_id in (1, 2):
+        model.index.upsert({"id": card_id, "title": "Письмо", "_incoming_no": card_id})
+    model.skip(1)
+    model.skip(2)
+    model.skip(1)
+
+    assert [entry["card_id"] for entry in model.deferred] == [1, 2]
+    assert model.deferred.get(2)["incoming_no"] == 2
+    assert model.deferred.get(3) is None
+
+
+def test_first_candidate_does_not_scan_newer_cards():
+    model = IndexedModel()
+    model.index.upsert({"id": 1, "title": "Письмо", "_incoming_no": 1})
+    model.skip(1)  # party_end = 1
+    model.index.replace_all(
+        [model.index.get(1)] + [{"id": i, "title": "Письмо", "_incoming_no": i} for i in range(2, 50_000)]
+    )
+
+    reads = []
+
+    class CountingCards(dict):
+        def __getitem__(self, card_id):
+            reads.append(card_id)
+            return super().__getitem__(card_id)
+
+    model.index._cards = CountingCards(model.index._cards)
+    candidates = model.deferred.candidates(model.index)
+
+    assert next(candidates)[0] == 1
+    assert reads == []
+    assert next(candidates)[0] == 2
+    assert reads == [2]
@@ -0,0 +1,95 @@
+"""Тесты ссылок на файлы письма в FileInfo"""
+
+import asyncio
+from urllib.parse import unquote, urlsplit
+
+import main
+
+
+def file_info(name, ext):
+    return main.to_file_infos(1001, [{"name": name, "ext": ext, "hash": "abc"}])[0]
+
+
+def test_preview_url_quotes_filename():
+    info = file_info("скан #1?.png", "png")
+
+    path = urlsplit(info.preview_url).path
+    assert path == "/previews/1001/" + "%D1%81%D0%BA%D0%B0%D0%BD%20%231%3F.png"
+    assert unquote(path.rsplit("/", 1)[1]) == "скан #1?.png"
+
+
+def test_converted_url_quotes_filename(monkeypatch):
+    # LibreOffice в тестах не нужен - ссылка строится без конвертации
+    monkeypatch.setattr(main.get_converter(), "binary", "soffice")
+    info = file_info("договор 50%#2.docx", "docx")
+
+    path = urlsplit(info.converted_url).path
+    assert path == "/converted/1001/%D0%B4%D0%BE%D0%B3%D0%BE%D0%B2%D0%BE%D1%80%2050%25%232.docx"
+    assert unquote(path.rsplit("/", 1)[1]) == "договор 50%#2.docx"
+
+
+def test_files_are_listed_off_event_loop(monkeypatch):
+    # Хэширование файлов блокирует - list_files не должен вызываться в event loop
+    threads = []
+
+    def list_files(incoming_no):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            threads.append("executor")
+        else:
+            threads.append("event loop")
+        return [{"name": "a.pdf", "ext": "pdf", "hash": "abc"}]
+
+    monkeypatch.setattr(main.get_files_cache(), "list_files", list_files)
+    files = asyncio.run(main.get_files_for_card(1001))
+
+    assert [info.name for info in files] == ["a.pdf"]
+    assert threads == ["executor"]
+
+
+def test_preview_requires_auth(api):
+    folder = api.main.FILES_ROOT / "1001"
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "scan.png").write_bytes(b"not really a png")
+
+    assert api.client.get("/previews/1001/scan.png").status_code == 401
+    assert api.client.get("/previews/1001/scan.png?token=bad").status_code == 401
+    # С действующим токеном проверка проходит (картинка битая - превью нет)
+    assert api.client.get("/previews/1001/scan.png", headers=api.login()).status_code == 404
+
+
+def test_converted_requires_auth(api, monkeypatch):
+    monkeypatch.setattr(api.main.get_converter(), "binary", None)
+    folder = api.main.FILES_ROOT / "1001"
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "contract.docx").write_bytes(b"docx")
+
+    assert api.client.get("/converted/1001/contract.docx").status_code == 401
+    assert api.client.get("/converted/1001/contract.docx?token=bad").status_code == 401
+    # С действующим токеном проверка проходит (LibreOffice в тестах нет)
+    assert api.client.get("/converted/1001/contract.docx", headers=api.login()).status_code == 404
+
+
+def test_files_require_signature_or_token(api):
+    folder = api.main.FILES_ROOT / "1002"
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "letter.txt").write_text("текст письма", encoding="utf-8")
+    info = asyncio.run(api.main.get_files_for_card(1002))[0]
+
+    assert api.client.get("/files/1002/letter.txt").status_code == 401
+    assert api.client.get(info.url.replace("sig=", "sig=x")).status_code == 401
+    assert api.client.get(info.url).status_code == 200
+    assert api.client.get("/files/1002/letter.txt", headers=api.login()).status_code == 200
+
+
+def test_preview_url_is_signed(api):
+    folder = api.main.FILES_ROOT / "1003"
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "scan.png").write_bytes(b"not really a png")
+    info = next(info for info in asyncio.run(api.main.get_files_for_card(1003)) if info.name == "scan.png")
+
+    assert "token=" not in info.preview_url
+    # Подпись принята (картинка битая - превью нет), подделанная - нет
+    assert api.client.get(info.preview_url + "&width=160").status_code == 404
+    assert api.client.get(info.preview_url.replace("sig=", "sig=x")).status_code == 401
@@ -0,0 +1,70 @@
+"""Тесты очереди заданий: перезапуск процесса и вызовы из пула потоков"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+
+from job_queue import DONE, PENDING, RUNNING, JobQueue
+
+
+def make_queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.sqlite3", max_attempts=2, retry_delay=0.01, keep_finished=10)
+
+
+def test_restart_resets_jobs_of_dead_processes_on_this_host(tmp_path):
+    queue = make_queue(tmp_path)
+    # PID завершившегося процесса - как у backend до перезапуска
+    finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    host = socket.gethostname()
+    workers = {
+        "restarted": f"{host}:{finished.stdout.strip()}",
+        "alive": f"{host}:{os.getppid()}",
+        "other_host": f"{host}-other:{finished.stdout.strip()}",
+    }
+    jobs = {}
+    for name, worker in workers.items():
+        jobs[name] = queue.enqueue("assign", {}, card_id=len(jobs) + 1)
+        queue._execute("UPDATE jobs SET status = ?, worker = ? WHERE id = ?", (RUNNING, worker, jobs[name]))
+
+    assert queue._restart_interrupted() == 1
+    assert queue.get(jobs["restarted"])["status"] == PENDING
+    assert queue.get(jobs["alive"])["status"] == RUNNING
+    assert queue.get(jobs["other_host"])["status"] == RUNNING
+
+
+def test_enqueue_from_thread_pool_wakes_worker(tmp_path):
+    queue = make_queue(tmp_path)
+    handled = []
+
+    async def handler(kind, payload, result):
+        handled.append(payload["n"])
+
+    async def scenario():
+        queue.start(handler)
+        await asyncio.sleep(0.1)  # Обработчик уснул до следующего опроса
+        loop = asyncio.get_event_loop()
+        job_id = await loop.run_in_executor(None, queue.enqueue, "assign", {"n": 1})
+        # Пробуждение и завершение задания - без ожидания POLL_INTERVAL
+        job = await asyncio.wait_for(queue.wait(job_id), 1.0)
+        await queue.close()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job["status"] == DONE
+    assert handled == [1]
+
+
+def test_version_is_shared_between_processes(tmp_path):
+    # Два процесса backend с одной базой заданий
+    first = make_queue(tmp_path)
+    second = make_queue(tmp_path)
+    assert first.version == second.version
+
+    job_id = first.enqueue("assign", {}, card_id=1)
+    assert second.version == first.version
+    version = first.version
+
+    second.cancel(job_id)
+    assert first.version == second.version != version
@@ -0,0 +1,66 @@
+"""Тесты сверки участников карточки (KaitenClient.reconcile_members)"""
+
+import asyncio
+
+from kaiten_client import KaitenClient
+
+
+def run_reconcile(current, desired):
+    """Выполнить сверку и вернуть журнал начала/конца каждой операции"""
+    client = KaitenClient()
+    log = []
+
+    def recorder(name):
+        async def operation(card_id, user_id, *args):
+            log.append(("start", name, user_id))
+            await asyncio.sleep(0.01)
+            log.append(("end", name, user_id))
+            return True
+        return operation
+
+    client.remove_card_member = recorder("remove")
+    client.add_card_member = recorder("add")
+    client.update_member_role = recorder("role")
+
+    assert asyncio.run(client.reconcile_members(1, current, desired))
+    return log
+
+
+def test_old_owner_removed_before_new_owner_promoted():
+    log = run_reconcile(
+        current=[{"user_id": 5, "type": 2}, {"user_id": 8, "type": 1}],
+        desired={8: 2}
+    )
+    assert log.index(("end", "remove", 5)) < log.index(("start", "role", 8))
+
+
+def test_old_owner_removed_before_new_owner_added():
+    log = run_reconcile(
+        current=[{"user_id": 5, "type": 2}],
+        desired={7: 2}
+    )
+    assert log.index(("end", "remove", 5)) < log.index(("start", "add", 7))
+
+
+def test_owner_demoted_before_new_owner_promoted():
+    log = run_reconcile(
+        current=[{"user_id": 5, "type": 2}, {"user_id": 8, "type": 1}],
+        desired={5: 1, 8: 2}
+    )
+    assert log.index(("end", "role", 5)) < log.index(("start", "role", 8))
+
+
+def test_independent_changes_run_in_one_stage():
+    # Удалить участника и добавить другого (без повышения) можно одновременно
+    log = run_reconcile(
+        current=[{"user_id": 5, "type": 2}, {"user_id": 8, "type": 1}],
+        desired={5: 2, 9: 1}
+    )
+    assert log[:2] == [("start", "remove", 8), ("start", "add", 9)]
+
+
+def test_no_requests_when_members_match():
+    assert run_reconcile(
+        current=[{"user_id": 5, "type": 2}],
+        desired={5: 2}
+    ) == []
@@ -0,0 +1,65 @@
+"""Тесты аренды карточек операторами одной учётной записи"""
+
+import asyncio
+
+
+def test_sessions_get_different_cards(api):
+    for card_id, incoming_no in [(1, 101), (2, 102), (3, 103)]:
+        api.fake.add_card(card_id, incoming_no)
+    first = api.login()
+    second = api.login()
+
+    first_card = api.client.get("/api/state", headers=first).json()["current_card"]["card_id"]
+    second_card = api.client.get("/api/state", headers=second).json()["current_card"]["card_id"]
+    assert (first_card, second_card) == (1, 2)
+
+    # Чужую карточку нельзя ни назначить, ни пропустить
+    response = api.client.post("/api/assign", headers=second, json={"card_id": first_card, "owner_id": 7, "co_owner_ids": []})
+    assert response.status_code == 409
+    assert api.client.post("/api/skip", headers=second, json={"card_id": first_card}).status_code == 409
+    assert api.fake.cards[first_card]["members"] == []
+
+    response = api.client.post("/api/assign", headers=first, json={"card_id": first_card, "owner_id": 7, "co_owner_ids": []})
+    assert response.status_code == 200
+    # Следующая свободная карточка - не та, что у второго оператора
+    assert response.json()["current_card"]["card_id"] == 3
+
+    leases = api.client.get("/api/leases", headers=first).json()
+    assert sorted(lease["card_id"] for lease in leases) == [2, 3]
+    assert {lease["username"] for lease in leases} == {"operator"}
+
+
+def test_leases_are_written_off_event_loop(api, monkeypatch):
+    # Хранилище аренд может ждать блокировку SQLite - не в event loop
+    for card_id, incoming_no in [(1, 101), (2, 102), (3, 103), (4, 104)]:
+        api.fake.add_card(card_id, incoming_no)
+    operator = api.login()
+    leases = api.main.get_leases()
+    calls = []
+
+    def recording(name):
+        method = getattr(leases, name)
+
+        def call(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                calls.append((name, "executor"))
+            else:
+                calls.append((name, "event loop"))
+            return method(*args, **kwargs)
+        return call
+
+    for name in ("lease", "release", "acquire"):
+        monkeypatch.setattr(leases, name, recording(name))
+
+    current = api.client.get("/api/state", headers=operator).json()["current_card"]["card_id"]
+    assert api.client.post("/api/skip", headers=operator, json={"card_id": current}).status_code == 200
+    assert api.client.post("/api/undo", headers=operator).status_code == 200
+    response = api.client.post("/api/assign", headers=operator, json={"card_id": current, "owner_id": 7, "co_owner_ids": []})
+    assert response.status_code == 200
+    batch = [{"card_id": 2, "owner_id": 7, "co_owner_ids": []}]
+    assert api.client.post("/api/assign/batch", headers=operator, json={"items": batch}).status_code == 200
+
+    assert {name for name, _ in calls} == {"lease", "release", "acquire"}
+    assert {place for _, place in calls} == {"executor"}
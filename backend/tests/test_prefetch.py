@@ -0,0 +1,55 @@
+"""Тесты фонового прогрева: прогретые подсказки меняют версию"""
+
+import asyncio
+
+from files_cache import FilesCache
+from prefetch import Prefetcher
+
+
+def make_prefetcher(files_root, notified):
+    return Prefetcher(
+        FilesCache(files_root, max_size=16),
+        count=2,
+        read_bytes=0,
+        on_warmed=lambda: notified.append(True)
+    )
+
+
+def warm(prefetcher, incoming_nos):
+    async def run():
+        prefetcher.schedule(incoming_nos)
+        await prefetcher._task
+    asyncio.run(run())
+
+
+def test_version_changes_when_listing_is_warmed(tmp_path):
+    (tmp_path / "1001").mkdir()
+    (tmp_path / "1001" / "letter.txt").write_text("текст письма")
+    notified = []
+    prefetcher = make_prefetcher(tmp_path, notified)
+    cold = prefetcher.version([1001, 1002])
+
+    # Папки 1002 нет - подсказки для неё не будет
+    warm(prefetcher, [1001, 1002])
+    warmed = prefetcher.version([1001, 1002])
+    assert warmed != cold
+    assert notified == [True]
+    assert prefetcher.files_cache.peek(1001)[0]["name"] == "letter.txt"
+
+    # Уже прогретое письмо не меняет версию
+    warm(prefetcher, [1001])
+    assert prefetcher.version([1001, 1002]) == warmed
+    assert notified == [True]
+
+
+def test_version_is_the_same_in_other_processes(tmp_path):
+    # Разные процессы backend прогревают одну и ту же папку в свои FilesCache
+    (tmp_path / "1001").mkdir()
+    (tmp_path / "1001" / "letter.txt").write_text("текст письма")
+    first = make_prefetcher(tmp_path, [])
+    second = make_prefetcher(tmp_path, [])
+
+    warm(first, [1001])
+    assert first.version([1001]) != second.version([1001])
+    warm(second, [1001])
+    assert first.version([1001]) == second.version([1001])
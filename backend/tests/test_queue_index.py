@@ -0,0 +1,103 @@
+"""Тесты индекса очереди: сравнение со списком, отсортированным заново"""
+
+import random
+
+from queue_index import QueueIndex
+
+
+def card(card_id, incoming_no, title="Письмо"):
+    return {"id": card_id, "title": title, "_incoming_no": incoming_no}
+
+
+def expected_order(cards, hidden=()):
+    ordered = sorted(cards.values(), key=lambda c: (c["_incoming_no"], c["id"]))
+    return [c["id"] for c in ordered if c["id"] not in hidden]
+
+
+def test_random_operations_match_sorted_list():
+    rng = random.Random(20240501)
+    index = QueueIndex()
+    cards = {}
+    hidden = set()
+
+    for _ in range(3000):
+        card_id = rng.randrange(60)
+        operation = rng.random()
+        if operation < 0.45:
+            cards[card_id] = card(card_id, rng.randrange(40), rng.choice("ab"))
+            index.upsert(cards[card_id])
+        elif operation < 0.65:
+            cards.pop(card_id, None)
+            index.remove(card_id)
+        elif operation < 0.8:
+            hidden.add(card_id)
+            index.hide(card_id)
+        elif operation < 0.95:
+            hidden.discard(card_id)
+            index.unhide(card_id)
+        else:
+            snapshot = [card(i, rng.randrange(40)) for i in rng.sample(range(60), rng.randrange(30))]
+            cards = {c["id"]: c for c in snapshot}
+            index.replace_all(snapshot)
+
+        assert [c["id"] for c in index] == expected_order(cards)
+        assert [c["id"] for c in index.iter_visible()] == expected_order(cards, hidden)
+        visible = expected_order(cards, hidden)
+        after, up_to = sorted(rng.randrange(-1, 41) for _ in range(2))
+        assert [c["id"] for c in index.iter_visible(after=after, up_to=up_to)] == [
+            card_id for card_id in visible if after < cards[card_id]["_incoming_no"] <= up_to
+        ]
+        first = index.first_visible()
+        assert (first["id"] if first else None) == (visible[0] if visible else None)
+
+
+def test_replace_all_into_empty_index_keeps_hidden_cards_hidden():
+    index = QueueIndex()
+    index.hide(2)
+    index.replace_all([card(1, 5), card(2, 3), card(3, 4)])
+
+    assert [c["id"] for c in index] == [2, 3, 1]
+    assert [c["id"] for c in index.iter_visible()] == [3, 1]
+    assert index.first()["id"] == 2 and index.last()["id"] == 1
+
+
+def test_digest_changes_only_on_real_changes():
+    index = QueueIndex()
+    index.upsert(card(1, 5))
+    digest = index.digest
+
+    assert not index.upsert(card(1, 5))
+    index.hide(1)
+    assert index.digest == digest
+
+    assert index.upsert(card(1, 6))
+    assert index.digest != digest
+    assert index.upsert(card(1, 5))
+    assert index.digest == digest
+
+
+def test_digest_depends_only_on_content():
+    # Другой процесс пришёл к той же очереди другим путём - версия та же
+    synced = QueueIndex()
+    synced.replace_all([card(1, 5), card(2, 3), card(3, 4)])
+    edited = QueueIndex()
+    for changed in (card(3, 4), card(4, 7), card(2, 3), card(1, 9), card(1, 5)):
+        edited.upsert(changed)
+    edited.remove(4)
+
+    assert edited.digest == synced.digest
+    assert QueueIndex().digest != synced.digest
+
+
+def test_iter_visible_continues_after_changes():
+    index = QueueIndex()
+    index.replace_all([card(1, 1), card(2, 2), card(3, 3)])
+    cards = index.iter_visible()
+    assert next(cards)["id"] == 1
+
+    # Пока итератор стоит, индекс меняется (как во время запроса к Kaiten)
+    index.remove(2)
+    index.upsert(card(4, 2))
+    index.replace_all([card(3, 3), card(4, 2), card(5, 0)])
+
+    assert [c["id"] for c in cards] == [4, 3]
@@ -0,0 +1,137 @@
+"""
+Тесты хранилища состояния: одинаковое поведение памяти, SQLite и Redis
+
+Redis проверяется на fakeredis - совместимой заглушке в памяти процесса
+(пакет fakeredis из requirements-dev.txt).
+"""
+
+import time
+
+import pytest
+
+from state_store import MemoryStateStore, SQLiteStateStore, RedisStateStore, StateStore
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_store(request, tmp_path):
+    """Фабрика хранилищ: каждый вызов - новый «процесс» с тем же общим хранилищем"""
+    if request.param == "memory":
+        store = MemoryStateStore()
+        yield lambda: store
+    elif request.param == "sqlite":
+        stores = []
+        def make():
+            stores.append(SQLiteStateStore(tmp_path / "state.sqlite3"))
+            return stores[-1]
+        yield make
+        for store in stores:
+            store.close()
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        yield lambda: RedisStateStore(fakeredis.FakeRedis(server=server, decode_responses=True), prefix="test:")
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
+
+
+def test_values_and_ttl(make_store):
+    store = make_store()
+    store.set("session:a", {"username": "operator"})
+    store.set("session:b", {"username": "other"}, ttl=0.05)
+
+    assert make_store().get("session:a") == {"username": "operator"}
+    assert store.get("session:b") == {"username": "other"}
+    time.sleep(0.1)
+    assert store.get("session:b") is None
+
+    assert store.pop("session:a") == {"username": "operator"}
+    assert store.pop("session:a") is None
+    store.set("key", 1)
+    store.delete("key")
+    assert store.get("key") is None
+
+
+def test_setdefault_keeps_first_value(make_store):
+    first, second = make_store(), make_store()
+    assert first.setdefault("secret", "one") == "one"
+    assert second.setdefault("secret", "two") == "one"
+
+
+def test_counters(make_store):
+    store = make_store()
+    assert store.counter("assigned") == 0
+    assert store.incr("assigned") == 1
+    assert make_store().incr("assigned", 5) == 6
+    assert store.incr("assigned", -10, minimum=0) == 0
+    assert store.counter("assigned") == 0
+
+
+def test_ordered_collection(make_store):
+    store, other = make_store(), make_store()
+    version = store.ordered_version("deferred")
+
+    assert store.ordered_add("deferred", 3, {"card_id": 3})
+    assert other.ordered_add("deferred", 1, {"card_id": 1})
+    assert not store.ordered_add("deferred", 3, {"card_id": 3, "again": True})
+    assert [item["card_id"] for item in other.ordered_items("deferred")] == [3, 1]
+    assert store.ordered_version("deferred") == version + 2
+
+    # Повторное добавление после удаления - в конец
+    assert store.ordered_remove("deferred", 3)
+    assert not store.ordered_remove("deferred", 3)
+    assert store.ordered_add("deferred", 3, {"card_id": 3})
+    assert [item["card_id"] for item in store.ordered_items("deferred")] == [1, 3]
+
+
+def test_compare_and_swap(make_store):
+    first, second = make_store(), make_store()
+    lease = {"card_id": 1, "username": "a", "expires_at": 100.0}
+    first.ordered_add("leases", 1, lease)
+
+    taken = {**lease, "username": "b"}
+    assert second.ordered_replace("leases", 1, lease, taken)
+    # Вторая замена по устаревшему значению не проходит
+    assert not first.ordered_replace("leases", 1, lease, {**lease, "username": "c"})
+    assert not first.ordered_remove("leases", 1, expected=lease)
+    assert first.ordered_items("leases") == [taken]
+    assert first.ordered_remove("leases", 1, expected=taken)
+    assert first.ordered_items("leases") == []
+
+
+def test_sqlite_counter_cache(tmp_path):
+    reader = SQLiteStateStore(tmp_path / "state.sqlite3", cache_ttl=0.1)
+    writer = SQLiteStateStore(tmp_path / "state.sqlite3")
+    try:
+        assert reader.counter("queue.changes") == 0
+        writer.incr("queue.changes")
+        # Изменение другого процесса видно после cache_ttl
+        assert reader.counter("queue.changes") == 0
+        time.sleep(0.15)
+        assert reader.counter("queue.changes") == 1
+
+        # Своё изменение видно сразу
+        reader.ordered_add("deferred", 1, {"card_id": 1})
+        assert reader.ordered_version("deferred") == 1
+        writer.ordered_add("deferred", 2, {"card_id": 2})
+        assert reader.ordered_version("deferred") == 1
+        assert reader.incr("queue.changes") == 2
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_ordered_drop_removes_only_empty_collection(make_store):
+    store, other = make_store(), make_store()
+    store.ordered_add("undo:a", 1, {"id": 1})
+
+    assert not other.ordered_drop("undo:a")
+    assert store.ordered_items("undo:a") == [{"id": 1}]
+
+    assert store.ordered_remove("undo:a", 1)
+    assert other.ordered_drop("undo:a")
+    assert store.ordered_version("undo:a") == 0
+    assert store.ordered_add("undo:a", 2, {"id": 2})
+    assert other.ordered_items("undo:a") == [{"id": 2}]
@@ -0,0 +1,58 @@
+"""Тесты истории Undo у нескольких операторов одной учётной записи"""
+
+from state_store import MemoryStateStore
+from undo_history import UndoHistory
+
+
+def test_undo_is_per_session(api):
+    for card_id, incoming_no in [(1, 101), (2, 102)]:
+        api.fake.add_card(card_id, incoming_no)
+    first = api.login()
+    second = api.login()
+
+    response = api.client.post("/api/assign", headers=first, json={"card_id": 1, "owner_id": 7, "co_owner_ids": []})
+    assert response.status_code == 200
+
+    # Второй оператор ничего не делал - отменять ему нечего
+    response = api.client.post("/api/undo", headers=second)
+    assert response.status_code == 400
+    assert api.fake.cards[1]["column_id"] != api.fake.queue_column
+    assert api.fake.cards[1]["members"] == [{"user_id": 7, "type": 2}]
+
+    state = api.client.post("/api/undo", headers=first).json()
+    assert state["assigned_session_count"] == 0
+    assert api.fake.cards[1]["column_id"] == api.fake.queue_column
+
+
+def test_logout_deletes_session_history(api):
+    api.fake.add_card(1, 101)
+    headers = api.login()
+    api.client.post("/api/assign", headers=headers, json={"card_id": 1, "owner_id": 7, "co_owner_ids": []})
+    history = api.main.get_undo_history()
+    assert history.stats()["entries"] == 1
+
+    api.client.post("/api/logout", headers=headers)
+
+    assert history.stats()["entries"] == 0
+    assert history.stats()["sessions"] == 0
+
+
+def test_sweep_forgets_sessions_without_recent_actions():
+    store = MemoryStateStore()
+    history = UndoHistory(store, max_entries=5, max_age=3600)
+    history.push("gone", {"kind": "skip", "items": [{"card_id": 1, "added": True}]})
+    history.push("gone", {"kind": "skip", "items": [{"card_id": 2, "added": True}]})
+    history.push("active", {"kind": "skip", "items": [{"card_id": 3, "added": True}]})
+
+    # Сессия "gone" больше ничего не делает: её действия устарели
+    for entry in store.ordered_items("undo:gone"):
+        store.ordered_replace("undo:gone", entry["id"], entry, {**entry, "created_at": 0})
+    sessions = store.ordered_items("undo.sessions")
+    store.ordered_replace("undo.sessions", "gone", sessions[0], {**sessions[0], "touched_at": 0})
+
+    assert history.sweep(force=True) == 1
+    assert store.ordered_items("undo:gone") == []
+    assert store.ordered_version("undo:gone") == 0
+    assert history.stats()["entries"] == 1
+    assert history.stats()["sessions"] == 1
+    assert history.pop("active")["items"] == [{"card_id": 3, "added": True}]
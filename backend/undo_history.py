@@ -0,0 +1,215 @@
+"""
+История действий для Undo
+Стек последних назначений и пропусков каждой сессии оператора в общем хранилище состояния
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from state_store import StateStore, get_state_store
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Счётчики в хранилище: номер следующей записи и число записей у всех операторов
+SEQUENCE_COUNTER = "undo.sequence"
+ENTRIES_COUNTER = "undo.entries"
+# Сессии с историей в порядке последнего действия: {"session_id", "touched_at"}
+SESSIONS_COLLECTION = "undo.sessions"
+# Как часто (секунды) искать истории сессий, которые больше не действуют
+SWEEP_INTERVAL = 60
+
+
+class UndoHistory:
+    """
+    Ограниченный стек действий для Undo у каждого оператора
+
+    - push() - запомнить действие оператора
+    - pop() - забрать последнее действие (атомарно)
+    - push_back() - вернуть действие, которое не удалось отменить
+    - clear() - удалить историю сессии (logout)
+    - sweep() - удалить истории сессий без действий дольше max_age
+    - stats() - счётчики
+
+    Стек оператора - упорядоченная коллекция undo:<session_id> в хранилище:
+    история привязана к сессии (auth.session_id), а не к учётной записи,
+    под которой может работать несколько операторов.
+    Хранится не больше max_entries действий и не дольше max_age секунд:
+    старые записи вытесняются при каждом push() и pop(). Сессии, которые
+    закончились (истекли или вышли без logout), больше не вызывают push() -
+    их истории удаляет sweep() (не чаще раза в SWEEP_INTERVAL, из push()),
+    так что в хранилище остаются только сессии с действиями за max_age.
+    """
+
+    def __init__(self, store: StateStore, max_entries: int, max_age: float):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+        self._next_sweep = time.time() + SWEEP_INTERVAL
+
+        self.pushed = 0
+        self.popped = 0
+        self.evicted = 0
+        self.swept = 0
+
+    @staticmethod
+    def _name(session_id: str) -> str:
+        return f"undo:{session_id}"
+
+    def _remove(self, session_id: str, entry: Dict[str, Any]) -> bool:
+        if not self.store.ordered_remove(self._name(session_id), entry["id"]):
+            return False  # Запись уже забрал другой запрос
+        self.store.incr(ENTRIES_COUNTER, -1, minimum=0)
+        return True
+
+    def _touch(self, session_id: str):
+        # Переносим сессию в конец списка: он упорядочен по последнему действию
+        self.store.ordered_remove(SESSIONS_COLLECTION, session_id)
+        self.store.ordered_add(SESSIONS_COLLECTION, session_id, {"session_id": session_id, "touched_at": time.time()})
+
+    def _forget(self, session_id: str, expected: Optional[Dict[str, Any]] = None) -> bool:
+        # Убираем сессию из списка (expected - если с тех пор не было действий)
+        # и пустую коллекцию её истории вместе с версией
+        if not self.store.ordered_remove(SESSIONS_COLLECTION, session_id, expected=expected) and expected is not None:
+            return False
+        self.store.ordered_drop(self._name(session_id))
+        return True
+
+    def _evict(self, session_id: str) -> List[Dict[str, Any]]:
+        # Вытесняем записи старше max_age и сверх max_entries (самые старые)
+        entries = self.store.ordered_items(self._name(session_id))
+        oldest_allowed = time.time() - self.max_age
+        keep_from = max(0, len(entries) - self.max_entries)
+        kept = []
+        for position, entry in enumerate(entries):
+            if position < keep_from or entry["created_at"] < oldest_allowed:
+                if self._remove(session_id, entry):
+                    self.evicted += 1
+            else:
+                kept.append(entry)
+        return kept
+
+    def push(self, session_id: str, action: Dict[str, Any]):
+        """
+        Запомнить действие
+
+        Args:
+            session_id: Сессия оператора
+            action: {"kind": "assign" | "skip", "items": [...], "jobs": [...]} (JSON)
+        """
+        entry_id = self.store.incr(SEQUENCE_COUNTER)
+        entry = {**action, "id": entry_id, "created_at": time.time()}
+        self.store.ordered_add(self._name(session_id), entry_id, entry)
+        self.store.incr(ENTRIES_COUNTER)
+        self._touch(session_id)
+        self.pushed += 1
+        self._evict(session_id)
+        self.sweep()
+
+    def pop(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Забрать последнее действие оператора
+
+        Два одновременных Undo (в том числе из разных процессов) не получат
+        одно и то же действие.
+
+        Returns:
+            Optional[Dict]: Действие или None, если отменять нечего
+        """
+        while True:
+            entries = self._evict(session_id)
+            if not entries:
+                return None
+            if self._remove(session_id, entries[-1]):
+                self.popped += 1
+                return entries[-1]
+
+    def push_back(self, session_id: str, entry: Dict[str, Any]):
+        """
+        Вернуть забранное действие (откат не удался) - оно снова станет последним
+
+        Args:
+            session_id: Сессия оператора
+            entry: Запись, полученная из pop() (items можно сократить до неоткатившихся)
+        """
+        self.store.ordered_add(self._name(session_id), entry["id"], entry)
+        self.store.incr(ENTRIES_COUNTER)
+        self._touch(session_id)
+
+    def clear(self, session_id: str) -> int:
+        """
+        Удалить историю сессии (при выходе оператора)
+
+        Returns:
+            int: Сколько действий удалено
+        """
+        removed = 0
+        for entry in self.store.ordered_items(self._name(session_id)):
+            if self._remove(session_id, entry):
+                removed += 1
+        self._forget(session_id)
+        return removed
+
+    def sweep(self, force: bool = False) -> int:
+        """
+        Удалить истории сессий, в которых не было действий дольше max_age
+        (все их записи уже устарели)
+
+        Args:
+            force: Не ждать SWEEP_INTERVAL с прошлой проверки
+
+        Returns:
+            int: Сколько историй удалено
+        """
+        now = time.time()
+        if not force and now < self._next_sweep:
+            return 0
+        self._next_sweep = now + SWEEP_INTERVAL
+
+        oldest_allowed = now - self.max_age
+        forgotten = 0
+        for session in self.store.ordered_items(SESSIONS_COLLECTION):
+            if session["touched_at"] >= oldest_allowed:
+                break  # Дальше - сессии с более поздними действиями
+            if self._evict(session["session_id"]):
+                continue  # Сессия только что добавила действие
+            if self._forget(session["session_id"], expected=session):
+                forgotten += 1
+        self.swept += forgotten
+        return forgotten
+
+    def has_entries(self) -> bool:
+        """Есть ли история хотя бы у одного оператора"""
+        return self.store.counter(ENTRIES_COUNTER) > 0
+
+    def stats(self) -> Dict:
+        """Статистика истории"""
+        return {
+            "entries": self.store.counter(ENTRIES_COUNTER),
+            "max_entries": self.max_entries,
+            "max_age": self.max_age,
+            "pushed": self.pushed,
+            "popped": self.popped,
+            "evicted": self.evicted,
+            "sessions": len(self.store.ordered_items(SESSIONS_COLLECTION)),
+            "swept": self.swept,
+        }
+
+
+# Singleton instance
+_undo_history = None
+
+def get_undo_history() -> UndoHistory:
+    """Получить единственный экземпляр UndoHistory"""
+    global _undo_history
+    if _undo_history is None:
+        _undo_history = UndoHistory(
+            get_state_store(),
+            max_entries=int(os.getenv("UNDO_HISTORY_SIZE", "20")),
+            max_age=float(os.getenv("UNDO_HISTORY_MAX_AGE", "3600"))
+        )
+    return _undo_history
@@ -1,10 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useMemo } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import Stack from './components/Stack';
 import FileTabs from './components/FileTabs';
 import AssigneeButtons from './components/AssigneeButtons';
 import Login from './components/Login';
-import { getState, assignCard, skipCard, undoLastAction, verifyToken, logout } from './services/api';
+import { getState, subscribeState, assignCard, skipCard, undoLastAction, retryJob, dismissJob, verifyToken, logout, getFileUrl } from './services/api';
 import './App.css';
 
 // Импортируем список исполнителей
@@ -59,15 +59,71 @@ function App() {
     
     loadState();
     
-    // Автообновление каждые 5 секунд
-    const interval = setInterval(() => {
-      loadState();
-    }, 5000);
+    // Запасной вариант: автообновление каждые 5 секунд
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) {
+        interval = setInterval(() => {
+          loadState();
+        }, 5000);
+      }
+    };
+    const stopPolling = () => {
+      if (interval) {
+        clearInterval(interval);
+        interval = null;
+      }
+    };
+    
+    // Браузер без EventSource - только polling
+    if (!window.EventSource) {
+      startPolling();
+      return stopPolling;
+    }
+    
+    // Основной режим: backend сам присылает состояние при изменениях
+    const unsubscribe = subscribeState(
+      (data) => {
+        setState(data);
+        setError(null);
+        stopPolling();
+      },
+      () => {
+        // Поток оборвался - пока он переподключается, опрашиваем backend
+        console.warn('[APP] State stream error, falling back to polling');
+        startPolling();
+      }
+    );
     
-    return () => clearInterval(interval);
+    return () => {
+      unsubscribe();
+      stopPolling();
+    };
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [isAuthenticated]);
 
+  // Файлы следующих писем - браузер загружает их заранее, пока оператор
+  // читает текущее (<link rel="prefetch">)
+  const prefetchUrls = useMemo(() => {
+    return (state?.prefetch || []).flatMap((card) =>
+      card.files.map((file) => getFileUrl(file))
+    );
+  }, [state?.prefetch]);
+  const prefetchKey = prefetchUrls.join('\n');
+
+  useEffect(() => {
+    const links = prefetchUrls.map((url) => {
+      const link = document.createElement('link');
+      link.rel = 'prefetch';
+      link.href = url;
+      document.head.appendChild(link);
+      return link;
+    });
+    return () => links.forEach((link) => link.remove());
+    // Пересоздаём ссылки только когда меняется сам список файлов
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [prefetchKey]);
+
   // Обработчик успешного логина
   const handleLoginSuccess = (token, username) => {
     setIsAuthenticated(true);
@@ -134,7 +190,13 @@ function App() {
       console.log('[DEBUG] Assignment successful! Comment was:', commentText ? `"${commentText}"` : 'empty');
     } catch (err) {
       console.error('[ERROR] Failed to assign:', err);
-      setError('Не удалось назначить исполнителя');
+      if (err.status === 409) {
+        // Письмо уже у другого оператора - показываем следующее
+        setError('Это письмо уже обрабатывает другой оператор');
+        setState(await getState());
+      } else {
+        setError('Не удалось назначить исполнителя');
+      }
     } finally {
       setLoading(false);
     }
@@ -151,7 +213,12 @@ function App() {
       setError(null);
     } catch (err) {
       console.error('Failed to skip:', err);
-      setError('Не удалось пропустить письмо');
+      if (err.status === 409) {
+        setError('Это письмо уже обрабатывает другой оператор');
+        setState(await getState());
+      } else {
+        setError('Не удалось пропустить письмо');
+      }
     } finally {
       setLoading(false);
     }
@@ -172,6 +239,22 @@ function App() {
     }
   };
 
+  // Повторить или скрыть назначение, которое не удалось записать в Kaiten
+  const handleJobAction = async (action, jobId) => {
+    try {
+      const newState = await action(jobId);
+      setState(newState);
+      setError(null);
+    } catch (err) {
+      console.error('Failed to update job:', err);
+      setError('Не удалось обработать ошибку назначения');
+      if (err.status === 404 || err.status === 400) {
+        // Задание уже обработано (другим оператором) - показываем актуальный список
+        setState(await getState());
+      }
+    }
+  };
+
   // Обработка выбора исполнителя
   const handleEmployeeSelect = (userIds) => {
     console.log('[DEBUG] handleEmployeeSelect called with:', userIds);
@@ -238,6 +321,20 @@ function App() {
           </button>
         </div>
         {error && <div className="error-message">{error}</div>}
+        {/* Назначения, которые фоновый обработчик не смог записать в Kaiten */}
+        {state?.failed_jobs?.map((job) => (
+          <div key={job.id} className="error-message job-failure">
+            <span>
+              Не удалось назначить карточку {job.card_id}: {job.last_error}
+            </span>
+            <button className="btn btn-sm btn-outline" onClick={() => handleJobAction(retryJob, job.id)}>
+              Повторить
+            </button>
+            <button className="btn btn-sm btn-outline" onClick={() => handleJobAction(dismissJob, job.id)}>
+              ✕
+            </button>
+          </div>
+        ))}
       </header>
 
       {/* Основной контент */}
@@ -1,22 +1,10 @@
 import React, { useState, useEffect } from 'react';
-import { getFileUrl } from '../services/api';
+import { getFileUrl, getPreviewUrl, getConvertedUrl } from '../services/api';
 import './FileTabs.css';
 
 const FileTabs = ({ files, incomingNo, cardId }) => {
   const [activeTab, setActiveTab] = useState(0);
   const [prevCardId, setPrevCardId] = useState(null);
-  const [publicUrl, setPublicUrl] = useState('http://localhost:8000');
-
-  // Получаем публичный URL от backend
-  useEffect(() => {
-    fetch('http://localhost:8000/api/public-url')
-      .then(r => r.json())
-      .then(data => {
-        console.log('[DEBUG] Got public URL:', data.public_url);
-        setPublicUrl(data.public_url);
-      })
-      .catch(err => console.error('[ERROR] Failed to get public URL:', err));
-  }, []);
 
   useEffect(() => {
     if (cardId !== prevCardId) {
@@ -37,7 +25,7 @@ const FileTabs = ({ files, incomingNo, cardId }) => {
 
   const renderFileContent = (file) => {
     const ext = file.ext.toLowerCase();
-    const localUrl = getFileUrl(incomingNo, file.name);
+    const localUrl = getFileUrl(file);
 
     // Изображения - показываем как <img>
     if (['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'svg'].includes(ext)) {
@@ -63,16 +51,11 @@ const FileTabs = ({ files, incomingNo, cardId }) => {
       );
     }
 
-   // DOCX - показываем через Google Docs Viewer
-    if (['docx', 'doc'].includes(ext)) {
-      const filePublicUrl = `${publicUrl}/public-files/${incomingNo}/${encodeURIComponent(file.name)}`;
-      const viewerUrl = `https://docs.google.com/viewer?url=${encodeURIComponent(filePublicUrl)}&embedded=true`;
-      
-      console.log('[DEBUG] DOCX Google viewer URL:', viewerUrl);
-      
+    // Office-документы - PDF-версия, сконвертированная на backend
+    if (file.converted_url) {
       return (
         <iframe
-          src={viewerUrl}
+          src={getConvertedUrl(file.converted_url)}
           title={file.name}
           className="file-viewer-iframe"
         />
@@ -138,9 +121,19 @@ const FileTabs = ({ files, incomingNo, cardId }) => {
             className={`tab ${activeTab === index ? 'active' : ''}`}
             onClick={() => setActiveTab(index)}
           >
-            <span className="tab-icon">
-              {getFileIcon(file.ext)}
-            </span>
+            {/* Превью грузится быстрее самого файла - видно, что внутри */}
+            {file.preview_url ? (
+              <img
+                src={getPreviewUrl(file.preview_url)}
+                alt=""
+                className="tab-thumb"
+                loading="lazy"
+              />
+            ) : (
+              <span className="tab-icon">
+                {getFileIcon(file.ext)}
+              </span>
+            )}
             <span className="tab-name">{file.name}</span>
           </button>
         ))}
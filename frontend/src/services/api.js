@@ -43,16 +43,46 @@ export const getState = async () => {
   return response.json();
 };
 
+// Подписаться на поток состояния (SSE)
+// EventSource сам переподключается и передаёт Last-Event-ID
+// Возвращает функцию отписки
+export const subscribeState = (onState, onError) => {
+  const token = getAuthToken();
+  const source = new EventSource(`${API_URL}/api/state/stream?token=${token}`);
+  
+  source.addEventListener('state', (event) => {
+    onState(JSON.parse(event.data));
+  });
+  
+  source.onerror = (err) => {
+    if (onError) onError(err);
+  };
+  
+  return () => source.close();
+};
+
+// Ошибка запроса с текстом из ответа backend (detail)
+const throwIfFailed = async (response) => {
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    const error = new Error(body.detail || `HTTP ${response.status}`);
+    error.status = response.status;
+    throw error;
+  }
+};
+
 // Назначить исполнителя
+// 409 - карточку обрабатывает другой оператор (она у него в аренде)
 export const assignCard = async (data) => {
   const response = await fetchWithAuth(`${API_URL}/api/assign`, {
     method: 'POST',
     body: JSON.stringify(data),
   });
+  await throwIfFailed(response);
   return response.json();
 };
 
-// Пропустить карточку
+// Пропустить карточку (409 - карточка у другого оператора)
 export const skipCard = async (cardId) => {
   const response = await fetchWithAuth(`${API_URL}/api/skip`, {
     method: 'POST',
@@ -60,6 +90,7 @@ export const skipCard = async (cardId) => {
       card_id: cardId,
     }),
   });
+  await throwIfFailed(response);
   return response.json();
 };
 
@@ -71,11 +102,38 @@ export const undoLastAction = async () => {
   return response.json();
 };
 
-// Получить URL файла
-export const getFileUrl = (incomingNo, filename) => {
-  const token = getAuthToken();
-  // Добавляем токен в URL
-  return `${API_URL}/files/${incomingNo}/${filename}?token=${token}`;
+// Повторить назначение, которое не удалось записать в Kaiten
+export const retryJob = async (jobId) => {
+  const response = await fetchWithAuth(`${API_URL}/api/jobs/${jobId}/retry`, {
+    method: 'POST',
+  });
+  await throwIfFailed(response);
+  return response.json();
+};
+
+// Скрыть уведомление о неудавшемся назначении
+export const dismissJob = async (jobId) => {
+  const response = await fetchWithAuth(`${API_URL}/api/jobs/${jobId}/dismiss`, {
+    method: 'POST',
+  });
+  await throwIfFailed(response);
+  return response.json();
+};
+
+// Получить URL файла (url из FileInfo - подписанная ссылка, токен не нужен,
+// поэтому ссылка не меняется после нового входа и браузер берёт файл из кэша)
+export const getFileUrl = (file) => {
+  return `${API_URL}${file.url}`;
+};
+
+// Получить URL превью файла (preview_url из FileInfo - подписанная ссылка)
+export const getPreviewUrl = (previewUrl, width = 160) => {
+  return `${API_URL}${previewUrl}&width=${width}`;
+};
+
+// Получить URL PDF-версии Office-документа (converted_url из FileInfo - подписанная ссылка)
+export const getConvertedUrl = (convertedUrl) => {
+  return `${API_URL}${convertedUrl}`;
 };
 
 // Проверить токен